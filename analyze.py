@@ -0,0 +1,265 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+from board import Board, move_to_uci
+from pgn import read_games
+
+#batch game annotation, every position of every game in a pgn file is searched by a pool of worker processes
+#(each with its own Engine and transposition table) and written to a jsonl file in game and ply order:
+#   {"game": 0, "offset": 0, "ply": 12, "fen": ..., "move": "Nxe5", "score": -35, "mate": null,
+#    "best": "d4", "depth": 6, "loss": 240, "mistake": true, "blunder": false}
+#score is in centipawns for the side to move, loss is what the played move gave away by the next position's
+#score and the first record of a game also carries its tags
+#the reader blocks on a bounded task queue and never runs more than --window positions ahead of the writer,
+#so memory stays flat however big the pgn is, --resume picks up after the last record already in the output
+#run with: python3 analyze.py games.pgn --out games.jsonl --depth 6 --workers 4
+
+_ctx = mp.get_context("spawn")
+
+MISTAKE_CP = 100
+BLUNDER_CP = 300
+#mate scores count as this much when working out the loss of a move
+SCORE_CAP = 2000
+
+
+def _worker(tasks, results, hash_mb: int, limits: Dict[str, int]) -> None:
+    from engine import Engine, MATE_SCORE, MATE_BOUND
+    from movegen import generate_legal_moves, is_in_check
+    from san import move_to_san
+
+    engine = Engine(hash_mb=hash_mb)
+    last = []
+    engine.on_iteration = last.append
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            seq, fen = task
+            board = Board.from_fen(fen)
+            record = {"score": None, "mate": None, "best": None, "depth": 0, "nodes": 0}
+            if not generate_legal_moves(board):
+                #game over, mated or stalemated
+                record["score"] = -MATE_SCORE if is_in_check(board, board.side_to_move) else 0
+                record["mate"] = 0 if record["score"] else None
+            else:
+                last.clear()
+                best = engine.search(board, **limits)
+                record["nodes"] = engine.nodes
+                record["depth"] = engine.completed_depth
+                if best is not None:
+                    record["best"] = move_to_san(board, best.code)
+                if last:
+                    score = last[-1].score
+                    record["score"] = score
+                    if abs(score) >= MATE_BOUND:
+                        plies = MATE_SCORE - abs(score)
+                        record["mate"] = (plies + 1) // 2 if score > 0 else -(plies // 2)
+            results.put((seq, record))
+    finally:
+        engine.close()
+
+
+def _positions(path: str, start_offset: int, skip_plies: int, first_game: int) -> Iterator[Tuple[dict, str]]:
+    #(record so far, fen) for every position of every game from start_offset on, the first game skips
+    #skip_plies positions that are already in the output
+    from san import move_to_san
+    with open(path, "rb") as fh:
+        fh.seek(start_offset)
+        for number, game in enumerate(read_games(fh), first_game):
+            try:
+                board = game.board()
+            except ValueError:
+                continue
+            skip = skip_plies if number == first_game else 0
+            for ply in range(len(game.moves) + 1):
+                move = game.moves[ply] if ply < len(game.moves) else None
+                if ply >= skip:
+                    record = {"game": number, "offset": game.offset, "ply": ply, "fen": board.to_fen(),
+                              "move": move_to_san(board, move) if move is not None else None,
+                              "uci": move_to_uci(move) if move is not None else None}
+                    if ply == 0:
+                        record["tags"] = game.tags
+                        record["result"] = game.result
+                        if game.error:
+                            record["error"] = game.error
+                    yield record, record["fen"]
+                if move is not None:
+                    board.make_move(move)
+
+
+def _resume_point(out_path: str) -> Tuple[int, int, int]:
+    #(input offset, plies to skip in that game, game number) after the last complete record in the output
+    #a half written last line from a crash is cut off
+    if not os.path.exists(out_path):
+        return 0, 0, 0
+    last = None
+    good = 0
+    with open(out_path, "rb") as fh:
+        while True:
+            line = fh.readline()
+            if not line.endswith(b"\n"):
+                break
+            last = line
+            good = fh.tell()
+    with open(out_path, "r+b") as fh:
+        fh.truncate(good)
+    if last is None:
+        return 0, 0, 0
+    record = json.loads(last)
+    #a finished game skips past its last ply, so _positions yields nothing for it and goes on to the next
+    return record["offset"], record["ply"] + 1, record["game"]
+
+
+def _check_workers(procs) -> None:
+    if not all(p.is_alive() for p in procs):
+        raise RuntimeError("an analysis worker died, run again with --resume to carry on")
+
+
+def _put(tasks, task, procs) -> None:
+    #blocks while the queue is full, but not forever if the workers that empty it are gone
+    while True:
+        try:
+            tasks.put(task, timeout=1)
+            return
+        except queue.Full:
+            _check_workers(procs)
+
+
+def _get(results, procs) -> Tuple[int, dict]:
+    while True:
+        try:
+            return results.get(timeout=1)
+        except queue.Empty:
+            _check_workers(procs)
+
+
+def _loss(before: Optional[int], after: Optional[int]) -> Optional[int]:
+    #centipawns the mover lost, before is the mover's score and after the opponent's score next ply
+    if before is None or after is None:
+        return None
+    cap = lambda s: max(-SCORE_CAP, min(SCORE_CAP, s))
+    return max(0, cap(before) + cap(after))
+
+
+def analyze(
+    path: str,
+    out_path: str,
+    workers: int = 1,
+    limits: Optional[Dict[str, int]] = None,
+    hash_mb: int = 16,
+    window: int = 0,
+    resume: bool = False,
+    verbose: bool = True,
+) -> dict:
+    limits = limits or {"depth": 6}
+    window = window or 8 * workers
+    start_offset, skip, first_game = _resume_point(out_path) if resume else (0, 0, 0)
+    tasks = _ctx.Queue(maxsize=2 * workers)
+    results = _ctx.Queue()
+    procs = [_ctx.Process(target=_worker, args=(tasks, results, hash_mb, limits), daemon=True)
+             for _ in range(workers)]
+    for p in procs:
+        p.start()
+
+    pending: Dict[int, dict] = {} #finished by a worker, waiting for the writer
+    records: Dict[int, dict] = {} #sent out, waiting for a worker
+    held: Optional[dict] = None #written once the next position's score gives its loss
+    positions = 0
+    start = time.perf_counter()
+    out = open(out_path, "a" if resume else "w")
+
+    def emit(record: dict) -> None:
+        out.write(json.dumps(record) + "\n")
+
+    def finish(seq: int, result: dict) -> None:
+        #results come back in any order, records go out strictly in sequence
+        nonlocal held, next_write
+        pending[seq] = result
+        while next_write in pending:
+            record = records.pop(next_write)
+            record.update(pending.pop(next_write))
+            next_write += 1
+            if held is not None:
+                if held["game"] == record["game"] and held["ply"] + 1 == record["ply"]:
+                    loss = _loss(held["score"], record["score"])
+                    held["loss"] = loss
+                    held["mistake"] = loss is not None and loss >= MISTAKE_CP
+                    held["blunder"] = loss is not None and loss >= BLUNDER_CP
+                emit(held)
+                held = None
+            if record["move"] is not None:
+                held = record
+            else:
+                emit(record)
+        out.flush()
+
+    next_write = 0
+    try:
+        for seq, (record, fen) in enumerate(_positions(path, start_offset, skip, first_game)):
+            #backpressure, never more than window positions between the reader and the writer
+            while seq - next_write >= window:
+                finish(*_get(results, procs))
+            records[seq] = record
+            _put(tasks, (seq, fen), procs)
+            positions += 1
+            while True:
+                try:
+                    finish(*results.get_nowait())
+                except queue.Empty:
+                    break
+            if verbose and positions % 100 == 0:
+                elapsed = time.perf_counter() - start
+                print(f"{positions} positions, {positions / elapsed:.1f}/s", file=sys.stderr, flush=True)
+        while next_write < positions:
+            finish(*_get(results, procs))
+        if held is not None:
+            emit(held)
+            held = None
+    finally:
+        out.close()
+        for _ in procs:
+            try:
+                tasks.put(None, timeout=1)
+            except queue.Full:
+                break #workers are gone or stuck, they get terminated below
+        for p in procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+
+    elapsed = time.perf_counter() - start
+    summary = {"positions": positions, "seconds": round(elapsed, 3),
+               "positions_per_second": positions / elapsed if elapsed else 0.0}
+    if verbose:
+        print(f"{positions} positions in {elapsed:.2f}s, {summary['positions_per_second']:.2f} positions/s "
+              f"with {workers} workers")
+    return summary
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="annotate every position of a pgn file with engine evaluations")
+    parser.add_argument("pgn")
+    parser.add_argument("--out", required=True, help="jsonl output")
+    parser.add_argument("--workers", type=int, default=max(1, mp.cpu_count()))
+    parser.add_argument("--depth", type=int)
+    parser.add_argument("--nodes", type=int)
+    parser.add_argument("--movetime", type=int, help="ms per position")
+    parser.add_argument("--hash", type=int, default=16, help="transposition table size in MB for each worker")
+    parser.add_argument("--window", type=int, default=0, help="positions in flight at most (default 8 per worker)")
+    parser.add_argument("--resume", action="store_true", help="carry on after the last record in --out")
+    args = parser.parse_args()
+    limits = {k: v for k, v in (("depth", args.depth), ("nodes", args.nodes), ("movetime", args.movetime))
+              if v is not None}
+    analyze(args.pgn, args.out, args.workers, limits, args.hash, args.window, args.resume)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
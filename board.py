@@ -1,8 +1,9 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import List, Optional, Tuple
+from typing import List, Optional, Set
 
 from zobrist import Zobrist 
+from pst import PST_MG, PST_EG, PIECE_VALUE, PHASE_WEIGHT
 
 EMPTY = 0
 PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = 1, 2, 3, 4, 5, 6
@@ -20,15 +21,107 @@ def abs_piece(piece: int) -> int:
 
 @dataclass(frozen=True)
 class Move:
+    #readable view of a move for the ui and tools, the board, move generation and search all work on
+    #the 16 bit codes from encode_move, decode_move turns a code back into a (cached) Move
     from_sq: int
     to_sq: int
     promo: int = 0 #0 is none, else piece type queen rook bishop knight
     is_ep: bool = False
     is_castle: bool = False
 
+    @property
+    def code(self) -> int:
+        return encode_move(self)
+
+FILES = "abcdefgh"
+PROMO_LETTERS = {KNIGHT: "n", BISHOP: "b", ROOK: "r", QUEEN: "q"}
+FEN_PIECES = {"p": PAWN, "n": KNIGHT, "b": BISHOP, "r": ROOK, "q": QUEEN, "k": KING}
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+def square_name(sq: int) -> str:
+    #0 is a8 and 63 is h1
+    return FILES[sq & 7] + str(8 - (sq >> 3))
+
+def parse_square(name: str) -> int:
+    if len(name) != 2 or name[0] not in FILES or name[1] not in "12345678":
+        raise ValueError(f"bad square {name!r}")
+    return (8 - int(name[1])) * 8 + FILES.index(name[0])
+
+def move_to_uci(move) -> str:
+    #long algebraic like e2e4 or e7e8q, what uci and most tools expect, takes a Move or a move code
+    if type(move) is int:
+        move = decode_move(move)
+        if move is None:
+            return "0000"
+    text = square_name(move.from_sq) + square_name(move.to_sq)
+    if move.promo:
+        text += PROMO_LETTERS[move.promo]
+    return text
+
+#moves packed into 16 bits, this is what the generators return and make_move takes
+#bits 0-5 from square, 6-11 to square, 12-13 promotion piece (knight bishop rook queen), 14-15 kind
+#0 never encodes a real move (a8 to a8) so it doubles as no move and as the null move
+#plain ints compare, hash and sit in the transposition table for free where Move objects had to be built
+MOVE_NORMAL, MOVE_PROMO, MOVE_EP, MOVE_CASTLE = 0, 1, 2, 3
+NO_MOVE = 0
+PROMO_FLAG = MOVE_PROMO << 14
+EP_FLAG = MOVE_EP << 14
+CASTLE_FLAG = MOVE_CASTLE << 14
+
+def make_code(from_sq: int, to_sq: int, kind: int = MOVE_NORMAL, promo: int = 0) -> int:
+    if promo:
+        return from_sq | (to_sq << 6) | ((promo - KNIGHT) << 12) | PROMO_FLAG
+    return from_sq | (to_sq << 6) | (kind << 14)
+
+#accessors, hot loops inline the shifts instead
+def move_from(code: int) -> int:
+    return code & 63
+
+def move_to(code: int) -> int:
+    return (code >> 6) & 63
+
+def move_kind(code: int) -> int:
+    return code >> 14
+
+def move_promo(code: int) -> int:
+    return ((code >> 12) & 3) + KNIGHT if code >> 14 == MOVE_PROMO else 0
+
+_decoded: dict = {}
+
+def encode_move(move: Move) -> int:
+    code = move.from_sq | (move.to_sq << 6)
+    if move.promo:
+        code |= ((move.promo - KNIGHT) << 12) | (MOVE_PROMO << 14)
+    elif move.is_ep:
+        code |= MOVE_EP << 14
+    elif move.is_castle:
+        code |= MOVE_CASTLE << 14
+    return code
+
+def decode_move(code: int) -> Optional[Move]:
+    #decoded moves are cached so probing the table does not build a new Move every time
+    if code == 0:
+        return None
+    move = _decoded.get(code)
+    if move is None:
+        kind = code >> 14
+        move = Move(
+            code & 63,
+            (code >> 6) & 63,
+            promo=((code >> 12) & 3) + KNIGHT if kind == MOVE_PROMO else 0,
+            is_ep=kind == MOVE_EP,
+            is_castle=kind == MOVE_CASTLE,
+        )
+        _decoded[code] = move
+    return move
+
+#undo stack entries per ply, Board keeps these in preallocated parallel lists and only builds Undo
+#records when history is read
+UNDO_STACK_SIZE = 256 #starting size, doubled when a game gets longer
+
 @dataclass
 class Undo:
-    move: Move
+    move: Optional[Move] #None for a null move
     captured: int
     castling_rights: int
     ep_square: int
@@ -45,10 +138,74 @@ class Board:
         self.halfmove_clock: int = 0
         self.fullmove_number: int = 1
 
+        #bitboards mirror squares, bit n is square n so bit 0 is a8 and bit 63 is h1
+        #piece_bb is indexed by piece type 1-6 and holds both colors
+        #color_bb is indexed by the color itself, [1] is white and [-1] (last slot) is black
+        self.piece_bb: List[int] = [0] * 7
+        self.color_bb: List[int] = [0, 0, 0]
+        self.occupied: int = 0
+
+        #occupied squares per color and where each king is, indexed by color like color_bb
+        #lets movegen and eval look at only the 16-32 pieces instead of all 64 squares
+        self.piece_lists: List[Set[int]] = [set(), set(), set()]
+        self.king_squares: List[int] = [-1, -1, -1]
+
+        #running evaluation terms so engine.evaluate does not rescan the board
+        #mg_score / eg_score are material plus pst from whites side, phase is the game phase counter
+        #and material is the non king material of both sides used for the endgame check
+        self.mg_score: int = 0
+        self.eg_score: int = 0
+        self.phase: int = 0
+        self.material: int = 0
+
         self.zobrist = Zobrist()
         self.zobrist_hash: int = 0
 
-        self.history: List[Undo] = []
+        #undo stack, entry i is the state from before the i-th move made on this board
+        #ply is the number of moves made, the lists are reused so make_move allocates nothing
+        self.ply: int = 0
+        self._undo_move: List[int] = [NO_MOVE] * UNDO_STACK_SIZE
+        self._undo_captured: List[int] = [EMPTY] * UNDO_STACK_SIZE
+        self._undo_castling: List[int] = [0] * UNDO_STACK_SIZE
+        self._undo_ep: List[int] = [-1] * UNDO_STACK_SIZE
+        self._undo_halfmove: List[int] = [0] * UNDO_STACK_SIZE
+        self._undo_fullmove: List[int] = [0] * UNDO_STACK_SIZE
+        self._undo_hash: List[int] = [0] * UNDO_STACK_SIZE
+
+    @property
+    def history(self) -> List[Undo]:
+        #the moves made so far as Undo records, built on demand for tools and the ui
+        return [
+            Undo(
+                move=decode_move(self._undo_move[i]),
+                captured=self._undo_captured[i],
+                castling_rights=self._undo_castling[i],
+                ep_square=self._undo_ep[i],
+                halfmove_clock=self._undo_halfmove[i],
+                fullmove_number=self._undo_fullmove[i],
+                zobrist_hash=self._undo_hash[i],
+            )
+            for i in range(self.ply)
+        ]
+
+    def last_move(self) -> int:
+        #code of the move that led here, NO_MOVE at the root of the board or after a null move
+        return self._undo_move[self.ply - 1] if self.ply else NO_MOVE
+
+    def _push_undo(self, move: int, captured: int) -> None:
+        ply = self.ply
+        if ply == len(self._undo_move):
+            for stack in (self._undo_move, self._undo_captured, self._undo_castling, self._undo_ep,
+                          self._undo_halfmove, self._undo_fullmove, self._undo_hash):
+                stack.extend(stack[:ply])
+        self._undo_move[ply] = move
+        self._undo_captured[ply] = captured
+        self._undo_castling[ply] = self.castling_rights
+        self._undo_ep[ply] = self.ep_square
+        self._undo_halfmove[ply] = self.halfmove_clock
+        self._undo_fullmove[ply] = self.fullmove_number
+        self._undo_hash[ply] = self.zobrist_hash
+        self.ply = ply + 1
     
     @staticmethod
     def start_position() -> "Board":
@@ -68,162 +225,335 @@ class Board:
         b.ep_square = -1
         b.halfmove_clock = 0
         b.fullmove_number = 1
+        b.refresh_bitboards()
         b.zobrist_hash = b.zobrist.hash_board(b)
         return b
+
+    @staticmethod
+    def from_fen(fen: str) -> "Board":
+        #builds a board from a FEN string, the move counters are optional
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f"FEN needs at least 4 fields: {fen!r}")
+        placement, stm, castling, ep = fields[:4]
+
+        b = Board()
+        rows = placement.split("/")
+        if len(rows) != 8:
+            raise ValueError(f"FEN placement needs 8 ranks: {placement!r}")
+        for r, row in enumerate(rows):
+            f = 0
+            for ch in row:
+                if ch.isdigit():
+                    f += int(ch)
+                elif ch.lower() in FEN_PIECES and f < 8:
+                    piece = FEN_PIECES[ch.lower()]
+                    b.squares[r * 8 + f] = piece if ch.isupper() else -piece
+                    f += 1
+                else:
+                    raise ValueError(f"bad FEN rank {row!r}")
+            if f != 8:
+                raise ValueError(f"FEN rank does not have 8 files: {row!r}")
+
+        if stm not in ("w", "b"):
+            raise ValueError(f"bad side to move {stm!r}")
+        b.side_to_move = WHITE if stm == "w" else BLACK
+
+        b.castling_rights = 0
+        if castling != "-":
+            for ch in castling:
+                if ch not in "KQkq":
+                    raise ValueError(f"bad castling field {castling!r}")
+                b.castling_rights |= {"K": WK, "Q": WQ, "k": BK, "q": BQ}[ch]
+
+        b.ep_square = -1 if ep == "-" else parse_square(ep)
+        b.halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+        b.fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+
+        b.refresh_bitboards()
+        if b.king_squares[WHITE] < 0 or b.king_squares[BLACK] < 0:
+            raise ValueError("FEN needs a king for each side")
+        b.zobrist_hash = b.zobrist.hash_board(b)
+        return b
+
+    def to_fen(self) -> str:
+        #the position as a FEN string, from_fen(to_fen()) gives the same position back
+        letters = {piece: letter for letter, piece in FEN_PIECES.items()}
+        rows = []
+        for r in range(8):
+            row = ""
+            empty = 0
+            for f in range(8):
+                p = self.squares[r * 8 + f]
+                if p == EMPTY:
+                    empty += 1
+                    continue
+                if empty:
+                    row += str(empty)
+                    empty = 0
+                row += letters[p].upper() if p > 0 else letters[-p]
+            rows.append(row + (str(empty) if empty else ""))
+        castling = "".join(ch for ch, right in (("K", WK), ("Q", WQ), ("k", BK), ("q", BQ))
+                           if self.castling_rights & right) or "-"
+        ep = square_name(self.ep_square) if self.ep_square != -1 else "-"
+        stm = "w" if self.side_to_move == WHITE else "b"
+        return f"{'/'.join(rows)} {stm} {castling} {ep} {self.halfmove_clock} {self.fullmove_number}"
+
+    def refresh_bitboards(self) -> None:
+        #rebuilds every bitboard, piece list and king square from squares, only needed when squares is set directly
+        self.piece_bb = [0] * 7
+        self.color_bb = [0, 0, 0]
+        self.occupied = 0
+        self.piece_lists = [set(), set(), set()]
+        self.king_squares = [-1, -1, -1]
+        self.mg_score = self.eg_score = self.phase = self.material = 0
+        for sq, p in enumerate(self.squares):
+            if p != EMPTY:
+                bit = 1 << sq
+                color = piece_color(p)
+                self.piece_bb[abs_piece(p)] |= bit
+                self.color_bb[color] |= bit
+                self.occupied |= bit
+                self.piece_lists[color].add(sq)
+                if abs_piece(p) == KING:
+                    self.king_squares[color] = sq
+                self.mg_score += PST_MG[p][sq]
+                self.eg_score += PST_EG[p][sq]
+                self.phase += PHASE_WEIGHT[abs_piece(p)]
+                self.material += PIECE_VALUE[abs_piece(p)]
     
     def king_square(self, color: int) -> int:
-        target = KING if color == WHITE else -KING
-        for i, p in enumerate(self.squares):
-            if p == target:
-                return i
-        return
+        sq = self.king_squares[color]
+        if sq < 0:
+            return
+        return sq
+
+    def _put_piece(self, sq: int, piece: int) -> None:
+        #places piece on an empty square and keeps the bitboards in sync
+        bit = 1 << sq
+        self.squares[sq] = piece
+        if piece > 0:
+            pt = piece
+            self.color_bb[WHITE] |= bit
+            self.piece_lists[WHITE].add(sq)
+            if piece == KING:
+                self.king_squares[WHITE] = sq
+        else:
+            pt = -piece
+            self.color_bb[BLACK] |= bit
+            self.piece_lists[BLACK].add(sq)
+            if piece == -KING:
+                self.king_squares[BLACK] = sq
+        self.piece_bb[pt] |= bit
+        self.occupied |= bit
+        self.mg_score += PST_MG[piece][sq]
+        self.eg_score += PST_EG[piece][sq]
+        self.phase += PHASE_WEIGHT[pt]
+        self.material += PIECE_VALUE[pt]
+
+    def _remove_piece(self, sq: int) -> int:
+        #clears square and returns the piece that was on it
+        piece = self.squares[sq]
+        bit = 1 << sq
+        self.squares[sq] = EMPTY
+        if piece > 0:
+            pt = piece
+            self.color_bb[WHITE] ^= bit
+            self.piece_lists[WHITE].discard(sq)
+        else:
+            pt = -piece
+            self.color_bb[BLACK] ^= bit
+            self.piece_lists[BLACK].discard(sq)
+        self.piece_bb[pt] ^= bit
+        self.occupied ^= bit
+        self.mg_score -= PST_MG[piece][sq]
+        self.eg_score -= PST_EG[piece][sq]
+        self.phase -= PHASE_WEIGHT[pt]
+        self.material -= PIECE_VALUE[pt]
+        return piece
     
-    def make_move(self, move: Move) -> None:
+    def make_move(self, move) -> None:
+        #move is a move code, a Move view from the ui is encoded first
+        if type(move) is not int:
+            move = encode_move(move)
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        kind = move >> 14
+        stm = self.side_to_move
+        squares = self.squares
+        zobrist = self.zobrist
+
         #save undo snapshot
-        captured = self._get_captured_piece(move)
-        undo = Undo(
-            move=move, 
-            captured=captured,
-            castling_rights=self.castling_rights,
-            ep_square=self.ep_square,
-            halfmove_clock=self.halfmove_clock,
-            fullmove_number=self.fullmove_number,
-            zobrist_hash=self.zobrist_hash
-        )
-        self.history.append(undo)
+        if kind == MOVE_EP:
+            cap_sq = to_sq + (8 if stm == WHITE else -8)
+        else:
+            cap_sq = to_sq
+        captured = squares[cap_sq]
+        self._push_undo(move, captured)
 
         #zobrist: remove ep, castling, side(we re-add updated) check this
-        self.zobrist_hash ^= self.zobrist.side_key
-        self.zobrist_hash ^= self.zobrist.castle_keys[self.castling_rights]
-        self.zobrist_hash ^= self.zobrist.ep_file_key(self.ep_square)
+        h = self.zobrist_hash ^ zobrist.side_key ^ zobrist.castle_keys[self.castling_rights]
+        if self.ep_square != -1:
+            h ^= zobrist.ep_file_key(self.ep_square)
         
         #clear ep by defult
         self.ep_square = -1 
 
-        moving_piece = self.squares[move.from_sq]
+        moving_piece = squares[from_sq]
 
         #haflmove clock reset on pawn move or capture
-        if abs_piece(moving_piece) == PAWN or captured != EMPTY:
+        if moving_piece == PAWN or moving_piece == -PAWN or captured != EMPTY:
             self.halfmove_clock = 0
         else:
             self.halfmove_clock += 1
 
         #remove moving piece from_sq
-        self.zobrist_hash ^= self.zobrist.piece_keys[move.from_sq] [self.zobrist.piece_index(moving_piece)]
-        self.squares[move.from_sq] = EMPTY
+        piece_keys = zobrist.piece_keys
+        h ^= piece_keys[from_sq][zobrist.piece_index(moving_piece)]
+        self._remove_piece(from_sq)
 
         #handle capture including ep
-        if move.is_ep:
-            cap_sq = move.to_sq + (8 if self.side_to_move == WHITE else -8)
-            cap_piece = self.squares[cap_sq]
-            self.zobrist_hash ^= self.zobrist.piece_keys[cap_sq][self.zobrist.piece_index(cap_piece)]
-            self.squares[cap_sq] = EMPTY
-        elif captured != EMPTY:
-            self.zobrist_hash ^= self.zobrist.piece_keys[move.to_sq][self.zobrist.piece_index(captured)]
+        if captured != EMPTY:
+            h ^= piece_keys[cap_sq][zobrist.piece_index(captured)]
+            self._remove_piece(cap_sq)
 
         #handle castling rook move
-        if move.is_castle:
-            self._do_castle_rook(move)
+        self.zobrist_hash = h
+        if kind == MOVE_CASTLE:
+            self._do_castle_rook(to_sq)
 
         #place piece (promotion also handled here)
         placed_piece = moving_piece
-        if move.promo != 0:
-            placed_piece = move.promo if self.side_to_move == WHITE else -move.promo
+        if kind == MOVE_PROMO:
+            promo = ((move >> 12) & 3) + KNIGHT
+            placed_piece = promo if stm == WHITE else -promo
 
-        self.squares[move.to_sq] = placed_piece
-        self.zobrist_hash ^= self.zobrist.piece_keys[move.to_sq][self.zobrist.piece_index(placed_piece)]
+        self._put_piece(to_sq, placed_piece)
+        h = self.zobrist_hash ^ piece_keys[to_sq][zobrist.piece_index(placed_piece)]
 
         #update castling rights if king or rook moved or rook captured
-        self._update_castling_rights(move, moving_piece, captured)
+        if self.castling_rights:
+            self._update_castling_rights(from_sq, to_sq, moving_piece, captured)
 
         #set EP square if pawn moves up 2
-        if abs_piece(moving_piece) == PAWN and abs(move.to_sq - move.from_sq) == 16:
-            self.ep_square = (move.from_sq + move.to_sq) // 2
+        if (moving_piece == PAWN or moving_piece == -PAWN) and abs(to_sq - from_sq) == 16:
+            self.ep_square = (from_sq + to_sq) // 2
+            h ^= zobrist.ep_file_key(self.ep_square)
 
         #move number
-        if self.side_to_move == BLACK:
+        if stm == BLACK:
             self.fullmove_number += 1
 
         #switch side 
-        self.side_to_move *= -1
+        self.side_to_move = -stm
 
-        #zobrist add new ep/castling 
-        self.zobrist_hash ^= self.zobrist.castle_keys[self.castling_rights]
-        self.zobrist_hash ^= self.zobrist.ep_file_key(self.ep_square)
+        #zobrist add new castling 
+        self.zobrist_hash = h ^ zobrist.castle_keys[self.castling_rights]
     
     def undo_move(self) -> None:
-        if not self.history:
+        if not self.ply:
             return
 
-        u = self.history.pop()
-        move = u.move
+        ply = self.ply - 1
+        self.ply = ply
+        move = self._undo_move[ply]
 
-        self.zobrist_hash = u.zobrist_hash
-        self.castling_rights = u.castling_rights
-        self.ep_square = u.ep_square
-        self.halfmove_clock = u.halfmove_clock
-        self.fullmove_number = u.fullmove_number
+        self.zobrist_hash = self._undo_hash[ply]
+        self.castling_rights = self._undo_castling[ply]
+        self.ep_square = self._undo_ep[ply]
+        self.halfmove_clock = self._undo_halfmove[ply]
+        self.fullmove_number = self._undo_fullmove[ply]
 
-        self.side_to_move *= -1
+        stm = -self.side_to_move
+        self.side_to_move = stm
+
+        if move == NO_MOVE:
+            return
 
-        moved_piece = self.squares[move.to_sq]
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        kind = move >> 14
 
-        if move.is_castle:
-            self._undo_castle_rook(move)
+        moved_piece = self._remove_piece(to_sq)
 
-        if move.promo != 0:
-            moved_piece = PAWN if self.side_to_move == WHITE else -PAWN
+        if kind == MOVE_CASTLE:
+            self._undo_castle_rook(to_sq)
+        elif kind == MOVE_PROMO:
+            moved_piece = PAWN if stm == WHITE else -PAWN
 
-        self.squares[move.to_sq] = EMPTY
+        self._put_piece(from_sq, moved_piece)
 
-        self.squares[move.from_sq] = moved_piece
+        captured = self._undo_captured[ply]
+        if captured != EMPTY:
+            if kind == MOVE_EP:
+                self._put_piece(to_sq + (8 if stm == WHITE else -8), captured)
+            else:
+                self._put_piece(to_sq, captured)
 
-        if move.is_ep:
-            cap_sq = move.to_sq + (8 if self.side_to_move == WHITE else -8)
-            self.squares[cap_sq] = u.captured
-        else:
-            self.squares[move.to_sq] = u.captured
 
+    def make_null_move(self) -> None:
+        #passes the turn without moving, used by null move pruning in the search
+        #it goes on the undo stack like any move (as NO_MOVE) so undo_move takes it back
+        #the halfmove clock restarts like after a pawn move so repetition checks never look back past it,
+        #the real clock comes back with undo_move
+        self._push_undo(NO_MOVE, EMPTY)
+        self.zobrist_hash ^= self.zobrist.side_key
+        self.zobrist_hash ^= self.zobrist.ep_file_key(self.ep_square)
+        self.ep_square = -1
+        self.halfmove_clock = 0
+        self.side_to_move *= -1
 
-    def _do_castle_rook(self, move: Move) -> None:
+    def is_repetition(self, count: int = 1) -> bool:
+        #has the current position come up count times before
+        #only positions since the last capture, pawn move or null move can match and only every second one
+        #has the same side to move, so the scan walks the hash stack two plies at a time back to there
+        #(the first candidate is 4 plies back, it takes two moves from each side to get back)
+        h = self.zobrist_hash
+        hashes = self._undo_hash
+        end = self.ply - self.halfmove_clock
+        seen = 0
+        for i in range(self.ply - 4, (end if end > 0 else 0) - 1, -2):
+            if hashes[i] == h:
+                seen += 1
+                if seen >= count:
+                    return True
+        return False
+
+    def is_fifty_moves(self) -> bool:
+        return self.halfmove_clock >= 100
+
+    def _do_castle_rook(self, king_to: int) -> None:
         #king moved to_sq identifies which castle it was 
         #White: e1->g1 king rook h1->f1, e1->c1 king rook a1->d1
         #Black: e8->g8 king  rook h8->f8, e8->c8 king rook a8->d8
-        if move.to_sq == 62: #white king side
+        if king_to == 62: #white king side
             self._move_rook(63, 61)
-        elif move.to_sq == 58: #white queen side
+        elif king_to == 58: #white queen side
             self._move_rook(56, 59)
-        elif move.to_sq == 6: #black king side
+        elif king_to == 6: #black king side
             self._move_rook(7, 5)
-        elif move.to_sq == 2: #black queen side
+        elif king_to == 2: #black queen side
             self._move_rook(0, 3)
     
-    def _undo_castle_rook(self, move: Move) -> None:
-        if move.to_sq == 62:
-            self.squares[63] = self.squares[61]; self.squares[61] = EMPTY
-        elif move.to_sq == 58:
-            self.squares[56] = self.squares[59]; self.squares[59] = EMPTY
-        elif move.to_sq == 6:
-            self.squares[7] = self.squares[5]; self.squares[5] = EMPTY
-        elif move.to_sq == 2:
-            self.squares[0] = self.squares[3]; self.squares[3] = EMPTY
+    def _undo_castle_rook(self, king_to: int) -> None:
+        if king_to == 62:
+            self._put_piece(63, self._remove_piece(61))
+        elif king_to == 58:
+            self._put_piece(56, self._remove_piece(59))
+        elif king_to == 6:
+            self._put_piece(7, self._remove_piece(5))
+        elif king_to == 2:
+            self._put_piece(0, self._remove_piece(3))
 
     def _move_rook(self, from_sq: int, to_sq: int) -> None:
         rook = self.squares[from_sq]
         #update zobrist
         self.zobrist_hash ^= self.zobrist.piece_keys[from_sq][self.zobrist.piece_index(rook)]
         self.zobrist_hash ^= self.zobrist.piece_keys[to_sq][self.zobrist.piece_index(rook)]
-        self.squares[from_sq] = EMPTY
-        self.squares[to_sq] = rook
-
-    def _get_captured_piece(self, move: Move) -> int:
-        if move.is_ep:
-            cap_sq = move.to_sq + (8 if self.side_to_move == WHITE else -8)
-            return self.squares[cap_sq]
-        return self.squares[move.to_sq]
-
+        self._remove_piece(from_sq)
+        self._put_piece(to_sq, rook)
 
-    def _update_castling_rights(self, move, moving_piece: int, captured: int) -> None:
+    def _update_castling_rights(self, from_sq: int, to_sq: int, moving_piece: int, captured: int) -> None:
         #removes ability to castle on a given side if rook moves or is taken or a king moves
         #king moves
         if abs_piece(moving_piece) == KING:
@@ -234,17 +564,17 @@ class Board:
             
         #rook moves
         if abs_piece(moving_piece) == ROOK:
-            if move.from_sq == 63: self.castling_rights &= ~WK
-            if move.from_sq == 56: self.castling_rights &= ~WQ
-            if move.from_sq == 7: self.castling_rights &= ~BK
-            if move.from_sq == 0: self.castling_rights &= ~BQ
+            if from_sq == 63: self.castling_rights &= ~WK
+            if from_sq == 56: self.castling_rights &= ~WQ
+            if from_sq == 7: self.castling_rights &= ~BK
+            if from_sq == 0: self.castling_rights &= ~BQ
         
         #rook captured on original square
         if abs_piece(captured) == ROOK:
-            if move.to_sq == 63: self.castling_rights &= ~WK
-            if move.to_sq == 56: self.castling_rights &= ~WQ
-            if move.to_sq == 7: self.castling_rights &= ~BK
-            if move.to_sq == 0: self.castling_rights &= ~BQ
+            if to_sq == 63: self.castling_rights &= ~WK
+            if to_sq == 56: self.castling_rights &= ~WQ
+            if to_sq == 7: self.castling_rights &= ~BK
+            if to_sq == 0: self.castling_rights &= ~BQ
 
     def is_game_over(self) -> bool:
         from movegen import generate_legal_moves
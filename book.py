@@ -0,0 +1,127 @@
+import mmap
+import os
+import random
+import struct
+import sys
+from typing import List, Optional, Tuple
+
+from board import Board, NO_MOVE, KNIGHT, KING, MOVE_PROMO, move_to_uci
+from movegen import generate_legal_moves
+from zobrist import polyglot_key
+
+#polyglot .bin opening books
+#a book is a flat file of 16 byte big endian entries (key u64, move u16, weight u16, learn u32) sorted by key,
+#so it is memory mapped and binary searched in place, nothing is read until a lookup touches it and
+#every engine process using the same file shares the pages through the os page cache
+#run with: python3 book.py <book.bin> [fen] to list the book moves of a position
+
+ENTRY_SIZE = 16
+_ENTRY = struct.Struct(">QHHI")
+_KEY = struct.Struct(">Q")
+
+#polyglot writes castling as the king taking its own rook
+_CASTLE_TO = {(60, 63): 62, (60, 56): 58, (4, 7): 6, (4, 0): 2}
+
+
+class OpeningBook:
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size % ENTRY_SIZE:
+            self._file.close()
+            raise ValueError(f"{path} is not a polyglot book, size {size} is not a multiple of {ENTRY_SIZE}")
+        #mmap cant map an empty file, an empty book just never has a move
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.count = size // ENTRY_SIZE
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def _first(self, key: int) -> int:
+        #index of the first entry with this key or a bigger one
+        lo, hi = 0, self.count
+        mm = self._mm
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _KEY.unpack_from(mm, mid * ENTRY_SIZE)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def entries(self, board: Board) -> List[Tuple[int, int]]:
+        #(move code, weight) for every book move of the position that is legal here, book order
+        if self._mm is None:
+            return []
+        key = polyglot_key(board)
+        legal = generate_legal_moves(board, underpromotions=True)
+        out = []
+        i = self._first(key)
+        while i < self.count:
+            entry_key, raw, weight, _ = _ENTRY.unpack_from(self._mm, i * ENTRY_SIZE)
+            if entry_key != key:
+                break
+            move = self._to_code(board, raw, legal)
+            if move != NO_MOVE:
+                out.append((move, weight))
+            i += 1
+        return out
+
+    @staticmethod
+    def _to_code(board: Board, raw: int, legal: List[int]) -> int:
+        #polyglot move bits are to file, to rank, from file, from rank, promotion piece (3 bits each)
+        #with rank 0 being rank 1, the matching legal move code is looked up so all the flags are right
+        to_sq = (7 - ((raw >> 3) & 7)) * 8 + (raw & 7)
+        from_sq = (7 - ((raw >> 9) & 7)) * 8 + ((raw >> 6) & 7)
+        promo = (raw >> 12) & 7
+        if abs(board.squares[from_sq]) == KING:
+            to_sq = _CASTLE_TO.get((from_sq, to_sq), to_sq)
+        low = from_sq | (to_sq << 6)
+        for move in legal:
+            if move & 4095 != low:
+                continue
+            #polyglot promotion pieces are knight 1 to queen 4
+            if promo == 0 or (move >> 14 == MOVE_PROMO and (move >> 12) & 3 == promo + 1 - KNIGHT):
+                return move
+        return NO_MOVE
+
+    def pick(self, board: Board, weighted: bool = True, rng: Optional[random.Random] = None) -> int:
+        #a book move for board or NO_MOVE, weighted picks at random in proportion to the weights so
+        #the engine varies its openings, otherwise the heaviest move is played every time
+        entries = [(m, w) for m, w in self.entries(board) if w > 0]
+        if not entries:
+            return NO_MOVE
+        if not weighted:
+            return max(entries, key=lambda e: e[1])[0]
+        rng = rng or random
+        roll = rng.randrange(sum(w for _, w in entries))
+        for move, weight in entries:
+            roll -= weight
+            if roll < 0:
+                return move
+        return entries[-1][0]
+
+
+def main() -> int:
+    if len(sys.argv) < 2:
+        print("usage: python3 book.py <book.bin> [fen]")
+        return 1
+    board = Board.from_fen(" ".join(sys.argv[2:])) if len(sys.argv) > 2 else Board.start_position()
+    book = OpeningBook(sys.argv[1])
+    try:
+        print(f"key {polyglot_key(board):016x}, {book.count} entries in book")
+        entries = book.entries(board)
+        total = sum(w for _, w in entries) or 1
+        for move, weight in sorted(entries, key=lambda e: -e[1]):
+            print(f"{move_to_uci(move):<6} weight {weight:>6} {weight * 100 / total:5.1f}%")
+    finally:
+        book.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
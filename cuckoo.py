@@ -0,0 +1,91 @@
+from typing import Dict, List, Tuple
+
+from board import Board, KNIGHT, BISHOP, ROOK, QUEEN, KING, WHITE, BLACK
+from tables import BETWEEN, KNIGHT_TARGETS, KING_TARGETS, ROOK_RAYS, BISHOP_RAYS
+from zobrist import Zobrist
+
+#upcoming repetition detection with cuckoo hashing (Marcel van Kervinck's method)
+#every reversible move of a piece between two squares changes the zobrist hash by a fixed key, the two
+#piece square keys and the side key, so if the current hash xor the hash of a position an odd number of
+#plies back is one of those keys, one move (if the path is clear) gets back to that earlier position
+#and the side to move can force a repetition, the keys are kept in a cuckoo table for one or two probes
+
+CUCKOO_SIZE = 8192
+CUCKOO_MASK = CUCKOO_SIZE - 1
+
+#tables per zobrist seed, built on first use
+_TABLES: Dict[int, Tuple[List[int], List[int]]] = {}
+
+
+def _h1(key: int) -> int:
+    return key & CUCKOO_MASK
+
+
+def _h2(key: int) -> int:
+    return (key >> 16) & CUCKOO_MASK
+
+
+def _reaches(piece: int, a: int, b: int) -> bool:
+    #can the piece move from a to b on an empty board
+    if piece == KNIGHT:
+        return b in KNIGHT_TARGETS[a]
+    if piece == KING:
+        return b in KING_TARGETS[a]
+    rays = ()
+    if piece != BISHOP:
+        rays += ROOK_RAYS[a]
+    if piece != ROOK:
+        rays += BISHOP_RAYS[a]
+    return any(b in ray for ray in rays)
+
+
+def cuckoo_tables(zobrist: Zobrist) -> Tuple[List[int], List[int]]:
+    #(keys, moves) with the move stored as from | to << 6, 0 is an empty slot
+    tables = _TABLES.get(zobrist.seed)
+    if tables is not None:
+        return tables
+    keys = [0] * CUCKOO_SIZE
+    moves = [0] * CUCKOO_SIZE
+    for color in (WHITE, BLACK):
+        for piece in (KNIGHT, BISHOP, ROOK, QUEEN, KING):
+            index = zobrist.piece_index(color * piece)
+            for a in range(64):
+                for b in range(a + 1, 64):
+                    if not _reaches(piece, a, b):
+                        continue
+                    key = zobrist.piece_keys[a][index] ^ zobrist.piece_keys[b][index] ^ zobrist.side_key
+                    move = a | (b << 6)
+                    i = _h1(key)
+                    while True:
+                        keys[i], key = key, keys[i]
+                        moves[i], move = move, moves[i]
+                        if move == 0:
+                            break
+                        i = _h2(key) if i == _h1(key) else _h1(key)
+    tables = _TABLES[zobrist.seed] = (keys, moves)
+    return tables
+
+
+def has_upcoming_repetition(board: Board, root_ply: int) -> bool:
+    #can the side to move get back to a position already on the line from root_ply with one move
+    #only positions after the root count, repeating one from the game before it is left to is_repetition
+    #hashes[ply - i] is the position i plies back, i = ply - root_ply would be the root itself so it stops short
+    ply = board.ply
+    end = min(board.halfmove_clock, ply - root_ply - 1)
+    if end < 3:
+        return False
+    keys, moves = cuckoo_tables(board.zobrist)
+    h = board.zobrist_hash
+    hashes = board._undo_hash
+    occupied = board.occupied
+    for i in range(3, end + 1, 2):
+        move_key = h ^ hashes[ply - i]
+        j = move_key & CUCKOO_MASK
+        if keys[j] != move_key:
+            j = (move_key >> 16) & CUCKOO_MASK
+            if keys[j] != move_key:
+                continue
+        move = moves[j]
+        if not BETWEEN[move & 63][move >> 6] & occupied:
+            return True
+    return False
@@ -1,155 +1,100 @@
-from typing import Optional, List
-from board import Board, Move, WHITE, BLACK
-from movegen import generate_legal_moves, is_in_check
+import math
+import random
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, List
+from board import (
+    Board, Move, WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, NO_MOVE, MOVE_PROMO, MOVE_EP, decode_move
+)
+from movegen import generate_captures, generate_legal_moves, is_in_check, is_legal, see, SEE_VALUE
 from transposition import TranspositionTable, EXACT, LOWER, UPPER
+from cuckoo import has_upcoming_repetition
+from movepicker import MovePicker, mvv_lva_score
+from stats import SearchStats
+from pst import MAX_PHASE
 
 INF = 10_000_000
 MATE_SCORE = 10_000
+MATE_BOUND = MATE_SCORE - 1000 #scores past this are mates
 DRAW_SCORE = 0
 
-# Material values
-PIECE_VALUE = {
-    1: 100, #pawn
-    2: 320, #knight
-    3: 330, #bishop
-    4: 500, #rook
-    5: 900, #queen
-    6: 0, #king
-}
-
-#Piece square tables from whites perspective
-#This helps encourage places that a piece should move twards for exaple knights are more powerfull in the cernter
-#of the board becasue they have more spaces to move to compared to the edges 
-PAWN_PST = [
-    0, 0, 0, 0, 0, 0, 0, 0,
-    50, 50, 50, 50, 50, 50, 50, 50,
-    10, 10, 20, 30, 30, 20, 10, 10,
-    5, 5, 10, 25, 25, 10, 5, 5,
-    0, 0, 0, 20, 20, 0, 0, 0,
-    5, -5, -10, 0, 0, -10, -5, 5,
-    5, 10, 10, -20, -20, 10, 10, 5,
-    0, 0, 0, 0, 0, 0, 0, 0,
-]
+MAX_DEPTH = 64 #depth cap for searches bounded only by time, nodes or a stop event
+CHECK_MASK = 255 #stop conditions are polled every 256 nodes
 
-KNIGHT_PST = [
-    -50, -40, -30, -30, -30, -30, -40, -50,
-    -40, -20, 0, 0, 0, 0, -20, -40,
-    -30, 0, 10, 15, 15, 10, 0, -30,
-    -30, 5, 15, 20, 20, 15, 5, -30,
-    -30, 0, 15, 20, 20, 15, 0, -30,
-    -30, 5, 10, 15, 15, 10, 5, -30,
-    -40, -20, 0, 5, 5, 0, -20, -40,
-    -50, -40, -30, -30, -30, -30, -40, -50
-]
+#aspiration windows, from this depth on each iteration starts with a window of ASPIRATION_WINDOW
+#and widens it (doubling) on the side that failed
+#the window is centred on the score from two iterations back, this evaluation swings a lot between
+#odd and even depths and a window around the last score failed on nearly every iteration
+ASPIRATION_DEPTH = 4
+ASPIRATION_WINDOW = 50
 
-BISHOP_PST = [
-    -20, -10, -10, -10, -10, -10, -10, -20,
-    -10, 0, 0, 0, 0, 0, 0, -10,
-    -10, 0, 5, 10, 10, 5, 0, -10,
-    -10, 5, 5, 10, 10, 5, 5, -10,
-    -10, 0, 10, 10, 10, 10, 0, -10,
-    -10, 10, 10, 10, 10, 10, 10, -10,
-    -10, 5, 0, 0, 0, 0, 5, -10,
-    -20, -10, -10, -10, -10, -10, -10, -20
-]
+#history scores are kept inside +-HISTORY_MAX by the gravity term in _update_quiet
+HISTORY_MAX = 1 << 14
 
-ROOK_PST = [
-    0, 0, 0, 0, 0, 0, 0, 0,
-    5, 10, 10, 10, 10, 10, 10, 5,
-    -5, 0, 0, 0, 0, 0, 0, -5,
-    -5, 0, 0, 0, 0, 0, 0, -5,
-    -5, 0, 0, 0, 0, 0, 0, -5,
-    -5, 0, 0, 0, 0, 0, 0, -5,
-    -5, 0, 0, 0, 0, 0, 0, -5,
-    0, 0, 0, 5, 5, 0, 0, 0
+#selective search, all of these are skipped at pv nodes and when in check
+#null move: pass the turn and search R plies shallower, if the opponent still cant get under beta
+#the real moves wont either, R grows with depth
+NULL_MOVE_MIN_DEPTH = 3
+#late move reductions: quiet moves late in the order are searched shallower by LMR_TABLE[depth][index]
+#and searched again at full depth if they beat alpha anyway
+LMR_MIN_DEPTH = 3
+LMR_MIN_INDEX = 3
+LMR_TABLE = [
+    [0] + [max(0, int(0.75 + math.log(d) * math.log(i) / 2.25)) if d else 0 for i in range(1, 64)]
+    for d in range(MAX_DEPTH + 1)
 ]
+#reverse futility: static eval is so far above beta that a margin per ply of depth left cant bring it back
+REVERSE_FUTILITY_DEPTH = 6
+REVERSE_FUTILITY_MARGIN = 90
+#razoring: static eval is so far under alpha that only captures could save it, so drop into quiescence
+RAZOR_DEPTH = 2
+RAZOR_MARGIN = [0, 300, 550]
 
-QUEEN_PST = [
-    -20, -10, -10, -5, -5, -10, -10, -20,
-    -10, 0, 0, 0, 0, 0, 0, -10,
-    -10, 0, 5, 5, 5, 5, 0, -10,
-    -5, 0, 5, 5, 5, 5, 0, -5,
-    0, 0, 5, 5, 5, 5, 0, -5,
-    -10, 5, 5, 5, 5, 5, 0, -10,
-    -10, 0, 5, 0, 0, 0, 0, -10,
-    -20, -10, -10, -5, -5, -10, -10, -20
-]
-#adds more king saftey in the mid game
-#and allows for more movement in endgames 
-KING_PST_MG = [
-    -30, -40, -40, -50, -50, -40, -40, -30,
-    -30, -40, -40, -50, -50, -40, -40, -30,
-    -30, -40, -40, -50, -50, -40, -40, -30,
-    -30, -40, -40, -50, -50, -40, -40, -30,
-    -20, -30, -30, -40, -40, -30, -30, -20,
-    -10, -20, -20, -20, -20, -20, -20, -10,
-    20, 20, 0, 0, 0, 0, 20, 20,
-    20, 30, 10, 0, 0, 10, 30, 20
-]
-KING_PST_EG = [
-    -50, -40, -30, -20, -20, -30, -40, -50,
-    -30, -20, -10, 0, 0, -10, -20, -30,
-    -30, -10, 20, 30, 30, 20, -10, -30,
-    -30, -10, 30, 40, 40, 30, -10, -30,
-    -30, -10, 30, 40, 40, 30, -10, -30,
-    -30, -10, 20, 30, 30, 20, -10, -30,
-    -30, -30, 0, 0, 0, 0, -30, -30,
-    -50, -30, -30, -30, -30, -30, -30, -50
-]
+#quiescence delta pruning, a capture is skipped when even winning the captured piece for free
+#plus this margin leaves the stand pat score under alpha
+DELTA_MARGIN = 200
 
+#time management, without movestogo assume this many moves are left on the clock
+#and never plan to use more than MAX_TIME_SHARE of what is left on one move
+DEFAULT_MOVES_TO_GO = 30
+MAX_TIME_SHARE = 0.5
+MOVE_OVERHEAD_MS = 30
 
 def is_endgame(board: Board) -> bool:
     #check if we're in endgame phase witch is defined as 2600 in material
-    #allows for the king to have more movement in endgames and deeper searchs when less pieces are on the board
-    material = 0
-    for sq in range(64):
-        piece = board.squares[sq]
-        if piece != 0 and abs(piece) != 6:
-            material += PIECE_VALUE[abs(piece)]
-    return material <= 2600
+    #allows for deeper searchs when less pieces are on the board
+    #board.material is the running non king material total kept by make_move and undo_move
+    return board.material <= 2600
+
+
+def score_to_tt(score: int, ply: int) -> int:
+    #mate scores count plies from the root, the table keeps them counted from the node itself so an entry
+    #is right wherever the position turns up again (another ply, another root, an smp helper)
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def score_from_tt(score: int, ply: int) -> int:
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
 
 
 def evaluate(board: Board) -> int:
     # evaluation from perspective of (side to move or stm) Positive is good for side to move negitve if bad for side to move
-    score = 0
-    endgame = is_endgame(board)
+    # material and pst are summed incrementaly by the board from whites side for both the midgame and endgame tables
+    # the two are blended by game phase so the king slides from the safety table to the active one as pieces come off
+    phase = board.phase if board.phase < MAX_PHASE else MAX_PHASE
+    score = (board.mg_score * phase + board.eg_score * (MAX_PHASE - phase)) // MAX_PHASE
     
-    for square in range(64):
-        piece = board.squares[square]
-        if piece == 0:
-            continue
-        
-        color = WHITE if piece > 0 else BLACK
-        piece_type = abs(piece)
-        
-        #base material value
-        value = PIECE_VALUE[piece_type]
-        
-        #mirror squares for black pieces
-        mirror_sq = square if color == WHITE else 63 - square
-        
-        #piece square table bonus
-        pst_bonus = 0
-        if piece_type == 1:  #pawn
-            pst_bonus = PAWN_PST[mirror_sq]
-        elif piece_type == 2:  #knight
-            pst_bonus = KNIGHT_PST[mirror_sq]
-        elif piece_type == 3:  #bishop
-            pst_bonus = BISHOP_PST[mirror_sq]
-        elif piece_type == 4:  #rook
-            pst_bonus = ROOK_PST[mirror_sq]
-        elif piece_type == 5:  #queen
-            pst_bonus = QUEEN_PST[mirror_sq]
-        elif piece_type == 6:  #king
-            pst_bonus = KING_PST_EG[mirror_sq] if endgame else KING_PST_MG[mirror_sq]
-        
-        piece_score = value + pst_bonus
-        
-        #score is always baised on side to move
-        if color == board.side_to_move:
-            score += piece_score
-        else:
-            score -= piece_score
+    #score is always baised on side to move
+    if board.side_to_move == BLACK:
+        score = -score
     
     #Tempo bonus
     score += 10
@@ -157,135 +102,630 @@ def evaluate(board: Board) -> int:
     return score
 
 
-def mvv_lva_score(board: Board, move: Move) -> int:
-    #Most Valuable Victim - Least Valuable Aggressor or mvv-lva 
-    #orders captures and queen > pawn over pawn > queen and helps improve alpha beta pruning
-    if move.is_ep:
-        return 1000  #EP captures are usualy good
-    
-    victim = board.squares[move.to_sq]
-    if victim == 0:
-        return 0
-    
-    attacker = abs(board.squares[move.from_sq])
-    return PIECE_VALUE[abs(victim)] - attacker
+@dataclass
+class SearchOptions:
+    #switches for the selective search so each one can be measured on its own (bench.py --disable ...)
+    null_move: bool = True
+    lmr: bool = True
+    reverse_futility: bool = True
+    razoring: bool = True
+    upcoming_repetition: bool = True #raise alpha to a draw when a cycle can be closed, see cuckoo.py
 
 
-def order_moves(board: Board, moves: List[Move], tt_move: Optional[Move] = None) -> List[Move]:
-    #order moves for better alpha-beta pruning
-    if not moves:
-        return moves
-    
-    #separate (transposition tables or tt) move if they exists
-    if tt_move and tt_move in moves:
-        moves.remove(tt_move)
-        ordered = [tt_move]
-    else:
-        ordered = []
-    
-    #score remaining moves
-    captures = []
-    quiet = []
-    
-    for move in moves:
-        if move.is_ep or board.squares[move.to_sq] != 0:
-            captures.append((mvv_lva_score(board, move), move))
-        else:
-            quiet.append(move)
-    
-    #sort captures by mvv-lva
-    captures.sort(reverse=True, key=lambda x: x[0])
-    ordered.extend([move for _, move in captures])
-    ordered.extend(quiet)
-    
-    return ordered
+@dataclass
+class SearchInfo:
+    #handed to Engine.on_iteration after every completed depth
+    depth: int
+    score: int #from the side to move's point of view
+    nodes: int
+    time_ms: int
+    pv: List[Move]
+    hashfull: int
+    stats: Optional[SearchStats] = None #copy of the stats so far when Engine.collect_stats is on
+
+
+class SearchAborted(Exception):
+    #raised inside the search tree when it has to stop early, caught in Engine.search
+    pass
 
 
 class Engine:
-    def __init__(self):
+    def __init__(self, hash_mb: int = 16, threads: int = 1, tt: Optional[TranspositionTable] = None):
         self.nodes = 0
+        #the search works on move codes, best_move and pv are Move views of the result for callers
         self.best_move: Optional[Move] = None
-        self.tt = TranspositionTable()
+        self.pv: List[Move] = []
+        self._root_best = NO_MOVE
+        self.tt = tt if tt is not None else TranspositionTable(hash_mb)
         self.max_depth = 6  #Default search depth
+        self.options = SearchOptions()
+
+        #polyglot opening book, set with set_book, while the position is in the book search returns a book
+        #move right away, weighted picks in proportion to the book weights and off always plays the heaviest
+        self.book = None
+        self.book_weighted = True
+        self._book_rng = random.Random()
+
+        #endgame tablebases, set with set_tablebases, positions with few enough men are scored from the
+        #tables instead of searched and a root position in the tables plays the table move right away
+        self.tablebases = None
+        self.tablebase_path: Optional[str] = None
+
+        #lazy smp, threads - 1 helper processes search the same position and share the transposition table
+        #helpers only fill the table, the best move always comes from this process
+        self.threads = threads
+        self.helper_nodes = 0
+        self._helpers = None
+
+        #helper_id is set in helper processes, it changes their root move order and start depth
+        self.helper_id = 0
+        self._rng = random.Random(0)
+        self.stop_event = None
+
+        #search limits, set at the start of every search
+        self.completed_depth = 0
+        self.move_time: Optional[int] = None #ms per move for chose_move, None searches to depth 5
+        self._start_time = 0.0
+        self._deadline: Optional[float] = None
+        self._node_limit: Optional[int] = None
+        self._search_stop = None
+
+        #called with a SearchInfo after each finished iteration (the uci front end prints these)
+        self.on_iteration: Optional[Callable[[SearchInfo], None]] = None
+
+        #collect_stats = True fills a fresh SearchStats on every search, see stats.py
+        self.collect_stats = False
+        self.stats: Optional[SearchStats] = None
+
+        #triangular pv table, _pv_table[ply] is the best line found from ply on, rebuilt by _alphabeta
+        self._pv_table: List[List[int]] = [[] for _ in range(MAX_DEPTH + 2)]
+
+        #quiet move ordering tables, all updated on beta cutoffs in _alphabeta
+        #killers[ply] holds two moves, history[color] is a from * 64 + to table for each side
+        #and countermoves[piece][to] is the reply that refuted the last move of that piece to that square
+        #history is halved between searches so old results fade, killers are cleared
+        self.killers: List[List[int]] = [[NO_MOVE, NO_MOVE] for _ in range(MAX_DEPTH + 2)]
+        self.history: List[List[int]] = [[0] * 4096 for _ in range(3)]
+        self.countermoves: List[List[int]] = [[NO_MOVE] * 64 for _ in range(13)]
+
+    def set_threads(self, threads: int) -> None:
+        self._close_helpers()
+        self.threads = max(1, threads)
+
+    def set_hash(self, hash_mb: int) -> None:
+        #helpers are attached to the old table so they are restarted on the next search
+        self._close_helpers()
+        self.tt.resize(hash_mb)
+
+    def set_book(self, path: Optional[str]) -> None:
+        #None or an empty path turns the book off
+        from book import OpeningBook
+        if self.book is not None:
+            self.book.close()
+            self.book = None
+        if path:
+            self.book = OpeningBook(path)
+
+    def set_tablebases(self, path: Optional[str]) -> None:
+        #path is a directory of .tb files from tablebase.py, None or an empty path turns them off
+        from tablebase import Tablebases
+        if self.tablebases is not None:
+            self.tablebases.close()
+            self.tablebases = None
+        self.tablebase_path = path or None
+        if path:
+            self.tablebases = Tablebases(path)
+
+    def new_game(self) -> None:
+        #forgets everything learned from the previous game
+        self.tt.clear()
+        self.history = [[0] * 4096 for _ in range(3)]
+        self.countermoves = [[NO_MOVE] * 64 for _ in range(13)]
+
+    def close(self) -> None:
+        self._close_helpers()
+        if self.book is not None:
+            self.book.close()
+            self.book = None
+        if self.tablebases is not None:
+            self.tablebases.close()
+            self.tablebases = None
+        self.tt.close()
+
+    def _close_helpers(self) -> None:
+        if self._helpers is not None:
+            self._helpers.close()
+            self._helpers = None
+
+    def _start_helpers(self, board: Board, depth: int):
+        if self.threads <= 1:
+            return None
+        if self._helpers is None:
+            from smp import HelperPool
+            if not self.tt.shared:
+                size_mb = self.tt.size_mb
+                self.tt.close()
+                self.tt = TranspositionTable(size_mb, shared=True)
+            self._helpers = HelperPool(self.tt, self.threads - 1)
+        self._helpers.start(board, depth, self.tt.generation, self.options, self.tablebase_path)
+        return self._helpers
     
-    def search(self, board: Board, depth: int) -> Optional[Move]:
+    def search(
+        self,
+        board: Board,
+        depth: Optional[int] = None,
+        movetime: Optional[int] = None,
+        wtime: Optional[int] = None,
+        btime: Optional[int] = None,
+        winc: int = 0,
+        binc: int = 0,
+        movestogo: Optional[int] = None,
+        nodes: Optional[int] = None,
+        stop_event=None,
+    ) -> Optional[Move]:
         #iterative deepening search always keeps best move from deepest completed search
+        #any mix of limits can be given, times are in milliseconds like uci
+        #   depth      deepest iteration to run
+        #   movetime   fixed time for this move
+        #   wtime/btime, winc/binc, movestogo   clock for each side, the engine picks its own budget
+        #   nodes      node limit
+        #   stop_event anything with is_set(), set it from another thread to stop right away
+        #with no limits at all it searches to max_depth
         self.nodes = 0
+        self.helper_nodes = 0
         self.best_move = None
+        self._root_best = NO_MOVE
+        self.completed_depth = 0
+        self.stats = SearchStats() if self.collect_stats else None
+
+        if self.book is not None and not self.helper_id:
+            book_move = self.book.pick(board, self.book_weighted, self._book_rng)
+            if book_move != NO_MOVE:
+                self._root_best = book_move
+                self.best_move = decode_move(book_move)
+                self.pv = [self.best_move]
+                return self.best_move
+
+        if self.tablebases is not None and not self.helper_id and self._tablebase_root(board):
+            return self.best_move
+
+        if not self.helper_id:
+            self.tt.new_search()
+        for killers in self.killers:
+            killers[0] = killers[1] = NO_MOVE
+        for table in self.history:
+            table[:] = [h // 2 for h in table]
+
+        self._start_time = time.perf_counter()
+        soft_ms, hard_ms = self._allot_time(board.side_to_move, movetime, wtime, btime, winc, binc, movestogo)
+        self._deadline = self._start_time + hard_ms / 1000 if hard_ms is not None else None
+        self._node_limit = nodes
+        self._search_stop = stop_event if stop_event is not None else self.stop_event
+        limited = hard_ms is not None or nodes is not None or stop_event is not None
         
-        #extend depth in endgame
-        if is_endgame(board):
-            depth = min(depth + 2, 8)
+        explicit = depth is not None
+        if depth is None:
+            depth = MAX_DEPTH if limited else self.max_depth
+        #helpers get the depth before the endgame extension, their own search applies it again
+        requested = depth
+        #extend depth in endgame, only ever adds plies so a deeper depth the caller asked for is kept
+        if explicit and is_endgame(board):
+            depth = max(depth, min(depth + 2, 8))
+        #the per ply tables (LMR_TABLE, killers, the pv table) only go that deep
+        depth = max(1, min(depth, MAX_DEPTH))
+        requested = min(requested, MAX_DEPTH)
+
+        helpers = self._start_helpers(board, requested)
+        root_ply = board.ply
+        last_iteration = 0.0
+        scores: List[int] = []
         
         # Iterative deepening
-        for d in range(1, depth + 1):
-            score = self._alphabeta(board, d, -INF, INF, root=True)
-        
+        #odd numbered helpers skip depth 1 so the helpers spread over two depths at once
+        try:
+            for d in range(1 + (self.helper_id & 1), depth + 1):
+                iteration_start = time.perf_counter()
+                iteration_nodes = self.nodes
+                score = self._aspiration(board, d, scores[-2] if len(scores) >= 2 else None)
+                scores.append(score)
+                self.completed_depth = d
+                self.pv = self.principal_variation(board, d, self._pv_table[0])
+                if self.stats is not None:
+                    self.stats.iteration_nodes.append(self.nodes - iteration_nodes)
+                if self.on_iteration is not None and not self.helper_id:
+                    self.on_iteration(SearchInfo(
+                        depth=d,
+                        score=score,
+                        nodes=self.nodes,
+                        time_ms=int((time.perf_counter() - self._start_time) * 1000),
+                        pv=self.pv,
+                        hashfull=self.tt.hashfull(),
+                        stats=self.stats.snapshot() if self.stats is not None else None,
+                    ))
+
+                #dont start an iteration that probably cant finish inside the soft budget
+                #the next one is predicted from how much longer this one took than the last
+                if soft_ms is not None:
+                    now = time.perf_counter()
+                    this_iteration = now - iteration_start
+                    growth = this_iteration / last_iteration if last_iteration > 0.001 else 2.0
+                    growth = min(max(growth, 1.5), 6.0)
+                    if (now - self._start_time + this_iteration * growth) * 1000 > soft_ms:
+                        break
+                    last_iteration = this_iteration
+        except SearchAborted:
+            #unwind the moves the search had made, best_move is still from the last finished depth
+            while board.ply > root_ply:
+                board.undo_move()
+        finally:
+            if helpers is not None:
+                self.helper_nodes = helpers.stop()
+
+        #stopped before even depth 1 finished, any legal move beats none
+        if self._root_best == NO_MOVE and not self.helper_id:
+            self._root_best = next(iter(MovePicker(board)), NO_MOVE)
+
+        self.best_move = decode_move(self._root_best)
+
+        if self.completed_depth == 0:
+            self.pv = [self.best_move] if self.best_move is not None else []
         return self.best_move
-    
+
+    def _tablebase_root(self, board: Board) -> bool:
+        #plays straight from the tables when the root is in them, the fastest mate when winning, the
+        #longest defence when losing and any drawing move in a draw, the pv follows the tables to the mate
+        hit = self.tablebases.probe(board)
+        if hit is None:
+            return False
+        start = time.perf_counter()
+        pv: List[int] = []
+        #a draw has no line to show, only the move
+        length = hit[1] if hit[0] else 1
+        while len(pv) < length:
+            move = self._tablebase_move(board)
+            if move == NO_MOVE:
+                break
+            pv.append(move)
+            board.make_move(move)
+        for _ in pv:
+            board.undo_move()
+        if not pv:
+            return False
+
+        self._root_best = pv[0]
+        self.best_move = decode_move(pv[0])
+        self.pv = [decode_move(m) for m in pv]
+        self.completed_depth = 1
+        if self.stats is not None:
+            self.stats.tb_hits += 1
+        if self.on_iteration is not None:
+            self.on_iteration(SearchInfo(
+                depth=1,
+                score=self._tablebase_score(hit, 0),
+                nodes=0,
+                time_ms=int((time.perf_counter() - start) * 1000),
+                pv=self.pv,
+                hashfull=self.tt.hashfull(),
+                stats=self.stats.snapshot() if self.stats is not None else None,
+            ))
+        return True
+
+    def _tablebase_move(self, board: Board) -> int:
+        #best move by the tables, NO_MOVE when there are no moves or a reply is not in the tables
+        best = NO_MOVE
+        best_key = None
+        for move in generate_legal_moves(board, underpromotions=True):
+            board.make_move(move)
+            hit = self.tablebases.probe(board)
+            board.undo_move()
+            if hit is None:
+                return NO_MOVE
+            #a loss for the opponent is a win for us, shorter wins and longer losses are better
+            wdl, plies = -hit[0], hit[1] + 1
+            key = (wdl, -plies if wdl > 0 else plies)
+            if best_key is None or key > best_key:
+                best, best_key = move, key
+        return best
+
+    @staticmethod
+    def _tablebase_score(hit, ply: int) -> int:
+        #same scale as the search mate scores so mates from the tables and from the search compare
+        wdl, plies = hit
+        if wdl > 0:
+            return MATE_SCORE - ply - plies
+        if wdl < 0:
+            return -MATE_SCORE + ply + plies
+        return DRAW_SCORE
+
+    def _aspiration(self, board: Board, depth: int, guess: Optional[int]) -> int:
+        #searches the root inside a window around guess, a result on or past a bound is only
+        #a bound so that side is widened and the root searched again
+        if depth < ASPIRATION_DEPTH or guess is None or abs(guess) >= MATE_BOUND:
+            return self._alphabeta(board, depth, -INF, INF, root=True)
+        delta = ASPIRATION_WINDOW
+        alpha = guess - delta
+        beta = guess + delta
+        while True:
+            score = self._alphabeta(board, depth, alpha, beta, root=True)
+            if alpha < score < beta:
+                return score
+            if self.stats is not None:
+                self.stats.aspiration_researches += 1
+            delta *= 2
+            if score <= alpha:
+                alpha = score - delta if delta < MATE_BOUND else -INF
+            else:
+                beta = score + delta if delta < MATE_BOUND else INF
+
+    def _allot_time(self, stm, movetime, wtime, btime, winc, binc, movestogo):
+        #returns (soft, hard) in ms, soft is when to stop starting new iterations and hard aborts mid iteration
+        if movetime is not None:
+            budget = max(1, movetime - MOVE_OVERHEAD_MS) if movetime > 2 * MOVE_OVERHEAD_MS else movetime
+            return budget, budget
+        left = wtime if stm == WHITE else btime
+        if left is None:
+            return None, None
+        inc = winc if stm == WHITE else binc
+        left = max(1, left - MOVE_OVERHEAD_MS)
+        soft = left / (movestogo or DEFAULT_MOVES_TO_GO) + inc * 0.75
+        hard = min(left * MAX_TIME_SHARE, soft * 4)
+        soft = min(soft, hard)
+        return soft, hard
+
+    def _check_stop(self) -> None:
+        #polled every CHECK_MASK + 1 nodes so the limits cost almost nothing
+        if self._search_stop is not None and self._search_stop.is_set():
+            raise SearchAborted()
+        if self._node_limit is not None and self.nodes >= self._node_limit:
+            raise SearchAborted()
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            raise SearchAborted()
+
+    def principal_variation(self, board: Board, max_len: int, prefix: Optional[List[int]] = None) -> List[Move]:
+        #follows best moves stored in the transposition table from the current position
+        #prefix is a line already known (the triangular pv), it is played first and the table only fills
+        #in the rest, the pv table comes up short whenever a transposition table hit ended the line early
+        pv: List[int] = []
+        seen = set()
+        for move in prefix or []:
+            seen.add(board.zobrist_hash)
+            pv.append(move)
+            board.make_move(move)
+        while len(pv) < max_len and board.zobrist_hash not in seen:
+            seen.add(board.zobrist_hash)
+            #not counted in the table's hit rate, that is meant to describe the search
+            entry = self.tt.probe(board.zobrist_hash, count=False)
+            move = entry[3] if entry else NO_MOVE
+            if move == NO_MOVE or not is_legal(board, move):
+                break
+            pv.append(move)
+            board.make_move(move)
+        for _ in pv:
+            board.undo_move()
+        return [decode_move(move) for move in pv]
+
     def _alphabeta(
         self,
         board: Board,
         depth: int,
         alpha: int,
         beta: int,
-        root: bool = False
+        root: bool = False,
+        ply: int = 0,
     ) -> int:
         #alpha beta search core search used
+        #principal variation search, the first move gets the full window and the rest a null window
+        #around alpha that only proves them worse, one that beats alpha anyway is searched again in full
         
         self.nodes += 1
+        if not self.nodes & CHECK_MASK:
+            self._check_stop()
+        self._pv_table[ply] = []
+
+        #stats is None unless collect_stats is on, sampled marks the nodes whose work gets timed
+        st = self.stats
+        sampled = st is not None and not self.nodes & st.sample_mask
+        if st is not None:
+            st.main_nodes += 1
+
+        #draws, a position seen before on the line or in the game counts as drawn right away (the side
+        #that wanted more would not have let it repeat) and so does the fifty move rule
+        #quiescence only plays captures so it can never repeat and needs no check of its own
+        if not root:
+            if board.halfmove_clock >= 100 or board.is_repetition():
+                if st is not None:
+                    st.repetition_draws += 1
+                return DRAW_SCORE
+            #the side to move can repeat with one move, so it scores at least a draw
+            if (self.options.upcoming_repetition and alpha < DRAW_SCORE and board.halfmove_clock >= 3
+                    and has_upcoming_repetition(board, board.ply - ply)):
+                if st is not None:
+                    st.upcoming_repetitions += 1
+                alpha = DRAW_SCORE
+                if alpha >= beta:
+                    return alpha
         alpha_orig = alpha
         
         #transposition table lookup this helps narrow alpha beta window to speed up search
-        entry = self.tt.get(board.zobrist_hash)
-        if entry and entry.depth >= depth and not root:
-            if entry.flag == EXACT:
-                return entry.score
-            elif entry.flag == LOWER:
-                alpha = max(alpha, entry.score)
-            elif entry.flag == UPPER:
-                beta = min(beta, entry.score)
+        entry = self.tt.probe(board.zobrist_hash)
+        if st is not None:
+            st.tt_probes += 1
+            if entry:
+                st.tt_hits += 1
+        if entry and entry[0] >= depth and not root:
+            _, tt_score, tt_flag, _ = entry
+            tt_score = score_from_tt(tt_score, ply)
+            if tt_flag == EXACT:
+                if st is not None:
+                    st.tt_cutoffs[EXACT] += 1
+                return tt_score
+            elif tt_flag == LOWER:
+                alpha = max(alpha, tt_score)
+            elif tt_flag == UPPER:
+                beta = min(beta, tt_score)
             if alpha >= beta:
-                return entry.score
+                if st is not None:
+                    st.tt_cutoffs[tt_flag] += 1
+                return tt_score
         
+        #tablebase hit, the exact result replaces the whole subtree
+        tb = self.tablebases
+        if tb is not None and not root and board.occupied.bit_count() <= tb.max_men:
+            hit = tb.probe(board)
+            if hit is not None:
+                if st is not None:
+                    st.tb_hits += 1
+                #distance to mate scores are ply relative like search mates, so they go through score_to_tt too
+                score = self._tablebase_score(hit, ply)
+                self.tt.store(board.zobrist_hash, MAX_DEPTH, score_to_tt(score, ply), EXACT, NO_MOVE)
+                return score
+
         #leaf node evaluation 
-        if depth == 0:
+        if depth <= 0:
             return self._quiescence(board, alpha, beta, 4)
+
+        stm = board.side_to_move
+        in_check = is_in_check(board, stm)
+        pv_node = beta - alpha > 1
+        opts = self.options
+
+        #pruning before any move is searched, only at zero window nodes out of check
+        if not pv_node and not in_check and not root:
+            static_eval = evaluate(board)
+
+            if (opts.reverse_futility and depth <= REVERSE_FUTILITY_DEPTH and abs(beta) < MATE_BOUND
+                    and static_eval - REVERSE_FUTILITY_MARGIN * depth >= beta):
+                if st is not None:
+                    st.reverse_futility_prunes += 1
+                return static_eval - REVERSE_FUTILITY_MARGIN * depth
+
+            if opts.razoring and depth <= RAZOR_DEPTH and static_eval + RAZOR_MARGIN[depth] <= alpha:
+                score = self._quiescence(board, alpha, alpha + 1, 4)
+                if score <= alpha:
+                    if st is not None:
+                        st.razor_prunes += 1
+                    return score
+
+            #never two null moves in a row, and not with only pawns left where zugzwang is common
+            #and passing really can be the best move
+            if (opts.null_move and depth >= NULL_MOVE_MIN_DEPTH and static_eval >= beta
+                    and board.last_move() != NO_MOVE
+                    and self._has_pieces(board, stm)):
+                r = 3 + depth // 6
+                board.make_null_move()
+                score = -self._alphabeta(board, depth - 1 - r, -beta, -beta + 1, ply=ply + 1)
+                board.undo_move()
+                if score >= beta:
+                    if st is not None:
+                        st.null_move_cutoffs += 1
+                    return beta if score >= MATE_BOUND else score
         
-        #move generation
-        moves = generate_legal_moves(board)
-        
-        if not moves:
-            if is_in_check(board, board.side_to_move):
-                return -MATE_SCORE + (self.max_depth - depth)  #pefers shorter checkmates
-            return DRAW_SCORE
-        
-        #move ordering
-        tt_move = entry.best_move if entry else None
-        moves = order_moves(board, moves, tt_move)
+        #move generation and ordering, the picker generates each stage only when it is reached
+        #so with stats on the sampled movegen time is the time spent waiting on the picker
+        tt_move = entry[3] if entry else NO_MOVE
+        countermove = NO_MOVE
+        last = board.last_move()
+        if last != NO_MOVE:
+            last_to = (last >> 6) & 63
+            countermove = self.countermoves[board.squares[last_to]][last_to]
+        picker = MovePicker(board, tt_move, self.killers[ply], self.history[stm], countermove)
+        if st is not None:
+            st.movegen_calls += 1
+            if sampled:
+                st.movegen_sampled_calls += 1
+
+        #the root is small and searched often, it takes the whole list
+        #helpers try root moves in their own order so they dont all walk the same tree
+        if root:
+            moves = list(picker)
+            if self.helper_id:
+                rest = moves[1:]
+                self._rng.shuffle(rest)
+                moves = moves[:1] + rest
+            source = iter(moves)
+        else:
+            source = iter(picker)
         
         best_score = -INF
-        best_move = None
+        best_move = NO_MOVE
+        quiets_tried: List[int] = []
+        index = -1
         
         #search all moves
-        for move in moves:
+        while True:
+            if sampled:
+                t0 = time.perf_counter()
+                move = next(source, NO_MOVE)
+                st.movegen_sampled_time += time.perf_counter() - t0
+            else:
+                move = next(source, NO_MOVE)
+            if move == NO_MOVE:
+                break
+            index += 1
+            kind = move >> 14
+            is_quiet = kind != MOVE_EP and kind != MOVE_PROMO and board.squares[(move >> 6) & 63] == 0
+            if sampled:
+                t0 = time.perf_counter()
             board.make_move(move)
-            score = -self._alphabeta(board, depth - 1, -beta, -alpha)
+            if sampled:
+                st.make_undo_sampled_time += time.perf_counter() - t0
+
+            if index == 0:
+                score = -self._alphabeta(board, depth - 1, -beta, -alpha, ply=ply + 1)
+            else:
+                #late quiet moves that dont give check are searched shallower first
+                reduction = 0
+                if (opts.lmr and is_quiet and depth >= LMR_MIN_DEPTH and index >= LMR_MIN_INDEX
+                        and not in_check and not is_in_check(board, board.side_to_move)):
+                    reduction = min(LMR_TABLE[depth][min(index, 63)], depth - 2)
+                    if pv_node and reduction > 1:
+                        reduction -= 1
+                score = -self._alphabeta(board, depth - 1 - reduction, -alpha - 1, -alpha, ply=ply + 1)
+                if reduction and score > alpha:
+                    if st is not None:
+                        st.lmr_researches += 1
+                    score = -self._alphabeta(board, depth - 1, -alpha - 1, -alpha, ply=ply + 1)
+                if alpha < score < beta:
+                    if st is not None:
+                        st.pvs_researches += 1
+                    score = -self._alphabeta(board, depth - 1, -beta, -alpha, ply=ply + 1)
+
+            if sampled:
+                t0 = time.perf_counter()
             board.undo_move()
+            if sampled:
+                st.make_undo_sampled_time += time.perf_counter() - t0
+                st.make_undo_sampled_calls += 1
+            if st is not None:
+                st.make_undo_calls += 1
             
             if score > best_score:
                 best_score = score
                 best_move = move
             
-            alpha = max(alpha, score)
+            if score > alpha:
+                alpha = score
+                self._pv_table[ply] = [move] + self._pv_table[ply + 1]
             
             #beta cutoff
             if alpha >= beta:
+                if st is not None:
+                    st.record_cutoff(index)
+                if is_quiet:
+                    self._update_quiet(board, move, depth, ply, quiets_tried)
                 break
+            if is_quiet:
+                quiets_tried.append(move)
         
-        #store the best move at the root
-        if root:
-            self.best_move = best_move
+        if best_move == NO_MOVE:
+            if in_check:
+                return -MATE_SCORE + ply  #pefers shorter checkmates
+            return DRAW_SCORE
+        
+        #store the best move at the root, a root that failed low only has upper bounds so the
+        #move from the last search is kept until the widened window finds a real one
+        if root and (best_score > alpha_orig or self._root_best == NO_MOVE):
+            self._root_best = best_move
         
         #transposition table store
         flag = EXACT
@@ -294,17 +734,59 @@ class Engine:
         elif best_score >= beta:
             flag = LOWER
         
-        self.tt.store(board.zobrist_hash, depth, best_score, flag, best_move)
+        self.tt.store(board.zobrist_hash, depth, score_to_tt(best_score, ply), flag, best_move)
         
         return best_score
     
+    @staticmethod
+    def _has_pieces(board: Board, color: int) -> bool:
+        #anything besides pawns and the king
+        pieces = board.piece_bb[KNIGHT] | board.piece_bb[BISHOP] | board.piece_bb[ROOK] | board.piece_bb[QUEEN]
+        return bool(pieces & board.color_bb[color])
+
+    def _update_quiet(self, board: Board, move: int, depth: int, ply: int, tried: List[int]) -> None:
+        #a quiet move caused a beta cutoff, it becomes a killer and the counter to the last move
+        #its history goes up by depth squared and the quiet moves tried before it go down as much
+        #h += bonus - h * |bonus| / HISTORY_MAX is the gravity term, scores near the cap move less
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+
+        last = board.last_move()
+        if last != NO_MOVE:
+            last_to = (last >> 6) & 63
+            self.countermoves[board.squares[last_to]][last_to] = move
+
+        history = self.history[board.side_to_move]
+        bonus = min(depth * depth, HISTORY_MAX)
+        i = move & 4095 #from * 64 + to
+        history[i] += bonus - history[i] * bonus // HISTORY_MAX
+        for other in tried:
+            i = other & 4095
+            history[i] += -bonus - history[i] * bonus // HISTORY_MAX
+
     def _quiescence(self, board: Board, alpha: int, beta: int, depth: int) -> int:
         #helps prevent ustable positions
         #try to search forcing moves like captures
         self.nodes += 1
+        if not self.nodes & CHECK_MASK:
+            self._check_stop()
+
+        st = self.stats
+        sampled = st is not None and not self.nodes & st.sample_mask
+        if st is not None:
+            st.qs_nodes += 1
+            st.eval_calls += 1
         
         #stand pat evaluation
-        stand_pat = evaluate(board)
+        if sampled:
+            t0 = time.perf_counter()
+            stand_pat = evaluate(board)
+            st.eval_sampled_time += time.perf_counter() - t0
+            st.eval_sampled_calls += 1
+        else:
+            stand_pat = evaluate(board)
         
         if depth == 0:
             return stand_pat
@@ -315,18 +797,58 @@ class Engine:
         if alpha < stand_pat:
             alpha = stand_pat
         
-        #only search captures in quiescence
-        moves = generate_legal_moves(board)
-        captures = [m for m in moves if (m.is_ep or board.squares[m.to_sq] != 0)]
-        
-        captures.sort(key=lambda m: mvv_lva_score(board, m), reverse=True)
+        #only search captures and promotions in quiescence
+        if st is not None:
+            st.movegen_calls += 1
+        if sampled:
+            t0 = time.perf_counter()
+            moves = generate_captures(board)
+            st.movegen_sampled_time += time.perf_counter() - t0
+            st.movegen_sampled_calls += 1
+        else:
+            moves = generate_captures(board)
+
+        #skip captures that cant reach alpha (delta pruning) and ones that lose material once
+        #all the recaptures are played out, see only runs when the attacker is worth more than the victim
+        #promotions are always searched
+        scored = []
+        squares = board.squares
+        for move in moves:
+            kind = move >> 14
+            if kind != MOVE_PROMO:
+                victim = SEE_VALUE[PAWN] if kind == MOVE_EP else SEE_VALUE[abs(squares[(move >> 6) & 63])]
+                if stand_pat + victim + DELTA_MARGIN <= alpha:
+                    if st is not None:
+                        st.delta_prunes += 1
+                    continue
+                if victim < SEE_VALUE[abs(squares[move & 63])] and see(board, move) < 0:
+                    if st is not None:
+                        st.see_prunes += 1
+                    continue
+            scored.append((mvv_lva_score(board, move), move))
+        scored.sort(reverse=True, key=lambda x: x[0])
+        captures = [move for _, move in scored]
         
-        for move in captures:
-            board.make_move(move)
-            score = -self._quiescence(board, -beta, -alpha, depth - 1)
-            board.undo_move()
+        for index, move in enumerate(captures):
+            if sampled:
+                t0 = time.perf_counter()
+                board.make_move(move)
+                t1 = time.perf_counter()
+                score = -self._quiescence(board, -beta, -alpha, depth - 1)
+                t2 = time.perf_counter()
+                board.undo_move()
+                st.make_undo_sampled_time += (t1 - t0) + (time.perf_counter() - t2)
+                st.make_undo_sampled_calls += 1
+            else:
+                board.make_move(move)
+                score = -self._quiescence(board, -beta, -alpha, depth - 1)
+                board.undo_move()
+            if st is not None:
+                st.make_undo_calls += 1
             
             if score >= beta:
+                if st is not None:
+                    st.record_cutoff(index)
                 return beta
             if score > alpha:
                 alpha = score
@@ -335,4 +857,4 @@ class Engine:
     
     def chose_move(self, board: Board) -> Optional[Move]:
         #UI entry point
-        return self.search(board, depth=5)
\ No newline at end of file
+        return self.search(board, depth=5, movetime=self.move_time)
\ No newline at end of file
@@ -0,0 +1,221 @@
+import argparse
+import json
+import multiprocessing as mp
+import sys
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from board import Board
+from san import move_to_san, parse_san
+
+#epd test suites (WAC, STS, ...) run over a pool of worker processes
+#an epd line is the first four FEN fields followed by operations like  bm Qg6; id "WAC.001";
+#the file is read one line at a time so suites of any size stream through the pool, every worker keeps its
+#own Engine and starts each position with a fresh transposition table
+#run with: python3 epd.py wac.epd --movetime 1000 --workers 4
+
+_ctx = mp.get_context("spawn")
+
+
+def parse_operations(text: str) -> Dict[str, List[str]]:
+    #opcode -> operands, quoted operands keep their spaces and semicolons, only a ; outside quotes ends
+    #an operation
+    ops: Dict[str, List[str]] = {}
+    current: List[str] = []
+    token: List[str] = []
+    started = False #token has begun, an empty "" operand still counts
+    quoted = False
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        i += 1
+        if quoted:
+            if ch == "\\" and i < len(text):
+                token.append(text[i])
+                i += 1
+            elif ch == '"':
+                quoted = False
+            else:
+                token.append(ch)
+        elif ch == '"':
+            quoted = started = True
+        elif ch.isspace() or ch == ";":
+            if started:
+                current.append("".join(token))
+                token, started = [], False
+            if ch == ";" and current:
+                ops[current[0]] = current[1:]
+                current = []
+        else:
+            token.append(ch)
+            started = True
+    if started:
+        current.append("".join(token))
+    if current:
+        ops[current[0]] = current[1:]
+    return ops
+
+
+def parse_epd(line: str) -> Tuple[Board, Dict[str, List[str]]]:
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError(f"epd needs 4 position fields: {line!r}")
+    ops = parse_operations(fields[4]) if len(fields) > 4 else {}
+    halfmove = ops.get("hmvc", ["0"])[0]
+    fullmove = ops.get("fmvn", ["1"])[0]
+    board = Board.from_fen(" ".join(fields[:4] + [halfmove, fullmove]))
+    return board, ops
+
+
+def read_epd(path: str) -> Iterator[Tuple[int, str]]:
+    #(line number, line) for every position in the file, blank lines and # comments are skipped
+    with open(path) as fh:
+        for number, line in enumerate(fh, 1):
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield number, line
+
+
+@dataclass
+class EpdResult:
+    line: int
+    id: str
+    fen: str
+    best: List[str] = field(default_factory=list) #bm moves in san
+    avoid: List[str] = field(default_factory=list) #am moves in san
+    move: str = ""
+    solved: bool = False
+    time_to_solve_ms: Optional[int] = None #start of the run of iterations that ended on a right move
+    depth: int = 0
+    nodes: int = 0
+    time_ms: int = 0
+    error: str = ""
+
+
+#one engine per worker process, made by _init_worker
+_engine = None
+
+
+def _init_worker(hash_mb: int) -> None:
+    global _engine
+    from engine import Engine
+    _engine = Engine(hash_mb=hash_mb)
+
+
+def _solve(task: Tuple[int, str, Optional[int], Optional[int], Optional[int]]) -> EpdResult:
+    number, line, movetime, nodes, depth = task
+    result = EpdResult(line=number, id="", fen="")
+    try:
+        board, ops = parse_epd(line)
+        result.fen = board.to_fen()
+        result.id = " ".join(ops.get("id", []))
+        best = [parse_san(board, text) for text in ops.get("bm", [])]
+        avoid = [parse_san(board, text) for text in ops.get("am", [])]
+        result.best = [move_to_san(board, m) for m in best]
+        result.avoid = [move_to_san(board, m) for m in avoid]
+    except ValueError as exc:
+        result.error = str(exc)
+        return result
+
+    def right(move: int) -> bool:
+        return (not best or move in best) and move not in avoid
+
+    iterations: List[Tuple[int, int]] = [] #(time ms, best move) after each depth
+    _engine.on_iteration = lambda info: iterations.append((info.time_ms, info.pv[0].code if info.pv else 0))
+    _engine.new_game()
+    start = time.perf_counter()
+    found = _engine.search(board, depth=depth, movetime=movetime, nodes=nodes)
+    result.time_ms = int((time.perf_counter() - start) * 1000)
+    result.nodes = _engine.nodes
+    result.depth = _engine.completed_depth
+    if found is None:
+        return result
+    result.move = move_to_san(board, found.code)
+    result.solved = right(found.code)
+    if result.solved:
+        #the solution time is when the engine switched to a right move for good
+        result.time_to_solve_ms = result.time_ms
+        for time_ms, move in reversed(iterations):
+            if not right(move):
+                break
+            result.time_to_solve_ms = time_ms
+    return result
+
+
+def run(
+    path: str,
+    workers: int = 1,
+    movetime: Optional[int] = None,
+    nodes: Optional[int] = None,
+    depth: Optional[int] = None,
+    hash_mb: int = 16,
+    verbose: bool = True,
+) -> dict:
+    #runs the suite and returns the totals, results come back in file order while the pool keeps working
+    if movetime is None and nodes is None and depth is None:
+        movetime = 1000
+    tasks = ((number, line, movetime, nodes, depth) for number, line in read_epd(path))
+    results: List[EpdResult] = []
+    start = time.perf_counter()
+    with _ctx.Pool(workers, initializer=_init_worker, initargs=(hash_mb,)) as pool:
+        for result in pool.imap(_solve, tasks):
+            results.append(result)
+            if verbose:
+                if result.error:
+                    status = f"error: {result.error}"
+                else:
+                    status = "ok  " if result.solved else "FAIL"
+                    want = " ".join(result.best) or "not " + " ".join(result.avoid)
+                    status += f" {result.move:<8} want {want:<12} depth {result.depth:>2} {result.time_ms:>6}ms"
+                    if result.time_to_solve_ms is not None:
+                        status += f" solved at {result.time_to_solve_ms}ms"
+                print(f"{result.id or result.line:<12} {status}", flush=True)
+    wall = time.perf_counter() - start
+
+    scored = [r for r in results if not r.error]
+    solved = [r for r in scored if r.solved]
+    cpu = sum(r.time_ms for r in scored) / 1000
+    total_nodes = sum(r.nodes for r in scored)
+    summary = {
+        "positions": len(scored),
+        "errors": len(results) - len(scored),
+        "solved": len(solved),
+        "solve_rate": len(solved) / len(scored) if scored else 0.0,
+        "mean_time_to_solve_ms": (sum(r.time_to_solve_ms for r in solved) / len(solved)) if solved else None,
+        "nodes": total_nodes,
+        "search_seconds": round(cpu, 3),
+        "wall_seconds": round(wall, 3),
+        "nps": int(total_nodes / cpu) if cpu else 0,
+        #strength per cost, positions solved for every second the workers spent searching
+        "solved_per_cpu_second": len(solved) / cpu if cpu else 0.0,
+        "results": [asdict(r) for r in results],
+    }
+    if verbose:
+        mean = summary["mean_time_to_solve_ms"]
+        print(f"solved {len(solved)}/{len(scored)} ({summary['solve_rate'] * 100:.1f}%)"
+              f"{f', mean time to solve {mean:.0f}ms' if mean is not None else ''}")
+        print(f"{total_nodes} nodes in {cpu:.2f}s of search ({wall:.2f}s wall, {workers} workers), "
+              f"{summary['nps']} nps, {summary['solved_per_cpu_second']:.3f} solved per cpu second")
+    return summary
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="run an epd test suite (bm / am) over a pool of engines")
+    parser.add_argument("path")
+    parser.add_argument("--workers", type=int, default=max(1, mp.cpu_count()))
+    parser.add_argument("--movetime", type=int, help="ms per position (default 1000 when no other limit is given)")
+    parser.add_argument("--nodes", type=int, help="node budget per position")
+    parser.add_argument("--depth", type=int, help="fixed depth per position")
+    parser.add_argument("--hash", type=int, default=16, help="transposition table size in MB for each worker")
+    parser.add_argument("--json", help="write the totals and every result to this file")
+    args = parser.parse_args()
+    summary = run(args.path, args.workers, args.movetime, args.nodes, args.depth, args.hash)
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(summary, fh, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
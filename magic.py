@@ -0,0 +1,255 @@
+import os
+import random
+import sys
+import time
+from array import array
+from typing import List, Tuple
+
+#magic bitboards for sliding pieces
+#the relevant blockers of a square are masked out of the occupancy, multiplied by a magic number
+#and the top bits of the product index straight into a table of precomputed attack sets
+#the magic numbers below came from find_magics() with SEED, the search takes around 40s in python
+#so it is only rerun by hand (python magic.py --search), the attack tables are built from the magics
+#on first import and cached next to this file
+
+M64 = 0xFFFFFFFFFFFFFFFF
+
+CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "magics.bin")
+CACHE_VERSION = 1
+SEED = 20240601
+
+ROOK_MAGIC_NUMBERS = [
+    0x0280005280204004, 0x0440100040082002, 0x0080100020008009, 0x0600060090082040,
+    0x1200090200209004, 0x5C80018004000200, 0x0200008312004C08, 0x8200104481040222,
+    0x8000802080004000, 0x4000804000802000, 0x0008802000100084, 0x000A004010082202,
+    0x0000808008000400, 0x1280800200040080, 0x0642002200012894, 0x0001000080410022,
+    0x1680848008204006, 0x0050124020004001, 0x0000828010012003, 0x1008008080100008,
+    0x2044008008008004, 0xC001080120044010, 0x001044000801B002, 0x001802001E48810C,
+    0x0081400880008564, 0x4910004140002001, 0x7040200100410010, 0x0008100080080082,
+    0x0100100500080100, 0x0C04020080040080, 0x4000102400680201, 0x0020004200008401,
+    0x0080002000404000, 0x0010004000402010, 0x0000401101002002, 0x2001880184801000,
+    0x08A0800800800400, 0x020A008002801400, 0x0100021004000108, 0x000000890200004C,
+    0x0040224000858000, 0x0824200450004001, 0x0880200041010018, 0x0001041000090020,
+    0x0444008040080800, 0x0001000400490002, 0x0032010002008080, 0x02004440810A0004,
+    0x4082008100204200, 0x0800201000400040, 0x0A04802210420200, 0x0040810800500180,
+    0x0060440008008280, 0x0042000810040200, 0xC400100182080400, 0x0244008420510200,
+    0x0000208000110C41, 0x0001001020804001, 0x0A031D004010A001, 0x4208900061084501,
+    0x0442000804112002, 0x08420004013008A2, 0x400202A11002180C, 0x0000088044110022,
+]
+
+BISHOP_MAGIC_NUMBERS = [
+    0x0240021084090042, 0x0C08418404004600, 0x0004014202040120, 0x10680A0022008404,
+    0x8004042000000121, 0x0081042006000000, 0x0000881128A00500, 0x0422005208012804,
+    0x00420404102C0130, 0x320010D020808880, 0x0482082840408080, 0x04082C4101204010,
+    0x0820040420010000, 0x8100008804410200, 0x01A1010088200821, 0x2000009088882000,
+    0x0040A010040810B0, 0x4824C020010C0111, 0x8108082408102008, 0x0000842802004498,
+    0x2902201400A00081, 0x0505028080414000, 0x0142200400840400, 0x000021010C010410,
+    0x0020620110D42101, 0x4064044082080822, 0x1001064210008600, 0x0021080014004010,
+    0x0013011019004001, 0x8208020002412890, 0x300A2C1822108200, 0x0441010020208810,
+    0x0441300800D02104, 0x0041082010020400, 0x0808904400281800, 0x3800D10802040040,
+    0x1004104010840100, 0x0010108200202209, 0x00640802843220A4, 0x0004040028009480,
+    0x80C2100208102000, 0x1418820120001010, 0x0202001048004401, 0x0210020102422400,
+    0x4000200820815010, 0xA0400880A3004080, 0x80044C2C00500408, 0x0084A40400480020,
+    0x8042080202900010, 0x0006010402024400, 0x100E1A0200922800, 0x2002800884040005,
+    0x00020420E0410108, 0x2808A02510008300, 0x0020543006104810, 0x085010018534C000,
+    0x2241008800880420, 0x2000450068020800, 0x0800004080480820, 0x2000B84000420203,
+    0x8100087010020220, 0x0108003021034904, 0x2008500308610400, 0x102202082A0400C0,
+]
+
+ROOK_STEPS = ((-1, 0), (1, 0), (0, 1), (0, -1))
+BISHOP_STEPS = ((-1, -1), (1, -1), (1, 1), (-1, 1))
+
+
+def _attacks_slow(sq: int, occ: int, steps) -> int:
+    #walks every ray until it hits a piece or the edge, only used to fill the tables
+    r0, f0 = sq >> 3, sq & 7
+    bb = 0
+    for dr, df in steps:
+        r, f = r0 + dr, f0 + df
+        while 0 <= r < 8 and 0 <= f < 8:
+            bit = 1 << (r * 8 + f)
+            bb |= bit
+            if occ & bit:
+                break
+            r, f = r + dr, f + df
+    return bb
+
+def _relevant_mask(sq: int, steps) -> int:
+    #squares whose occupancy changes the attack set, the last square of each ray never matters
+    r0, f0 = sq >> 3, sq & 7
+    bb = 0
+    for dr, df in steps:
+        r, f = r0 + dr, f0 + df
+        while 0 <= r + dr < 8 and 0 <= f + df < 8:
+            bb |= 1 << (r * 8 + f)
+            r, f = r + dr, f + df
+    return bb
+
+def _subsets(mask: int) -> List[int]:
+    #every subset of mask using the carry rippler trick
+    out = []
+    sub = 0
+    while True:
+        out.append(sub)
+        sub = (sub - mask) & mask
+        if sub == 0:
+            return out
+
+def _find_magic(mask: int, occs: List[int], attacks: List[int], rnd: random.Random) -> int:
+    shift = 64 - mask.bit_count()
+    while True:
+        #sparse random numbers make good magics
+        magic = rnd.getrandbits(64) & rnd.getrandbits(64) & rnd.getrandbits(64)
+        if (((mask * magic) & M64) >> 56).bit_count() < 6:
+            continue
+        #most candidates collide within a few entries so a dict is cheaper than a full table per try
+        used = {}
+        for occ, att in zip(occs, attacks):
+            idx = ((occ * magic) & M64) >> shift
+            prev = used.setdefault(idx, att)
+            if prev != att:
+                break
+        else:
+            return magic
+
+def _build(steps, magics: List[int]) -> Tuple[List[int], List[int], List[int], List[List[int]]]:
+    masks, shifts, tables = [], [], []
+    for sq in range(64):
+        mask = _relevant_mask(sq, steps)
+        magic = magics[sq]
+        shift = 64 - mask.bit_count()
+        table = [0] * (1 << mask.bit_count())
+        for occ in _subsets(mask):
+            idx = ((occ * magic) & M64) >> shift
+            att = _attacks_slow(sq, occ, steps)
+            if table[idx] and table[idx] != att:
+                raise ValueError(f"magic for square {sq} has a harmful collision")
+            table[idx] = att
+        masks.append(mask)
+        shifts.append(shift)
+        tables.append(table)
+    return masks, list(magics), shifts, tables
+
+def find_magics(steps, rnd: random.Random) -> List[int]:
+    #brute force search for one working magic per square
+    magics = []
+    for sq in range(64):
+        mask = _relevant_mask(sq, steps)
+        occs = _subsets(mask)
+        attacks = [_attacks_slow(sq, occ, steps) for occ in occs]
+        magics.append(_find_magic(mask, occs, attacks, rnd))
+    return magics
+
+def _save_cache(path: str, rook, bishop) -> None:
+    #layout: version, 64 rook magics, 64 bishop magics, then every rook table and every bishop table
+    #masks and shifts are cheap to recompute so only the magics and tables are stored
+    data = array("Q", [CACHE_VERSION])
+    data.extend(rook[1])
+    data.extend(bishop[1])
+    for table in rook[3]:
+        data.extend(table)
+    for table in bishop[3]:
+        data.extend(table)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as fh:
+        data.tofile(fh)
+    os.replace(tmp, path)
+
+def _load_cache(path: str):
+    rook_masks = [_relevant_mask(sq, ROOK_STEPS) for sq in range(64)]
+    bishop_masks = [_relevant_mask(sq, BISHOP_STEPS) for sq in range(64)]
+    rook_sizes = [1 << m.bit_count() for m in rook_masks]
+    bishop_sizes = [1 << m.bit_count() for m in bishop_masks]
+    expected = 1 + 128 + sum(rook_sizes) + sum(bishop_sizes)
+
+    data = array("Q")
+    with open(path, "rb") as fh:
+        data.frombytes(fh.read())
+    if len(data) != expected or data[0] != CACHE_VERSION:
+        raise ValueError("stale magic cache")
+
+    flat = data.tolist()
+    rook_magics = flat[1:65]
+    bishop_magics = flat[65:129]
+    if rook_magics != ROOK_MAGIC_NUMBERS or bishop_magics != BISHOP_MAGIC_NUMBERS:
+        raise ValueError("magic cache built from other magics")
+    pos = 129
+    rook_tables, bishop_tables = [], []
+    for size in rook_sizes:
+        rook_tables.append(flat[pos:pos + size])
+        pos += size
+    for size in bishop_sizes:
+        bishop_tables.append(flat[pos:pos + size])
+        pos += size
+    rook = (rook_masks, rook_magics, [64 - m.bit_count() for m in rook_masks], rook_tables)
+    bishop = (bishop_masks, bishop_magics, [64 - m.bit_count() for m in bishop_masks], bishop_tables)
+    return rook, bishop
+
+def _init():
+    start = time.perf_counter()
+    try:
+        rook, bishop = _load_cache(CACHE_FILE)
+        source = "cache"
+    except (OSError, ValueError):
+        rook = _build(ROOK_STEPS, ROOK_MAGIC_NUMBERS)
+        bishop = _build(BISHOP_STEPS, BISHOP_MAGIC_NUMBERS)
+        source = "generated"
+        try:
+            _save_cache(CACHE_FILE, rook, bishop)
+        except OSError:
+            pass #read only install, just regenerate next time
+    seconds = time.perf_counter() - start
+    return rook, bishop, source, seconds
+
+_rook, _bishop, _source, _seconds = _init()
+
+#per square (mask, magic, shift, table) so a lookup is a single tuple unpack
+ROOK_MAGICS = list(zip(*_rook))
+BISHOP_MAGICS = list(zip(*_bishop))
+
+def rook_attacks(sq: int, occ: int) -> int:
+    mask, magic, shift, table = ROOK_MAGICS[sq]
+    return table[((occ & mask) * magic & M64) >> shift]
+
+def bishop_attacks(sq: int, occ: int) -> int:
+    mask, magic, shift, table = BISHOP_MAGICS[sq]
+    return table[((occ & mask) * magic & M64) >> shift]
+
+def queen_attacks(sq: int, occ: int) -> int:
+    return rook_attacks(sq, occ) | bishop_attacks(sq, occ)
+
+def table_info() -> dict:
+    #build time and memory of the lookup tables
+    #raw_bytes is what the tables take as packed 64-bit words (the cache file size)
+    #python_bytes is the real footprint of the lists and int objects held in memory
+    entries = sum(len(t) for t in _rook[3]) + sum(len(t) for t in _bishop[3])
+    python_bytes = 0
+    seen = set()
+    for tables in (_rook[3], _bishop[3]):
+        for table in tables:
+            python_bytes += sys.getsizeof(table)
+            for v in table:
+                if id(v) not in seen:
+                    seen.add(id(v))
+                    python_bytes += sys.getsizeof(v)
+    return {
+        "source": _source,
+        "seconds": _seconds,
+        "entries": entries,
+        "raw_bytes": entries * 8,
+        "python_bytes": python_bytes,
+    }
+
+if __name__ == "__main__":
+    if "--search" in sys.argv:
+        rnd = random.Random(SEED)
+        start = time.perf_counter()
+        for name, steps in (("ROOK", ROOK_STEPS), ("BISHOP", BISHOP_STEPS)):
+            print(f"{name}_MAGIC_NUMBERS =", [hex(m) for m in find_magics(steps, rnd)])
+        print(f"search took {time.perf_counter() - start:.1f} s")
+        sys.exit(0)
+
+    info = table_info()
+    print(f"magic tables {info['source']} in {info['seconds'] * 1000:.1f} ms")
+    print(f"{info['entries']} entries, {info['raw_bytes'] / 1024:.0f} KiB packed, "
+          f"{info['python_bytes'] / 1024:.0f} KiB as python objects")
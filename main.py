@@ -1,3 +1,5 @@
+import sys
+
 import pygame
 from ui import ChessUI
 from board import Board
@@ -9,6 +11,9 @@ def main():
 
     board = Board.start_position()
     engine = Engine()
+    #python3 main.py <book.bin> plays the openings from a polyglot book
+    if len(sys.argv) > 1:
+        engine.set_book(sys.argv[1])
 
     ui = ChessUI(board=board, engine=engine)
     ui.run()
@@ -0,0 +1,451 @@
+import argparse
+import math
+import multiprocessing as mp
+import random
+import sys
+import time
+from dataclasses import dataclass, field, fields
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from board import Board, START_FEN, WHITE, KNIGHT, BISHOP, KING, move_to_uci
+from movegen import generate_legal_moves, is_in_check
+from epd import parse_epd, read_epd
+from pgn import Game, format_game, read_games
+
+#self play matches between two engine configurations, for checking that a search or eval change gains elo
+#games are played by a pool of worker processes, each with one Engine for A and one for B, every opening is
+#played twice with the colors swapped and the finished games are written to a pgn file
+#the engine plays the same moves every time from the same position, so openings are spread out with a few
+#random plies and / or weighted picks from a polyglot book after the position from the openings file
+#after every game the score is turned into elo with a 95% error bar, the likelihood of superiority and the
+#log likelihood ratio of a sequential probability ratio test, which ends the match once it crosses a bound
+#a player is given as comma separated key=value pairs, search switches (lmr=off) and limits (nodes=20000)
+#run with: python3 match.py --a "" --b "lmr=off" --nodes 20000 --games 2000 --workers 4 --pgn match.pgn
+
+_ctx = mp.get_context("spawn")
+
+LIMITS = ("depth", "nodes", "movetime")
+
+
+@dataclass
+class Player:
+    name: str
+    options: Dict[str, bool] = field(default_factory=dict) #SearchOptions fields to change
+    limits: Dict[str, int] = field(default_factory=dict) #overrides the match limits for this side
+
+
+def parse_player(name: str, spec: str) -> Player:
+    from engine import SearchOptions
+    switches = {f.name for f in fields(SearchOptions)}
+    player = Player(name)
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        key, _, value = item.partition("=")
+        if key == "name":
+            player.name = value
+        elif key in LIMITS:
+            player.limits[key] = int(value)
+        elif key in switches:
+            if value not in ("on", "off"):
+                raise ValueError(f"{key} has to be on or off, not {value!r}")
+            player.options[key] = value == "on"
+        else:
+            raise ValueError(f"unknown player setting {key!r}, use name, {', '.join(LIMITS)} or "
+                             f"one of {', '.join(sorted(switches))}")
+    return player
+
+
+@dataclass
+class Adjudication:
+    #a side resigns when both engines agree it is lost by resign_cp for resign_moves moves each
+    resign_cp: int = 600
+    resign_moves: int = 3
+    #a draw is called after draw_after full moves once both scores stay within draw_cp for draw_moves moves each
+    draw_cp: int = 10
+    draw_moves: int = 8
+    draw_after: int = 40
+    max_plies: int = 400
+
+
+@dataclass
+class GameResult:
+    pair: int
+    a_white: bool
+    fen: str
+    moves: List[int]
+    opening_plies: int
+    result: str = "*"
+    reason: str = ""
+    nodes: int = 0
+
+
+def _insufficient(board: Board) -> bool:
+    #kings plus at most one knight or bishop, nobody can mate
+    minors = 0
+    for piece in board.squares:
+        p = abs(piece)
+        if p in (KNIGHT, BISHOP):
+            minors += 1
+        elif p and p != KING:
+            return False
+    return minors <= 1
+
+
+#(engine, search limits) for A and B in a worker process, made by _init_worker
+_engines = None
+_adjudication = None
+
+
+def _init_worker(players: Tuple[Player, Player], limits: Dict[str, int], hash_mb: int,
+                 adjudication: Adjudication) -> None:
+    global _engines, _adjudication
+    from engine import Engine
+    _engines = []
+    for player in players:
+        engine = Engine(hash_mb=hash_mb)
+        for name, value in player.options.items():
+            setattr(engine.options, name, value)
+        _engines.append((engine, {**limits, **player.limits}))
+    _adjudication = adjudication
+
+
+def _play(task: Tuple[int, bool, str, List[int]]) -> GameResult:
+    pair, a_white, fen, opening = task
+    adj = _adjudication
+    game = GameResult(pair, a_white, fen, list(opening), len(opening))
+    board = Board.from_fen(fen)
+    for move in opening:
+        board.make_move(move)
+    white, black = _engines if a_white else _engines[::-1]
+    for engine, _ in _engines:
+        engine.new_game()
+
+    last = []
+    #each side's own score in centipawns after its last few moves, None when a search gave no score
+    scores: Dict[int, List[Optional[int]]] = {WHITE: [], -WHITE: []}
+    while True:
+        stm = board.side_to_move
+        if not generate_legal_moves(board):
+            if is_in_check(board, stm):
+                game.result, game.reason = ("0-1" if stm == WHITE else "1-0"), "checkmate"
+            else:
+                game.result, game.reason = "1/2-1/2", "stalemate"
+            break
+        if board.is_repetition(2):
+            game.result, game.reason = "1/2-1/2", "threefold repetition"
+            break
+        if board.is_fifty_moves():
+            game.result, game.reason = "1/2-1/2", "fifty move rule"
+            break
+        if _insufficient(board):
+            game.result, game.reason = "1/2-1/2", "insufficient material"
+            break
+        if len(game.moves) >= adj.max_plies:
+            game.result, game.reason = "1/2-1/2", "adjudicated draw, game too long"
+            break
+
+        engine, limits = white if stm == WHITE else black
+        last.clear()
+        engine.on_iteration = last.append
+        best = engine.search(board, **limits)
+        game.nodes += engine.nodes
+        if best is None:
+            game.result, game.reason = "*", "no move from engine"
+            break
+        scores[stm].append(last[-1].score if last else None)
+        board.make_move(best.code)
+        game.moves.append(best.code)
+
+        own = scores[stm][-adj.resign_moves:]
+        other = scores[-stm][-adj.resign_moves:]
+        if (len(own) == adj.resign_moves and len(other) == adj.resign_moves
+                and all(s is not None and s <= -adj.resign_cp for s in own)
+                and all(s is not None and s >= adj.resign_cp for s in other)):
+            game.result = "0-1" if stm == WHITE else "1-0"
+            game.reason = f"{'White' if stm == WHITE else 'Black'} resigns"
+            break
+        own = scores[stm][-adj.draw_moves:]
+        other = scores[-stm][-adj.draw_moves:]
+        if (board.fullmove_number > adj.draw_after
+                and len(own) == adj.draw_moves and len(other) == adj.draw_moves
+                and all(s is not None and abs(s) <= adj.draw_cp for s in own + other)):
+            game.result, game.reason = "1/2-1/2", "adjudicated draw"
+            break
+    return game
+
+
+def openings(path: Optional[str], random_plies: int, book_path: Optional[str], book_plies: int,
+             rng: random.Random) -> Iterator[Tuple[str, List[int]]]:
+    #endless (start fen, opening moves), the file is read again from the top when it runs out
+    #a file ending in .pgn gives the start position and main line of every game, anything else is
+    #read as one epd / fen per line, with no file every opening starts from the start position
+    book = None
+    if book_path:
+        from book import OpeningBook
+        book = OpeningBook(book_path)
+    try:
+        while True:
+            found = False
+            for fen, moves in _read_openings(path):
+                found = True
+                yield _randomise(fen, moves, random_plies, book, book_plies, rng)
+            if not found:
+                raise ValueError(f"no openings in {path}")
+    finally:
+        if book is not None:
+            book.close()
+
+
+def _read_openings(path: Optional[str]) -> Iterator[Tuple[str, List[int]]]:
+    if path is None:
+        yield START_FEN, []
+    elif path.endswith(".pgn"):
+        with open(path, "rb") as fh:
+            for game in read_games(fh):
+                if not game.error:
+                    yield game.start_fen, game.moves
+    else:
+        for _, line in read_epd(path):
+            yield parse_epd(line)[0].to_fen(), []
+
+
+def _randomise(fen: str, moves: List[int], random_plies: int, book, book_plies: int,
+               rng: random.Random) -> Tuple[str, List[int]]:
+    board = Board.from_fen(fen)
+    moves = list(moves)
+    for move in moves:
+        board.make_move(move)
+    if book is not None:
+        for _ in range(book_plies):
+            move = book.pick(board, True, rng)
+            if not move:
+                break
+            board.make_move(move)
+            moves.append(move)
+    for _ in range(random_plies):
+        #never leave the game over or with only one way to go on
+        legal = [m for m in generate_legal_moves(board) if _playable(board, m)]
+        if not legal:
+            break
+        move = rng.choice(legal)
+        board.make_move(move)
+        moves.append(move)
+    return fen, moves
+
+
+def _playable(board: Board, move: int) -> bool:
+    board.make_move(move)
+    ok = len(generate_legal_moves(board)) > 1
+    board.undo_move()
+    return ok
+
+
+def elo(score: float) -> float:
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def expected_score(elo_diff: float) -> float:
+    return 1 / (1 + 10 ** (-elo_diff / 400))
+
+
+@dataclass
+class Tally:
+    #wins, draws and losses of A
+    wins: int = 0
+    draws: int = 0
+    losses: int = 0
+
+    @property
+    def games(self) -> int:
+        return self.wins + self.draws + self.losses
+
+    def add(self, score: float) -> None:
+        if score == 1:
+            self.wins += 1
+        elif score == 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    def _mean_var(self) -> Tuple[float, float]:
+        n = self.games
+        s = (self.wins + self.draws / 2) / n
+        var = (self.wins * (1 - s) ** 2 + self.draws * (0.5 - s) ** 2 + self.losses * s ** 2) / n
+        return s, var
+
+    def elo(self) -> Tuple[float, float]:
+        #elo difference and the half width of its 95% interval, the width is inf while the interval is
+        #unbounded (every game had the same result so far, or it reaches a score of 0 or 1)
+        if not self.games:
+            return 0.0, math.inf
+        s, var = self._mean_var()
+        margin = 1.96 * math.sqrt(var / self.games)
+        if var == 0 or s - margin <= 0 or s + margin >= 1:
+            return elo(s), math.inf
+        return elo(s), (elo(s + margin) - elo(s - margin)) / 2
+
+    def los(self) -> float:
+        #likelihood of superiority, the chance A is really the stronger, draws say nothing about it
+        decisive = self.wins + self.losses
+        if not decisive:
+            return 0.5
+        return 0.5 * (1 + math.erf((self.wins - self.losses) / math.sqrt(2 * decisive)))
+
+    def llr(self, elo0: float, elo1: float) -> float:
+        #generalised sprt log likelihood ratio of elo1 against elo0 from the trinomial results, the
+        #normal approximation fishtest uses with the draw rate taken from the games so far
+        if not self.games:
+            return 0.0
+        s, var = self._mean_var()
+        if var <= 0:
+            return 0.0
+        s0, s1 = expected_score(elo0), expected_score(elo1)
+        return (s1 - s0) * (2 * s - s0 - s1) / (2 * var / self.games)
+
+
+def sprt_bounds(alpha: float, beta: float) -> Tuple[float, float]:
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def _tasks(games: int, source: Iterator[Tuple[str, List[int]]]) -> Iterator[Tuple[int, bool, str, List[int]]]:
+    #both games of a pair are handed out together so a stopped match leaves few lone halves
+    for pair in range(games // 2):
+        fen, moves = next(source)
+        yield pair, True, fen, moves
+        yield pair, False, fen, moves
+
+
+def run(
+    a: Player,
+    b: Player,
+    games: int = 1000,
+    workers: int = 1,
+    limits: Optional[Dict[str, int]] = None,
+    hash_mb: int = 16,
+    openings_path: Optional[str] = None,
+    random_plies: int = 4,
+    book_path: Optional[str] = None,
+    book_plies: int = 8,
+    adjudication: Optional[Adjudication] = None,
+    sprt: Optional[Tuple[float, float, float, float]] = None,
+    pgn_path: Optional[str] = None,
+    seed: int = 0,
+    verbose: bool = True,
+) -> dict:
+    #plays up to games games (rounded down to pairs), sprt is (elo0, elo1, alpha, beta) and stops the match
+    #as soon as the llr leaves its bounds
+    limits = limits or {"nodes": 20000}
+    adjudication = adjudication or Adjudication()
+    rng = random.Random(seed)
+    source = openings(openings_path, random_plies, book_path, book_plies, rng)
+    bounds = sprt_bounds(sprt[2], sprt[3]) if sprt else None
+    tally = Tally()
+    verdict = ""
+    nodes = 0
+    out = open(pgn_path, "w") if pgn_path else None
+    start = time.perf_counter()
+    try:
+        with _ctx.Pool(workers, initializer=_init_worker, initargs=((a, b), limits, hash_mb, adjudication)) as pool:
+            for number, game in enumerate(pool.imap_unordered(_play, _tasks(games, source)), 1):
+                nodes += game.nodes
+                if game.result != "*":
+                    white_score = {"1-0": 1.0, "0-1": 0.0}.get(game.result, 0.5)
+                    tally.add(white_score if game.a_white else 1 - white_score)
+                if out is not None:
+                    _write(out, game, a, b, number)
+                line = ""
+                if verbose:
+                    diff, margin = tally.elo()
+                    line = (f"game {number:>5} {game.result:<7} {game.reason:<28} "
+                            f"+{tally.wins} ={tally.draws} -{tally.losses}  elo {diff:+.1f} +/- {margin:.1f}  "
+                            f"los {tally.los() * 100:.1f}%")
+                if bounds is not None:
+                    llr = tally.llr(sprt[0], sprt[1])
+                    line += f"  llr {llr:+.2f} ({bounds[0]:+.2f}, {bounds[1]:+.2f})"
+                    if llr <= bounds[0]:
+                        verdict = f"H0 accepted, {a.name} is not {sprt[1]:g} elo better than {b.name}"
+                    elif llr >= bounds[1]:
+                        verdict = f"H1 accepted, {a.name} is stronger than {b.name}"
+                if verbose:
+                    print(line, flush=True)
+                if verdict:
+                    #leaving the with block terminates the pool, the games still running are dropped
+                    break
+    finally:
+        if out is not None:
+            out.close()
+    elapsed = time.perf_counter() - start
+
+    diff, margin = tally.elo()
+    summary = {
+        "games": tally.games,
+        "wins": tally.wins,
+        "draws": tally.draws,
+        "losses": tally.losses,
+        "elo": round(diff, 2),
+        "elo_margin": round(margin, 2),
+        "los": round(tally.los(), 4),
+        "llr": round(tally.llr(sprt[0], sprt[1]), 3) if sprt else None,
+        "verdict": verdict,
+        "nodes": nodes,
+        "seconds": round(elapsed, 3),
+    }
+    if verbose:
+        print(f"{a.name} vs {b.name}: +{tally.wins} ={tally.draws} -{tally.losses} in {elapsed:.1f}s, "
+              f"elo {diff:+.1f} +/- {margin:.1f}, los {tally.los() * 100:.1f}%")
+        if sprt:
+            print(verdict or "sprt inconclusive, no bound reached")
+    return summary
+
+
+def _write(out, game: GameResult, a: Player, b: Player, number: int) -> None:
+    white, black = (a, b) if game.a_white else (b, a)
+    tags = {"Event": "match", "Site": "local", "Date": time.strftime("%Y.%m.%d"), "Round": str(number),
+            "White": white.name, "Black": black.name}
+    if game.fen != START_FEN:
+        tags["FEN"] = game.fen
+    tags["Opening"] = " ".join(move_to_uci(m) for m in game.moves[:game.opening_plies])
+    tags["Termination"] = "adjudication" if "adjudicated" in game.reason or "resigns" in game.reason else "normal"
+    out.write(format_game(Game(0, tags, game.moves, game.result), game.reason))
+    out.flush()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="play two engine configurations against each other")
+    parser.add_argument("--a", default="", help="player A, for example  name=new,nodes=20000")
+    parser.add_argument("--b", default="", help="player B, for example  name=old,lmr=off")
+    parser.add_argument("--games", type=int, default=1000, help="most games to play, played in pairs")
+    parser.add_argument("--workers", type=int, default=max(1, mp.cpu_count()))
+    parser.add_argument("--depth", type=int)
+    parser.add_argument("--nodes", type=int, help="node limit per move (default 20000 when no other limit is given)")
+    parser.add_argument("--movetime", type=int, help="ms per move")
+    parser.add_argument("--hash", type=int, default=16, help="transposition table size in MB for each engine")
+    parser.add_argument("--openings", help="epd / fen file, or a .pgn file, of start positions")
+    parser.add_argument("--random-plies", type=int, default=4, help="random moves played after each opening")
+    parser.add_argument("--book", help="polyglot book to extend the openings with weighted book moves")
+    parser.add_argument("--book-plies", type=int, default=8)
+    parser.add_argument("--sprt", nargs=2, type=float, metavar=("ELO0", "ELO1"), help="run an sprt, e.g. 0 5")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    parser.add_argument("--resign", type=int, default=600, help="resign score in centipawns, 0 turns it off")
+    parser.add_argument("--draw", type=int, default=10, help="draw score in centipawns, -1 turns it off")
+    parser.add_argument("--pgn", help="write the games to this file")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the opening randomisation")
+    args = parser.parse_args()
+
+    try:
+        a = parse_player("A", args.a)
+        b = parse_player("B", args.b)
+    except ValueError as exc:
+        parser.error(str(exc))
+    limits = {k: v for k, v in (("depth", args.depth), ("nodes", args.nodes), ("movetime", args.movetime))
+              if v is not None}
+    adjudication = Adjudication(resign_cp=args.resign or 10 ** 6, draw_cp=args.draw)
+    sprt = (args.sprt[0], args.sprt[1], args.alpha, args.beta) if args.sprt else None
+    run(a, b, args.games, args.workers, limits, args.hash, args.openings, args.random_plies, args.book,
+        args.book_plies, adjudication, sprt, args.pgn, args.seed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,11 +2,17 @@ from __future__ import annotations
 from typing import List
 
 from board import (
-    Board, Move, EMPTY,
+    Board, EMPTY, MOVE_CASTLE, MOVE_PROMO, MOVE_EP, PROMO_FLAG, EP_FLAG, CASTLE_FLAG,
     PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING,
     WHITE, BLACK, WK, WQ, BK, BQ,
     piece_color, abs_piece
 )
+from tables import (
+    KNIGHT_TARGETS, KING_TARGETS, PAWN_ATTACKS,
+    KNIGHT_BB, KING_BB, PAWN_ATTACK_BB, BETWEEN, LINE
+)
+from magic import bishop_attacks, rook_attacks, queen_attacks
+from pst import PIECE_VALUE
 # squares are in a 0-63 array each row is 8 squares long so moving down one is 8 sqares
 N = -8 #north / up
 S = 8 #south / down
@@ -17,6 +23,16 @@ SW = 7 #down left
 SE = 9 #down right
 NE = -7 #up right
 
+QUEEN_PROMO = (QUEEN,)
+ALL_PROMOS = (QUEEN, ROOK, BISHOP, KNIGHT)
+QUEEN_PROMO_CODE = ((QUEEN - KNIGHT) << 12) | PROMO_FLAG #or into a from / to code for a queen promotion
+
+#moves are 16 bit codes, see encode_move in board.py
+
+#piece values for static exchange evaluation indexed by piece type, the king is worth more than
+#everything else together so an exchange never ends with it captured
+SEE_VALUE = [0] + [PIECE_VALUE[pt] for pt in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN)] + [20000]
+
 KNIGHT_OFFSETS = (-17, -15, -10, -6, 6, 10, 15, 17) #offsets to move in a L shape 
 KING_OFFSETS = (N, S, E, W, NW, SW, SE, NE)
 
@@ -32,20 +48,324 @@ def on_board(sq: int) -> bool:
 def file_of(sq: int) -> int:
     return sq & 7
 
-def generate_legal_moves(board: Board) -> List[Move]:
-    #full list of leagle moves and check for king in check
-    moves = generate_pseudo_legal_moves(board)
-    legal :List[Move] = []
+def generate_legal_moves(board: Board, underpromotions: bool = False) -> List[int]:
+    #full list of leagal moves without trying each one on the board
+    #the engine only ever promotes to a queen, underpromotions=True adds knight bishop and rook promotions
+    #for reading other peoples moves (uci, pgn) and for perft
+    #checkers and pinned pieces are found once then every piece is limited to the squares it may legaly use
+    #moves come out in the same order as generate_pseudo_legal_moves so search results dont change
+    stm = board.side_to_move
+    squares = board.squares
+    us = board.color_bb[stm]
+    them = board.color_bb[-stm]
+    occ = board.occupied
+    moves: List[int] = []
+
+    king_sq = board.king_square(stm)
+    if king_sq is None:
+        return generate_pseudo_legal_moves(board, underpromotions)
+
+    checkers = attackers_to(board, king_sq, -stm, occ)
+
+    #squares a non king move has to land on, anything not ours normaly
+    #in check it has to capture the checker or block the line to the king
+    if checkers:
+        if checkers & (checkers - 1):
+            #double check only the king can move
+            _king_moves(board, moves, king_sq, stm, occ, False)
+            return moves
+        checker_sq = checkers.bit_length() - 1
+        target = checkers | BETWEEN[king_sq][checker_sq]
+    else:
+        target = ~us
+
+    pinned = _pinned(board, king_sq, us, them, occ)
+
+    bb = us
+    while bb:
+        lsb = bb & -bb
+        bb ^= lsb
+        sq = lsb.bit_length() - 1
+        pt = abs_piece(squares[sq])
+
+        allowed = target
+        if pinned & lsb:
+            allowed &= LINE[king_sq][sq]
+
+        if pt == PAWN:
+            _legal_pawn_moves(board, moves, sq, stm, allowed, king_sq, underpromotions)
+        elif pt == KNIGHT:
+            for to in KNIGHT_TARGETS[sq]:
+                if (1 << to) & allowed & ~us:
+                    moves.append(sq | (to << 6))
+        elif pt == BISHOP:
+            _slider(moves, sq, bishop_attacks(sq, occ) & ~us & allowed)
+        elif pt == ROOK:
+            _slider(moves, sq, rook_attacks(sq, occ) & ~us & allowed)
+        elif pt == QUEEN:
+            _slider(moves, sq, queen_attacks(sq, occ) & ~us & allowed)
+        elif pt == KING:
+            _king_moves(board, moves, sq, stm, occ, not checkers)
+
+    return moves
+
+def generate_captures(board: Board) -> List[int]:
+    #legal captures and queen promotions only, for quiescence
+    #same checker and pin handling as generate_legal_moves but every piece is limited to enemy squares
+    #(pawn pushes only to the last rank) so quiet moves are never built
     stm = board.side_to_move
+    squares = board.squares
+    us = board.color_bb[stm]
+    them = board.color_bb[-stm]
+    occ = board.occupied
+    moves: List[int] = []
 
-    for m in moves:
-        board.make_move(m)
-        if not is_in_check(board, stm):
-            legal.append(m)
-        board.undo_move()
+    king_sq = board.king_square(stm)
+    if king_sq is None:
+        return [m for m in generate_pseudo_legal_moves(board)
+                if m >> 14 == MOVE_EP or m >> 14 == MOVE_PROMO or squares[(m >> 6) & 63] != EMPTY]
+
+    checkers = attackers_to(board, king_sq, -stm, occ)
+
+    #target is where a non king move may land at all, captures have to land on an enemy piece as well
+    if checkers:
+        if checkers & (checkers - 1):
+            _king_captures(board, moves, king_sq, stm, occ, them)
+            return moves
+        target = checkers | BETWEEN[king_sq][checkers.bit_length() - 1]
+    else:
+        target = ~us
+
+    pinned = _pinned(board, king_sq, us, them, occ)
+
+    bb = us
+    while bb:
+        lsb = bb & -bb
+        bb ^= lsb
+        sq = lsb.bit_length() - 1
+        pt = abs_piece(squares[sq])
+
+        allowed = target
+        if pinned & lsb:
+            allowed &= LINE[king_sq][sq]
+
+        if pt == PAWN:
+            _pawn_captures(board, moves, sq, stm, allowed, king_sq)
+        elif pt == KNIGHT:
+            _slider(moves, sq, KNIGHT_BB[sq] & them & allowed)
+        elif pt == BISHOP:
+            _slider(moves, sq, bishop_attacks(sq, occ) & them & allowed)
+        elif pt == ROOK:
+            _slider(moves, sq, rook_attacks(sq, occ) & them & allowed)
+        elif pt == QUEEN:
+            _slider(moves, sq, queen_attacks(sq, occ) & them & allowed)
+        elif pt == KING:
+            _king_captures(board, moves, sq, stm, occ, them)
+
+    return moves
+
+def _pinned(board: Board, king_sq: int, us: int, them: int, occ: int) -> int:
+    #pinned pieces can only move along the line between their king and the pinning slider
+    piece_bb = board.piece_bb
+    pinned = 0
+    queens = piece_bb[QUEEN]
+    snipers = them & (
+        (rook_attacks(king_sq, 0) & (piece_bb[ROOK] | queens)) |
+        (bishop_attacks(king_sq, 0) & (piece_bb[BISHOP] | queens))
+    )
+    while snipers:
+        lsb = snipers & -snipers
+        snipers ^= lsb
+        blockers = BETWEEN[king_sq][lsb.bit_length() - 1] & occ
+        if blockers and not blockers & (blockers - 1) and blockers & us:
+            pinned |= blockers
+    return pinned
+
+def _king_captures(board: Board, moves: List[int], sq: int, stm: int, occ: int, them: int) -> None:
+    occ_without_king = occ ^ (1 << sq)
+    targets = KING_BB[sq] & them
+    while targets:
+        lsb = targets & -targets
+        targets ^= lsb
+        to = lsb.bit_length() - 1
+        if not attackers_to(board, to, -stm, occ_without_king):
+            moves.append(sq | (to << 6))
+
+def _pawn_captures(board: Board, moves: List[int], sq: int, stm: int, allowed: int, king_sq: int) -> None:
+    #_legal_pawn_moves without the quiet pushes, a push to the last rank is kept since it wins material too
+    squares = board.squares
+    foward = N if stm == WHITE else S
+    last_rank = (sq >> 3) == (1 if stm == WHITE else 6)
+
+    one = sq + foward
+    if last_rank and squares[one] == EMPTY and (1 << one) & allowed:
+        moves.append(sq | (one << 6) | QUEEN_PROMO_CODE)
 
+    for to in PAWN_ATTACKS[stm][sq]:
+        if squares[to] * stm < 0:
+            if (1 << to) & allowed:
+                moves.append(sq | (to << 6) | (QUEEN_PROMO_CODE if last_rank else 0))
+        elif to == board.ep_square:
+            cap_sq = to - foward
+            cap_bit = 1 << cap_sq
+            occ = (board.occupied ^ (1 << sq) ^ cap_bit) | (1 << to)
+            if not attackers_to(board, king_sq, -stm, occ) & ~cap_bit:
+                moves.append(sq | (to << 6) | EP_FLAG)
+
+def is_legal(board: Board, move: int) -> bool:
+    #checks a move that did not come from the generator for this position (transposition table
+    #and killer moves) without generating the full list, including its ep / castle / promo flags
+    stm = board.side_to_move
+    squares = board.squares
+    from_sq, to, kind = move & 63, (move >> 6) & 63, move >> 14
+    is_ep = kind == MOVE_EP
+    piece = squares[from_sq]
+    if piece * stm <= 0 or squares[to] * stm > 0:
+        return False
+    pt = abs_piece(piece)
+
+    if kind == MOVE_CASTLE:
+        return pt == KING and move in _castle_moves(board, from_sq, stm)
+    if pt == KING and abs(to - from_sq) == 2:
+        return False
+
+    if pt == PAWN:
+        foward = N if stm == WHITE else S
+        last_rank = (to >> 3) == (0 if stm == WHITE else 7)
+        if last_rank != (kind == MOVE_PROMO):
+            return False
+        if is_ep != (to == board.ep_square):
+            return False
+        if to in PAWN_ATTACKS[stm][from_sq]:
+            if not is_ep and squares[to] == EMPTY:
+                return False
+        elif to == from_sq + foward:
+            if squares[to] != EMPTY:
+                return False
+        elif to == from_sq + 2 * foward:
+            if (from_sq >> 3) != (6 if stm == WHITE else 1) or squares[from_sq + foward] != EMPTY or squares[to] != EMPTY:
+                return False
+        else:
+            return False
+    elif kind != 0:
+        return False
+    else:
+        occ = board.occupied
+        if pt == KNIGHT:
+            targets = KNIGHT_BB[from_sq]
+        elif pt == BISHOP:
+            targets = bishop_attacks(from_sq, occ)
+        elif pt == ROOK:
+            targets = rook_attacks(from_sq, occ)
+        elif pt == QUEEN:
+            targets = queen_attacks(from_sq, occ)
+        else:
+            targets = KING_BB[from_sq]
+        if not targets >> to & 1:
+            return False
+
+    #the move is possible, it is legal if it does not leave our king attacked
+    board.make_move(move)
+    legal = not is_in_check(board, stm)
+    board.undo_move()
     return legal
 
+def see(board: Board, move: int) -> int:
+    #static exchange evaluation, the material the side to move comes out with if both sides keep
+    #recapturing on the target square with their least valuable piece and either may stop when ahead
+    #attackers are found again after every capture so sliders lined up behind (x-rays) join in
+    squares = board.squares
+    piece_bb = board.piece_bb
+    from_sq = move & 63
+    to = (move >> 6) & 63
+    kind = move >> 14
+    stm = board.side_to_move
+
+    occ = board.occupied ^ (1 << from_sq)
+    if kind == MOVE_EP:
+        occ ^= 1 << (to + (8 if stm == WHITE else -8))
+        gain = [SEE_VALUE[PAWN]]
+    else:
+        gain = [SEE_VALUE[abs_piece(squares[to])]]
+    on_square = SEE_VALUE[abs_piece(squares[from_sq])]
+    if kind == MOVE_PROMO:
+        promo = ((move >> 12) & 3) + KNIGHT
+        gain[0] += SEE_VALUE[promo] - SEE_VALUE[PAWN]
+        on_square = SEE_VALUE[promo]
+
+    side = -stm
+    while True:
+        attackers = attackers_to(board, to, side, occ)
+        if not attackers:
+            break
+        for pt in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING):
+            bb = attackers & piece_bb[pt]
+            if bb:
+                break
+        #gain[i] is what the side making capture i is up by if the other side stops here
+        #when that side is behind whether it captures or not, neither choice changes the result
+        #and the capture is left out
+        gain.append(on_square - gain[-1])
+        if max(-gain[-2], gain[-1]) < 0:
+            gain.pop()
+            break
+        occ ^= bb & -bb
+        on_square = SEE_VALUE[pt]
+        side = -side
+
+    #walk back letting each side pick the better of capturing or standing pat
+    for i in range(len(gain) - 1, 0, -1):
+        gain[i - 1] = -max(-gain[i - 1], gain[i])
+    return gain[0]
+
+def _king_moves(board: Board, moves: List[int], sq: int, stm: int, occ: int, can_castle: bool) -> None:
+    #king steps are checked against the board with the king lifted off so it cant hide behind itself on a line
+    squares = board.squares
+    occ_without_king = occ ^ (1 << sq)
+    for to in KING_TARGETS[sq]:
+        if squares[to] * stm <= 0 and not attackers_to(board, to, -stm, occ_without_king):
+            moves.append(sq | (to << 6))
+    if can_castle:
+        moves.extend(_castle_moves(board, sq, stm))
+
+def _legal_pawn_moves(board: Board, moves: List[int], sq: int, stm: int, allowed: int, king_sq: int, underpromotions: bool = False) -> None:
+    #same moves as _pawn_moves but only to squares in allowed
+    squares = board.squares
+    foward = N if stm == WHITE else S
+    promo_rank = range(0, 8) if stm == WHITE else range(56, 64)
+    promos = ALL_PROMOS if underpromotions else QUEEN_PROMO
+
+    one = sq + foward
+    if squares[one] == EMPTY:
+        if (1 << one) & allowed:
+            if one in promo_rank:
+                for promo in promos:
+                    moves.append(sq | (one << 6) | ((promo - KNIGHT) << 12) | PROMO_FLAG)
+            else:
+                moves.append(sq | (one << 6))
+
+        if (sq >> 3) == (6 if stm == WHITE else 1):
+            two = one + foward
+            if squares[two] == EMPTY and (1 << two) & allowed:
+                moves.append(sq | (two << 6))
+
+    for to in PAWN_ATTACKS[stm][sq]:
+        if squares[to] * stm < 0:
+            if (1 << to) & allowed:
+                if to in promo_rank:
+                    for promo in promos:
+                        moves.append(sq | (to << 6) | ((promo - KNIGHT) << 12) | PROMO_FLAG)
+                else:
+                    moves.append(sq | (to << 6))
+        elif to == board.ep_square:
+            #en passant removes two pieces from the king's lines at once (including the rank case
+            #where both pawns sit between king and rook) so just check the king on the resulting occupancy
+            cap_sq = to - foward
+            cap_bit = 1 << cap_sq
+            occ = (board.occupied ^ (1 << sq) ^ cap_bit) | (1 << to)
+            if not attackers_to(board, king_sq, -stm, occ) & ~cap_bit:
+                moves.append(sq | (to << 6) | EP_FLAG)
+
 def is_in_check(board: Board, color: int) -> bool:
     #checks if king is in check and must be moved or blocked
     king_sq = board.king_square(color)
@@ -54,108 +374,90 @@ def is_in_check(board: Board, color: int) -> bool:
     return square_attacked(board, king_sq, -color)
 
 
+def attackers_to(board: Board, sq: int, by_color: int, occ: int) -> int:
+    #bitboard of every by_color piece attacking sq when the board has occupancy occ
+    #passing a modified occ lets callers ask what would be attacked after pieces move
+    piece_bb = board.piece_bb
+    queens = piece_bb[QUEEN]
+    attackers = (
+        (PAWN_ATTACK_BB[-by_color][sq] & piece_bb[PAWN]) |
+        (KNIGHT_BB[sq] & piece_bb[KNIGHT]) |
+        (KING_BB[sq] & piece_bb[KING]) |
+        (bishop_attacks(sq, occ) & (piece_bb[BISHOP] | queens)) |
+        (rook_attacks(sq, occ) & (piece_bb[ROOK] | queens))
+    )
+    return attackers & board.color_bb[by_color] & occ
+
 def square_attacked(board: Board, sq: int, by_color: int) -> bool:
     #checks if square can be attacked by opponent
-    f = file_of(sq)
-    #Pawn
-    if by_color == WHITE:
-        for d in (SW, SE):
-            to = sq + d
-            if on_board(to) and board.squares[to] == PAWN:
-                if abs(file_of(to) - f) == 1:
-                    return True
-    else:
-        for d in (NW, NE):
-            to = sq + d
-            if on_board(to) and board.squares[to] == -PAWN:
-                if abs(file_of(to) - f) == 1:
-                    return True
+    squares = board.squares
+    #Pawn, a pawn of by_color attacks sq from the squares a pawn of the other color on sq would attack
+    pawn = PAWN if by_color == WHITE else -PAWN
+    for to in PAWN_ATTACKS[-by_color][sq]:
+        if squares[to] == pawn:
+            return True
     #knights
     knight = KNIGHT if by_color == WHITE else -KNIGHT
-    for d in KNIGHT_OFFSETS:
-        to = sq + d
-        if on_board(to) and board.squares[to] == knight:
-            if abs(file_of(to) - f) <= 2:
-                return True
+    for to in KNIGHT_TARGETS[sq]:
+        if squares[to] == knight:
+            return True
+    #sliders use the magic lookups, any attacker of their color on the attack set is a hit
+    piece_bb = board.piece_bb
+    them = board.color_bb[by_color]
+    queens = piece_bb[QUEEN]
     #bishop / queen
-    for d in BISHOP_DIRS:
-        to = sq + d
-        while on_board(to) and abs(file_of(to) - file_of(to - d)) == 1:
-            p = board.squares[to]
-            if p:
-                if piece_color(p) == by_color and abs_piece(p) in (BISHOP, QUEEN):
-                    return True
-                break
-            to += d
+    if bishop_attacks(sq, board.occupied) & (piece_bb[BISHOP] | queens) & them:
+        return True
 
     #rook / queen
-    for d in ROOK_DIRS:
-        to = sq + d
-        while on_board(to) and (d in (N, S) or abs(file_of(to) - file_of(to - d)) == 1):
-            p = board.squares[to]
-            if p:
-                if piece_color(p) == by_color and abs_piece(p) in (ROOK, QUEEN):
-                    return True
-                break
-            to += d
+    if rook_attacks(sq, board.occupied) & (piece_bb[ROOK] | queens) & them:
+        return True
 
     #king
     king = KING if by_color == WHITE else -KING
-    for d in KING_OFFSETS:
-        to = sq + d
-        if on_board(to) and board.squares[to] == king:
-            if abs(file_of(to) - f) <= 1:
-                return True
+    for to in KING_TARGETS[sq]:
+        if squares[to] == king:
+            return True
 
     return False           
 
-def generate_pseudo_legal_moves(board: Board) -> List[Move]:
+def generate_pseudo_legal_moves(board: Board, underpromotions: bool = False) -> List[int]:
     #generates all leagal moves with out checking for any checks
-    moves: List[Move] = []
+    #walks the side to move's piece list so empty and enemy squares are never visited
+    moves: List[int] = []
     stm = board.side_to_move
+    squares = board.squares
+    not_own = ~board.color_bb[stm]
 
-    for sq, piece in enumerate(board.squares):
-        if piece == EMPTY or piece_color(piece) != stm:
-            continue
-
+    for sq in sorted(board.piece_lists[stm]):
+        piece = squares[sq]
         pt = abs_piece(piece)
-        f = file_of(sq)
 
         if pt == PAWN:
-            moves.extend(_pawn_moves(board, sq, piece))
+            moves.extend(_pawn_moves(board, sq, piece, underpromotions))
         elif pt == KNIGHT:
-            for d in KNIGHT_OFFSETS:
-                to = sq + d
-                if not on_board(to):
-                    continue
-                if abs(file_of(to) - f) > 2:
-                    continue
-                if board.squares[to] * stm <= 0:
-                    moves.append(Move(sq, to))
+            for to in KNIGHT_TARGETS[sq]:
+                if squares[to] * stm <= 0:
+                    moves.append(sq | (to << 6))
         elif pt == BISHOP:
-            moves.extend(_slider(board, sq, stm, BISHOP_DIRS))
+            _slider(moves, sq, bishop_attacks(sq, board.occupied) & not_own)
         elif pt == ROOK: 
-            moves.extend(_slider(board, sq, stm, ROOK_DIRS))
+            _slider(moves, sq, rook_attacks(sq, board.occupied) & not_own)
         elif pt == QUEEN:
-            moves.extend(_slider(board, sq, stm, QUEEN_DIRS))
+            _slider(moves, sq, queen_attacks(sq, board.occupied) & not_own)
         elif pt == KING:
-            for d in KING_OFFSETS:
-                to = sq + d
-                if not on_board(to):
-                    continue
-                if abs(file_of(to) - f) > 1:
-                    continue
-                if board.squares[to] * stm <= 0: 
-                    moves.append(Move(sq, to))
+            for to in KING_TARGETS[sq]:
+                if squares[to] * stm <= 0: 
+                    moves.append(sq | (to << 6))
             moves.extend(_castle_moves(board, sq, stm))
 
     return moves
 
-def _pawn_moves(board: Board, sq: int, pawn: int) -> List[Move]:
+def _pawn_moves(board: Board, sq: int, pawn: int, underpromotions: bool = False) -> List[int]:
     #pawns are difrent becasue they can only move foward but attack sideways 
-    moves: List[Move] = []
+    moves: List[int] = []
     stm = piece_color(pawn)
-    f = file_of(sq)
+    promos = ALL_PROMOS if underpromotions else QUEEN_PROMO
 
     foward = N if stm == WHITE else S
     start_rank = range(48, 56) if stm == WHITE else range(8, 16)
@@ -164,57 +466,40 @@ def _pawn_moves(board: Board, sq: int, pawn: int) -> List[Move]:
     one = sq + foward
     if on_board(one) and board.squares[one] == EMPTY:
         if one in promo_rank:
-            moves.append(Move(sq, one, promo=QUEEN))
+            for promo in promos:
+                moves.append(sq | (one << 6) | ((promo - KNIGHT) << 12) | PROMO_FLAG)
         else:
-            moves.append(Move(sq, one))
+            moves.append(sq | (one << 6))
 
         if sq in start_rank:
             two = one + foward
             if board.squares[two] == EMPTY:
-                moves.append(Move(sq, two))
-
-    #Captures and En passant and promotion only to queen as the chance to promote to something else is extremly rare
-    for d in (foward - 1, foward + 1):
-        to = sq + d
-        if not on_board(to):
-            continue
-        if abs(file_of(to) - f) != 1:
-            continue
+                moves.append(sq | (two << 6))
 
+    #Captures and En passant and promotion only to queen unless asked as the chance to promote to something else is extremly rare
+    for to in PAWN_ATTACKS[stm][sq]:
         if board.squares[to] * stm < 0:
             if to in promo_rank:
-                moves.append(Move(sq, to, promo=QUEEN))
+                for promo in promos:
+                    moves.append(sq | (to << 6) | ((promo - KNIGHT) << 12) | PROMO_FLAG)
             else:
-                moves.append(Move(sq, to))
+                moves.append(sq | (to << 6))
         elif to == board.ep_square:
-            moves.append(Move(sq, to, is_ep=True))
+            moves.append(sq | (to << 6) | EP_FLAG)
 
     return moves
     
-def _slider(board: Board, sq: int, stm: int, dirs) -> List[Move]:
+def _slider(moves: List[int], sq: int, targets: int) -> None:
     #used for bishop rook and queen where they can move in a line wether its diagonal or straight or both
-    moves: List[Move] = []
-    f = file_of(sq)
-
-    for d in dirs:
-        to = sq + d
-        while on_board(to) and (
-            d in (N, S) or abs(file_of(to) - file_of(to - d)) == 1
-        ):
-            p = board.squares[to]
-            if p == EMPTY:
-                moves.append(Move(sq, to))
-            else:
-                if piece_color(p) != stm:
-                    moves.append(Move(sq, to))
-                break
-            to += d
-
-    return moves
+    #targets is the magic attack set with our own pieces already masked off, one move per set bit
+    while targets:
+        lsb = targets & -targets
+        moves.append(sq | ((lsb.bit_length() - 1) << 6))
+        targets ^= lsb
     
-def _castle_moves(board: Board, sq: int, stm: int) -> List[Move]:
+def _castle_moves(board: Board, sq: int, stm: int) -> List[int]:
     #defines where pieces move when castling and checks to make sure they are not attacked squares
-    moves: List[Move] = []
+    moves: List[int] = []
     
     if stm == WHITE and sq == 60:
         if board.castling_rights & WK:
@@ -222,13 +507,13 @@ def _castle_moves(board: Board, sq: int, stm: int) -> List[Move]:
                 if not square_attacked(board, 60, BLACK) and \
                     not square_attacked(board, 61, BLACK) and \
                     not square_attacked(board, 62, BLACK):
-                        moves.append(Move(60, 62, is_castle=True))
+                        moves.append(60 | (62 << 6) | CASTLE_FLAG)
         if board.castling_rights & WQ:
             if board.squares[59] == board.squares[58] == board.squares[57] == EMPTY:
                 if not square_attacked(board, 60, BLACK) and \
                     not square_attacked(board, 59, BLACK) and \
                     not square_attacked(board, 58, BLACK):
-                        moves.append(Move(60, 58, is_castle=True))
+                        moves.append(60 | (58 << 6) | CASTLE_FLAG)
         
     elif stm == BLACK and sq == 4:
         if board.castling_rights & BK:
@@ -236,13 +521,13 @@ def _castle_moves(board: Board, sq: int, stm: int) -> List[Move]:
                 if not square_attacked(board, 4, WHITE) and \
                     not square_attacked(board, 5, WHITE) and \
                     not square_attacked(board, 6, WHITE):
-                        moves.append(Move(4, 6, is_castle=True))
+                        moves.append(4 | (6 << 6) | CASTLE_FLAG)
         if board.castling_rights & BQ:
             if board.squares[2] == board.squares[3] == board.squares[1] == EMPTY:
                 if not square_attacked(board, 4, WHITE) and \
                     not square_attacked(board, 3, WHITE) and \
                     not square_attacked(board, 2, WHITE):
-                        moves.append(Move(4, 2, is_castle=True))
+                        moves.append(4 | (2 << 6) | CASTLE_FLAG)
 
     return moves
 
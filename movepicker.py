@@ -0,0 +1,123 @@
+from typing import Iterator, List, Optional
+
+from board import Board, NO_MOVE, MOVE_PROMO, MOVE_EP
+from movegen import generate_legal_moves, generate_captures, is_legal, see, SEE_VALUE
+from pst import PIECE_VALUE
+
+#move ordering for the main search, moves are the 16 bit codes from board.encode_move
+#MovePicker hands out moves one stage at a time and only generates / sorts a stage once the earlier
+#ones failed to cut, so a node where the transposition table move or the first capture refutes
+#never generates its quiet moves at all
+
+#stages in the order they are tried
+STAGE_TT, STAGE_GOOD_CAPTURES, STAGE_KILLERS, STAGE_QUIETS, STAGE_BAD_CAPTURES, STAGE_DONE = range(6)
+
+
+def mvv_lva_score(board: Board, move: int) -> int:
+    #Most Valuable Victim - Least Valuable Aggressor or mvv-lva
+    #orders captures and queen > pawn over pawn > queen and helps improve alpha beta pruning
+    if move >> 14 == MOVE_EP:
+        return 1000  #EP captures are usualy good
+
+    victim = board.squares[(move >> 6) & 63]
+    if victim == 0:
+        return 0
+
+    attacker = abs(board.squares[move & 63])
+    return PIECE_VALUE[abs(victim)] - attacker
+
+
+def is_quiet(board: Board, move: int) -> bool:
+    #not a capture and not a promotion, castling counts as quiet
+    kind = move >> 14
+    return kind != MOVE_PROMO and kind != MOVE_EP and board.squares[(move >> 6) & 63] == 0
+
+
+def _losing_capture(board: Board, move: int) -> bool:
+    #see only runs when the attacker is worth more than the victim, anything else cant lose material
+    if move >> 14 == MOVE_PROMO or move >> 14 == MOVE_EP:
+        return False
+    squares = board.squares
+    if SEE_VALUE[abs(squares[(move >> 6) & 63])] >= SEE_VALUE[abs(squares[move & 63])]:
+        return False
+    return see(board, move) < 0
+
+
+class MovePicker:
+    #iterate over it to get the legal moves of board in search order:
+    #   transposition table move, checked with is_legal instead of generating anything
+    #   captures and promotions that dont lose material, by mvv-lva
+    #   killers and the counter move
+    #   the other quiet moves by history score
+    #   losing captures, by see
+    #stage says which stage the last move came from
+    def __init__(
+        self,
+        board: Board,
+        tt_move: int = NO_MOVE,
+        killers: Optional[List[int]] = None,
+        history: Optional[List[int]] = None,
+        countermove: int = NO_MOVE,
+    ):
+        self.board = board
+        self.tt_move = tt_move
+        self.killers = killers
+        self.history = history
+        self.countermove = countermove
+        self.stage = STAGE_TT
+
+    def __iter__(self) -> Iterator[int]:
+        board = self.board
+        tt_move = self.tt_move
+
+        self.stage = STAGE_TT
+        if tt_move != NO_MOVE and is_legal(board, tt_move):
+            yield tt_move
+        else:
+            tt_move = NO_MOVE
+
+        self.stage = STAGE_GOOD_CAPTURES
+        good = []
+        bad = []
+        for move in generate_captures(board):
+            if move == tt_move:
+                continue
+            if _losing_capture(board, move):
+                bad.append((see(board, move), move))
+            else:
+                good.append((mvv_lva_score(board, move), move))
+        good.sort(reverse=True, key=lambda x: x[0])
+        for _, move in good:
+            yield move
+
+        #killers and the counter move were legal quiet moves somewhere else at this ply,
+        #here they might not be legal or might capture now so they are checked first
+        self.stage = STAGE_KILLERS
+        special: List[int] = []
+        candidates = list(self.killers) if self.killers is not None else []
+        candidates.append(self.countermove)
+        for move in candidates:
+            if (move == NO_MOVE or move == tt_move or move in special
+                    or not is_quiet(board, move) or not is_legal(board, move)):
+                continue
+            special.append(move)
+            yield move
+
+        self.stage = STAGE_QUIETS
+        history = self.history
+        quiets = []
+        for move in generate_legal_moves(board):
+            if not is_quiet(board, move) or move == tt_move or move in special:
+                continue
+            #from * 64 + to is just the low 12 bits of the code
+            quiets.append((history[move & 4095] if history is not None else 0, move))
+        quiets.sort(reverse=True, key=lambda x: x[0])
+        for _, move in quiets:
+            yield move
+
+        self.stage = STAGE_BAD_CAPTURES
+        bad.sort(reverse=True, key=lambda x: x[0])
+        for _, move in bad:
+            yield move
+
+        self.stage = STAGE_DONE
@@ -0,0 +1,144 @@
+import argparse
+import json
+import sys
+import time
+from typing import Dict, List, Tuple
+
+from board import Board, START_FEN, move_to_uci
+from movegen import generate_legal_moves
+
+#perft counts every leaf of the legal move tree to a fixed depth, the totals for well known positions are
+#published so any difference means a bug in generate_legal_moves or in make_move / undo_move
+#underpromotions are always generated here since the reference counts include them
+
+#(name, fen, {depth: nodes})
+REFERENCE_POSITIONS: List[Tuple[str, str, Dict[int, int]]] = [
+    ("startpos", START_FEN,
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ("position4-mirrored", "r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1",
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     {1: 44, 2: 1486, 3: 62379}),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     {1: 46, 2: 2079, 3: 89890}),
+    #edge cases
+    ("illegal-ep-1", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1", {6: 1134888}),
+    ("illegal-ep-2", "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1", {6: 1015133}),
+    ("ep-gives-check", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1", {6: 1440467}),
+    ("short-castle-check", "5k2/8/8/8/8/8/8/4K2R w K - 0 1", {6: 661072}),
+    ("long-castle-check", "3k4/8/8/8/8/8/8/R3K3 w Q - 0 1", {6: 803711}),
+    ("castle-rights", "r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1", {4: 1274206}),
+    ("castle-prevented", "r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1", {4: 1720476}),
+    ("promote-out-of-check", "2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1", {6: 3821001}),
+    ("discovered-check", "8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1", {5: 1004658}),
+    ("promote-to-give-check", "4k3/1P6/8/8/8/8/K7/8 w - - 0 1", {6: 217342}),
+    ("underpromote-to-check", "8/P1k5/K7/8/8/8/8/8 w - - 0 1", {6: 92683}),
+    ("self-stalemate", "K1k5/8/P7/8/8/8/8/8 w - - 0 1", {6: 2217}),
+    ("stalemate-checkmate", "8/k1P5/8/1K6/8/8/8/8 w - - 0 1", {7: 567584}),
+    ("double-check", "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1", {4: 23527}),
+]
+
+
+def perft(board: Board, depth: int) -> int:
+    #bulk counts at the last ply, the moves there are counted but never made
+    moves = generate_legal_moves(board, underpromotions=True)
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        board.make_move(move)
+        nodes += perft(board, depth - 1)
+        board.undo_move()
+    return nodes
+
+
+def divide(board: Board, depth: int) -> List[Tuple[int, int]]:
+    #perft split by root move, comparing this against another engine finds the bad branch
+    out = []
+    for move in generate_legal_moves(board, underpromotions=True):
+        board.make_move(move)
+        out.append((move, perft(board, depth - 1)))
+        board.undo_move()
+    return out
+
+
+def run_position(fen: str, depth: int, show_divide: bool = False) -> dict:
+    board = Board.from_fen(fen)
+    start = time.perf_counter()
+    if show_divide:
+        split = divide(board, depth)
+        nodes = sum(n for _, n in split)
+    else:
+        split = []
+        nodes = perft(board, depth)
+    seconds = time.perf_counter() - start
+    result = {
+        "fen": fen,
+        "depth": depth,
+        "nodes": nodes,
+        "seconds": round(seconds, 4),
+        "nps": int(nodes / seconds) if seconds > 0 else 0,
+    }
+    if show_divide:
+        result["divide"] = {move_to_uci(m): n for m, n in split}
+    return result
+
+
+def run_suite(max_nodes: int) -> List[dict]:
+    #runs every reference count that is at most max_nodes
+    results = []
+    for name, fen, counts in REFERENCE_POSITIONS:
+        for depth, expected in sorted(counts.items()):
+            if expected > max_nodes:
+                continue
+            result = run_position(fen, depth)
+            result["name"] = name
+            result["expected"] = expected
+            result["ok"] = result["nodes"] == expected
+            results.append(result)
+            status = "ok" if result["ok"] else f"FAIL expected {expected}"
+            print(f"{name:<22} depth {depth} {result['nodes']:>10} {result['seconds']:>8.2f}s "
+                  f"{result['nps']:>9} nps  {status}")
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="perft, divide and the reference perft suite")
+    parser.add_argument("--fen", default=START_FEN)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--divide", action="store_true", help="print the node count under each root move")
+    parser.add_argument("--suite", action="store_true", help="check the built in reference positions")
+    parser.add_argument("--max-nodes", type=int, default=1_500_000, help="skip suite entries bigger than this")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    if args.suite:
+        results = run_suite(args.max_nodes)
+        total_nodes = sum(r["nodes"] for r in results)
+        total_time = sum(r["seconds"] for r in results)
+        failed = [r for r in results if not r["ok"]]
+        print(f"{len(results) - len(failed)}/{len(results)} ok, {total_nodes} nodes in {total_time:.2f}s, "
+              f"{int(total_nodes / total_time) if total_time else 0} nps")
+        summary = {"results": results, "nodes": total_nodes, "seconds": round(total_time, 4)}
+    else:
+        result = run_position(args.fen, args.depth, args.divide)
+        for move, nodes in result.get("divide", {}).items():
+            print(f"{move}: {nodes}")
+        print(f"nodes {result['nodes']} time {result['seconds']:.2f}s nps {result['nps']}")
+        failed = []
+        summary = result
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(summary, fh, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
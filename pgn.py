@@ -0,0 +1,191 @@
+import re
+from dataclasses import dataclass, field
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+from board import Board, START_FEN, WHITE
+from san import move_to_san, parse_san
+
+#pgn reading, games come out of read_games one at a time so files of any size stream through in
+#constant memory, only the movetext of the game being parsed is held
+#comments, variations and NAGs are skipped, the main line is replayed on a Board so every move is legal
+#format_game goes the other way and writes a Game back out as pgn text
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+#the seven tag roster, written first and in this order
+ROSTER = ("Event", "Site", "Date", "Round", "White", "Black", "Result")
+LINE_WIDTH = 80
+
+_TAG_RE = re.compile(r'^\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+_MOVE_NUMBER_RE = re.compile(r"^\d+\.+")
+
+
+@dataclass
+class Game:
+    offset: int #byte offset of the game's first line in the file, seek there to read it again
+    tags: Dict[str, str] = field(default_factory=dict)
+    moves: List[int] = field(default_factory=list) #main line as move codes from start_fen
+    result: str = "*"
+    error: str = "" #set when a move could not be read, moves holds everything before it
+
+    @property
+    def start_fen(self) -> str:
+        return self.tags.get("FEN", START_FEN)
+
+    def board(self) -> Board:
+        return Board.from_fen(self.start_fen)
+
+
+def _tokens(movetext: str) -> Iterator[str]:
+    #san moves and the result of the main line
+    depth = 0 #variation nesting
+    i = 0
+    n = len(movetext)
+    while i < n:
+        ch = movetext[i]
+        if ch == "{":
+            end = movetext.find("}", i)
+            i = n if end < 0 else end + 1
+            continue
+        if ch == ";":
+            end = movetext.find("\n", i)
+            i = n if end < 0 else end + 1
+            continue
+        if ch == "(":
+            depth += 1
+            i += 1
+            continue
+        if ch == ")":
+            depth = max(0, depth - 1)
+            i += 1
+            continue
+        if ch.isspace():
+            i += 1
+            continue
+        start = i
+        while i < n and not movetext[i].isspace() and movetext[i] not in "{;()":
+            i += 1
+        token = movetext[start:i]
+        if depth or token.startswith("$"):
+            continue
+        #move numbers, they can be glued to the move too (12.e4, 12...Nf6)
+        token = _MOVE_NUMBER_RE.sub("", token)
+        if token:
+            yield token
+
+
+def _parse(offset: int, tag_lines: List[str], movetext: str) -> Game:
+    game = Game(offset)
+    for line in tag_lines:
+        match = _TAG_RE.match(line)
+        if match:
+            game.tags[match.group(1)] = match.group(2).replace('\\"', '"').replace("\\\\", "\\")
+    try:
+        board = game.board()
+    except ValueError as exc:
+        game.error = f"bad FEN tag: {exc}"
+        return game
+    for token in _tokens(movetext):
+        if token in RESULTS:
+            game.result = token
+            break
+        try:
+            move = parse_san(board, token)
+        except ValueError as exc:
+            game.error = str(exc)
+            break
+        board.make_move(move)
+        game.moves.append(move)
+    if game.result == "*" and game.tags.get("Result") in RESULTS:
+        game.result = game.tags["Result"]
+    return game
+
+
+def _ends_in_comment(line: str, in_comment: bool) -> bool:
+    #is a { } comment still open at the end of line
+    for ch in line:
+        if in_comment:
+            if ch == "}":
+                in_comment = False
+        elif ch == "{":
+            in_comment = True
+        elif ch == ";":
+            break #rest of the line is a comment, braces in it dont count
+    return in_comment
+
+
+def read_games(fh: BinaryIO) -> Iterator[Game]:
+    #fh is opened in binary mode so the offsets are real byte positions, reading starts wherever fh is
+    tag_lines: List[str] = []
+    movetext: List[str] = []
+    offset: Optional[int] = None
+    in_comment = False #inside a { } comment that runs over several lines
+    while True:
+        pos = fh.tell()
+        raw = fh.readline()
+        if not raw:
+            break
+        line = raw.decode("utf-8", errors="replace").strip()
+        if in_comment:
+            #a wrapped comment can have lines starting with [ (a [%clk 0:01:02] annotation), they are not tags
+            movetext.append(line)
+            in_comment = _ends_in_comment(line, True)
+            continue
+        if line.startswith("%"):
+            continue #escape line
+        if line.startswith("["):
+            if movetext:
+                #tags after movetext start the next game
+                yield _parse(offset, tag_lines, "\n".join(movetext))
+                tag_lines, movetext, offset = [], [], None
+            if offset is None:
+                offset = pos
+            tag_lines.append(line)
+        elif line:
+            if offset is None:
+                offset = pos
+            movetext.append(line)
+            in_comment = _ends_in_comment(line, False)
+    if movetext or tag_lines:
+        yield _parse(offset if offset is not None else 0, tag_lines, "\n".join(movetext))
+
+
+def format_game(game: Game, comment: str = "") -> str:
+    #pgn text for game, comment goes after the last move (how the game ended for example)
+    tags = dict(game.tags)
+    tags["Result"] = game.result
+    if game.start_fen != START_FEN:
+        tags["SetUp"] = "1"
+    lines = []
+    for name in ROSTER:
+        lines.append(_tag_line(name, tags.pop(name, "?")))
+    for name, value in tags.items():
+        lines.append(_tag_line(name, value))
+    lines.append("")
+
+    board = game.board()
+    words = []
+    for i, move in enumerate(game.moves):
+        if board.side_to_move == WHITE or i == 0:
+            number = board.fullmove_number
+            words.append(f"{number}." if board.side_to_move == WHITE else f"{number}...")
+        words.append(move_to_san(board, move))
+        board.make_move(move)
+    if comment:
+        words.append("{" + comment.replace("}", ")") + "}")
+    words.append(game.result)
+
+    line = ""
+    for word in words:
+        if line and len(line) + 1 + len(word) > LINE_WIDTH:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    lines.append(line)
+    return "\n".join(lines) + "\n\n"
+
+
+def _tag_line(name: str, value: str) -> str:
+    value = value.replace("\\", "\\\\").replace('"', '\\"')
+    return f'[{name} "{value}"]'
@@ -0,0 +1,114 @@
+from typing import List
+
+#material values and piece square tables shared by Board (which keeps running totals of them)
+#and engine.evaluate
+
+# Material values
+PIECE_VALUE = {
+    1: 100, #pawn
+    2: 320, #knight
+    3: 330, #bishop
+    4: 500, #rook
+    5: 900, #queen
+    6: 0, #king
+}
+
+#Piece square tables from whites perspective
+#This helps encourage places that a piece should move twards for exaple knights are more powerfull in the cernter
+#of the board becasue they have more spaces to move to compared to the edges 
+PAWN_PST = [
+    0, 0, 0, 0, 0, 0, 0, 0,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    10, 10, 20, 30, 30, 20, 10, 10,
+    5, 5, 10, 25, 25, 10, 5, 5,
+    0, 0, 0, 20, 20, 0, 0, 0,
+    5, -5, -10, 0, 0, -10, -5, 5,
+    5, 10, 10, -20, -20, 10, 10, 5,
+    0, 0, 0, 0, 0, 0, 0, 0,
+]
+
+KNIGHT_PST = [
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20, 0, 0, 0, 0, -20, -40,
+    -30, 0, 10, 15, 15, 10, 0, -30,
+    -30, 5, 15, 20, 20, 15, 5, -30,
+    -30, 0, 15, 20, 20, 15, 0, -30,
+    -30, 5, 10, 15, 15, 10, 5, -30,
+    -40, -20, 0, 5, 5, 0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50
+]
+
+BISHOP_PST = [
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 10, 10, 5, 0, -10,
+    -10, 5, 5, 10, 10, 5, 5, -10,
+    -10, 0, 10, 10, 10, 10, 0, -10,
+    -10, 10, 10, 10, 10, 10, 10, -10,
+    -10, 5, 0, 0, 0, 0, 5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20
+]
+
+ROOK_PST = [
+    0, 0, 0, 0, 0, 0, 0, 0,
+    5, 10, 10, 10, 10, 10, 10, 5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    0, 0, 0, 5, 5, 0, 0, 0
+]
+
+QUEEN_PST = [
+    -20, -10, -10, -5, -5, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 5, 5, 5, 0, -10,
+    -5, 0, 5, 5, 5, 5, 0, -5,
+    0, 0, 5, 5, 5, 5, 0, -5,
+    -10, 5, 5, 5, 5, 5, 0, -10,
+    -10, 0, 5, 0, 0, 0, 0, -10,
+    -20, -10, -10, -5, -5, -10, -10, -20
+]
+#adds more king saftey in the mid game
+#and allows for more movement in endgames 
+KING_PST_MG = [
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+    20, 20, 0, 0, 0, 0, 20, 20,
+    20, 30, 10, 0, 0, 10, 30, 20
+]
+KING_PST_EG = [
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10, 0, 0, -10, -20, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -30, 0, 0, 0, 0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50
+]
+
+#game phase weights, the phase is 24 with all minor and major pieces on the board and 0 with none
+#midgame scores get weight phase/24 and endgame scores the rest so the king table blends smoothly
+PHASE_WEIGHT = {1: 0, 2: 1, 3: 1, 4: 2, 5: 4, 6: 0}
+MAX_PHASE = 24
+
+_PST_BY_TYPE_MG = {1: PAWN_PST, 2: KNIGHT_PST, 3: BISHOP_PST, 4: ROOK_PST, 5: QUEEN_PST, 6: KING_PST_MG}
+_PST_BY_TYPE_EG = {1: PAWN_PST, 2: KNIGHT_PST, 3: BISHOP_PST, 4: ROOK_PST, 5: QUEEN_PST, 6: KING_PST_EG}
+
+def _signed_tables(by_type) -> List[List[int]]:
+    #material plus pst for each signed piece from whites point of view, black pieces are mirrored and negative
+    #13 slots indexed by the piece itself so table[-3] (slot 10) is a black bishop
+    out: List[List[int]] = [[0] * 64 for _ in range(13)]
+    for pt, pst in by_type.items():
+        out[pt] = [PIECE_VALUE[pt] + pst[sq] for sq in range(64)]
+        out[-pt] = [-(PIECE_VALUE[pt] + pst[63 - sq]) for sq in range(64)]
+    return out
+
+PST_MG = _signed_tables(_PST_BY_TYPE_MG)
+PST_EG = _signed_tables(_PST_BY_TYPE_EG)
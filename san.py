@@ -0,0 +1,93 @@
+import re
+from typing import List, Optional
+
+from board import Board, EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, FILES, MOVE_CASTLE, MOVE_PROMO, MOVE_EP
+from board import square_name, parse_square
+from movegen import generate_legal_moves, is_in_check
+
+#standard algebraic notation (Nf3, exd5, O-O, e8=Q+), what pgn files and epd bm / am operations use
+#moves are matched against generate_legal_moves so anything returned is legal in the position
+
+SAN_PIECES = {"N": KNIGHT, "B": BISHOP, "R": ROOK, "Q": QUEEN, "K": KING, "P": PAWN}
+SAN_LETTERS = {piece: letter for letter, piece in SAN_PIECES.items()}
+#promotion codes count from the knight, bits 12-13 of the move
+PROMO_ORDER = "NBRQ"
+
+_SAN_RE = re.compile(r"^([NBRQKP])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$")
+
+
+def move_to_san(board: Board, move: int, legal: Optional[List[int]] = None) -> str:
+    #legal can be passed in when the caller already has the legal moves of board
+    frm = move & 63
+    to = (move >> 6) & 63
+    kind = move >> 14
+    if kind == MOVE_CASTLE:
+        text = "O-O" if to & 7 == 6 else "O-O-O"
+    else:
+        piece = abs(board.squares[frm])
+        capture = kind == MOVE_EP or board.squares[to] != EMPTY
+        if piece == PAWN:
+            text = (FILES[frm & 7] + "x" if capture else "") + square_name(to)
+            if kind == MOVE_PROMO:
+                text += "=" + PROMO_ORDER[(move >> 12) & 3]
+        else:
+            if legal is None:
+                legal = generate_legal_moves(board, underpromotions=True)
+            #other pieces of the same kind that can also reach to, only as much of the from square as
+            #it takes to tell them apart
+            others = [m & 63 for m in legal
+                      if (m >> 6) & 63 == to and m & 63 != frm and abs(board.squares[m & 63]) == piece]
+            text = SAN_LETTERS[piece]
+            if others:
+                if all(sq & 7 != frm & 7 for sq in others):
+                    text += FILES[frm & 7]
+                elif all(sq >> 3 != frm >> 3 for sq in others):
+                    text += str(8 - (frm >> 3))
+                else:
+                    text += square_name(frm)
+            text += ("x" if capture else "") + square_name(to)
+
+    board.make_move(move)
+    if is_in_check(board, board.side_to_move):
+        text += "#" if not generate_legal_moves(board) else "+"
+    board.undo_move()
+    return text
+
+
+def parse_san(board: Board, text: str, legal: Optional[List[int]] = None) -> int:
+    #the legal move code for a san string, check marks and annotations (+ # ! ?) are ignored and
+    #castling can be written with zeros, raises ValueError for illegal or ambiguous moves
+    if legal is None:
+        legal = generate_legal_moves(board, underpromotions=True)
+    clean = text.rstrip("+#!?").replace("0", "O")
+    if clean in ("O-O", "O-O-O"):
+        file = 6 if clean == "O-O" else 2
+        for move in legal:
+            if move >> 14 == MOVE_CASTLE and (move >> 6) & 7 == file:
+                return move
+        raise ValueError(f"illegal move {text!r}")
+
+    match = _SAN_RE.match(clean)
+    if match is None:
+        raise ValueError(f"bad move {text!r}")
+    letter, from_file, from_rank, target, promo = match.groups()
+    piece = SAN_PIECES[letter] if letter else PAWN
+    to = parse_square(target)
+    found = []
+    for move in legal:
+        frm = move & 63
+        if (move >> 6) & 63 != to or abs(board.squares[frm]) != piece or move >> 14 == MOVE_CASTLE:
+            continue
+        if from_file is not None and FILES[frm & 7] != from_file:
+            continue
+        if from_rank is not None and str(8 - (frm >> 3)) != from_rank:
+            continue
+        if move >> 14 == MOVE_PROMO:
+            if promo is None or PROMO_ORDER[(move >> 12) & 3] != promo:
+                continue
+        elif promo is not None:
+            continue
+        found.append(move)
+    if len(found) == 1:
+        return found[0]
+    raise ValueError(f"{'ambiguous' if found else 'illegal'} move {text!r}")
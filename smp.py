@@ -0,0 +1,157 @@
+import argparse
+import multiprocessing as mp
+import queue
+import time
+from typing import List, Optional
+
+from board import Board
+from transposition import TranspositionTable
+
+#lazy smp helpers for Engine
+#each helper is a separate process (python threads cant run the search in parallel) holding its own Engine
+#attached to the main engine's shared memory transposition table, they search the same root position
+#with shuffled root moves and staggered depths and everything they learn reaches the main search through the table
+#spawn is used instead of fork so it is safe to start helpers from a process that already runs threads (uci)
+_ctx = mp.get_context("spawn")
+
+
+def _helper_main(helper_id: int, tt_name: str, size_mb: int, tasks, results, stop_event) -> None:
+    from engine import Engine, MAX_DEPTH
+    import random
+
+    tt = TranspositionTable.attach(tt_name, size_mb)
+    engine = Engine(tt=tt)
+    engine.helper_id = helper_id
+    engine._rng = random.Random(helper_id)
+    engine.stop_event = stop_event
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            board, depth, generation, options, tablebase_path = task
+            tt.generation = generation
+            engine.options = options
+            if tablebase_path != engine.tablebase_path:
+                engine.set_tablebases(tablebase_path)
+            engine.nodes = 0
+            try:
+                engine.search(board, min(depth + (helper_id & 1), MAX_DEPTH))
+            finally:
+                #the main search waits for one result per helper, it has to come even if the search failed
+                results.put(engine.nodes)
+    finally:
+        engine.set_tablebases(None)
+        tt.close()
+
+
+class HelperPool:
+    def __init__(self, tt: TranspositionTable, count: int):
+        self.count = count
+        self.stop_event = _ctx.Event()
+        self._tt_name = tt.name
+        self._size_mb = tt.size_mb
+        #one task queue and one result queue per helper, a helper that died is replaced with fresh ones
+        #so nothing it left behind is read by a later search
+        self.tasks = [None] * count
+        self.results = [None] * count
+        self.procs = [None] * count
+        for i in range(count):
+            self._spawn(i)
+        self._running = False
+
+    def _spawn(self, i: int) -> None:
+        old = self.procs[i]
+        if old is not None:
+            old.join(timeout=1)
+        self.tasks[i] = _ctx.Queue()
+        self.results[i] = _ctx.Queue()
+        p = _ctx.Process(
+            target=_helper_main,
+            args=(i + 1, self._tt_name, self._size_mb, self.tasks[i], self.results[i], self.stop_event),
+            daemon=True,
+        )
+        p.start()
+        self.procs[i] = p
+
+    def start(self, board: Board, depth: int, generation: int, options, tablebase_path: Optional[str] = None) -> None:
+        self.stop_event.clear()
+        for i in range(self.count):
+            if not self.procs[i].is_alive():
+                self._spawn(i)
+            self.tasks[i].put((board, depth, generation, options, tablebase_path))
+        self._running = True
+
+    def stop(self) -> int:
+        #stops every helper and returns how many nodes they searched together
+        if not self._running:
+            return 0
+        self.stop_event.set()
+        nodes = 0
+        for i in range(self.count):
+            while True:
+                try:
+                    nodes += self.results[i].get(timeout=1)
+                    break
+                except queue.Empty:
+                    #a helper that died never answers, it is started again on the next search
+                    if not self.procs[i].is_alive():
+                        break
+        self._running = False
+        return nodes
+
+    def close(self) -> None:
+        self.stop()
+        for q in self.tasks:
+            q.put(None)
+        for p in self.procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+        self.procs = []
+
+
+#positions for measuring smp scaling, a mix of opening, middlegame and endgame
+BENCH_FENS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+]
+
+
+def bench(worker_counts: List[int], depth: int, hash_mb: int, fens: Optional[List[str]] = None) -> None:
+    #time to depth and node throughput (main plus helpers) for each worker count
+    fens = fens or BENCH_FENS
+    from engine import Engine
+    print(f"{'workers':>7} {'time s':>8} {'nodes':>10} {'nps':>9} {'speedup':>8}")
+    base_time = None
+    for workers in worker_counts:
+        engine = Engine(hash_mb=hash_mb, threads=workers)
+        total_time = 0.0
+        total_nodes = 0
+        try:
+            #first search starts the helper processes, dont count their startup
+            engine.search(Board.from_fen(fens[0]), 1)
+            for fen in fens:
+                engine.tt.clear()
+                board = Board.from_fen(fen)
+                start = time.perf_counter()
+                engine.search(board, depth)
+                total_time += time.perf_counter() - start
+                total_nodes += engine.nodes + engine.helper_nodes
+        finally:
+            engine.close()
+        if base_time is None:
+            base_time = total_time
+        nps = total_nodes / total_time if total_time else 0
+        print(f"{workers:>7} {total_time:>8.2f} {total_nodes:>10} {nps:>9.0f} {base_time / total_time:>7.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="measure lazy smp time to depth and throughput")
+    parser.add_argument("--workers", default="1,2,4,8,16", help="comma separated worker counts")
+    parser.add_argument("--depth", type=int, default=5)
+    parser.add_argument("--hash", type=int, default=64, help="transposition table size in MB")
+    args = parser.parse_args()
+    bench([int(w) for w in args.workers.split(",")], args.depth, args.hash)
@@ -0,0 +1,117 @@
+import copy
+from dataclasses import dataclass, field
+from typing import List
+
+from transposition import EXACT, LOWER, UPPER
+
+#search statistics filled in by Engine._alphabeta and Engine._quiescence when Engine.collect_stats is on
+#each search starts a fresh SearchStats in Engine.stats, with collect_stats off (the default) Engine.stats is None
+#and the search skips all of this behind one None check per counter site
+#timings are sampled, only nodes where nodes & sample_mask == 0 are timed and the totals are scaled up
+#from the share of calls that were sampled, so the overhead stays low even with stats on
+
+CUTOFF_SLOTS = 16 #cutoffs on move index 15 or later all land in the last slot
+
+
+@dataclass
+class SearchStats:
+    sample_mask: int = 63
+
+    main_nodes: int = 0
+    qs_nodes: int = 0
+
+    tt_probes: int = 0
+    tt_hits: int = 0
+    tt_cutoffs: List[int] = field(default_factory=lambda: [0, 0, 0]) #indexed by EXACT LOWER UPPER
+
+    beta_cutoffs: int = 0
+    pvs_researches: int = 0 #null window searches that beat alpha and were searched again in full
+    aspiration_researches: int = 0 #root searches repeated with a wider window
+
+    #selective search, see SearchOptions in engine.py
+    null_move_cutoffs: int = 0
+    lmr_researches: int = 0 #reduced searches that beat alpha and were searched again at full depth
+    reverse_futility_prunes: int = 0
+    razor_prunes: int = 0
+    delta_prunes: int = 0 #quiescence captures skipped because they cant reach alpha
+    see_prunes: int = 0 #quiescence captures skipped because they lose material
+    repetition_draws: int = 0 #nodes scored as a draw by repetition or the fifty move rule
+    upcoming_repetitions: int = 0 #nodes where the side to move could force a repetition
+    tb_hits: int = 0 #positions scored from the endgame tablebases
+    cutoff_index: List[int] = field(default_factory=lambda: [0] * CUTOFF_SLOTS)
+
+    #calls is every call, sampled_calls / sampled_time only the timed ones
+    movegen_calls: int = 0
+    movegen_sampled_calls: int = 0
+    movegen_sampled_time: float = 0.0
+    eval_calls: int = 0
+    eval_sampled_calls: int = 0
+    eval_sampled_time: float = 0.0
+    make_undo_calls: int = 0
+    make_undo_sampled_calls: int = 0
+    make_undo_sampled_time: float = 0.0
+
+    #nodes used by each finished iteration, in order
+    iteration_nodes: List[int] = field(default_factory=list)
+
+    def record_cutoff(self, index: int) -> None:
+        self.beta_cutoffs += 1
+        self.cutoff_index[index if index < CUTOFF_SLOTS else CUTOFF_SLOTS - 1] += 1
+
+    @property
+    def nodes(self) -> int:
+        return self.main_nodes + self.qs_nodes
+
+    @property
+    def tt_hit_rate(self) -> float:
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    @property
+    def first_move_cutoff_rate(self) -> float:
+        #share of beta cutoffs that came from the first move tried, the usual measure of move ordering
+        return self.cutoff_index[0] / self.beta_cutoffs if self.beta_cutoffs else 0.0
+
+    @staticmethod
+    def _estimate(calls: int, sampled_calls: int, sampled_time: float) -> float:
+        return sampled_time * calls / sampled_calls if sampled_calls else 0.0
+
+    @property
+    def movegen_time(self) -> float:
+        return self._estimate(self.movegen_calls, self.movegen_sampled_calls, self.movegen_sampled_time)
+
+    @property
+    def eval_time(self) -> float:
+        return self._estimate(self.eval_calls, self.eval_sampled_calls, self.eval_sampled_time)
+
+    @property
+    def make_undo_time(self) -> float:
+        return self._estimate(self.make_undo_calls, self.make_undo_sampled_calls, self.make_undo_sampled_time)
+
+    @property
+    def branching_factors(self) -> List[float]:
+        #effective branching factor of each iteration, nodes of depth d over nodes of depth d - 1
+        out = []
+        for prev, cur in zip(self.iteration_nodes, self.iteration_nodes[1:]):
+            out.append(cur / prev if prev else 0.0)
+        return out
+
+    def snapshot(self) -> "SearchStats":
+        return copy.deepcopy(self)
+
+    def summary(self) -> str:
+        ebf = " ".join(f"{b:.2f}" for b in self.branching_factors)
+        return "\n".join([
+            f"nodes {self.nodes} (main {self.main_nodes}, quiescence {self.qs_nodes})",
+            f"tt probes {self.tt_probes} hits {self.tt_hits} ({self.tt_hit_rate * 100:.1f}%) cutoffs "
+            f"exact {self.tt_cutoffs[EXACT]} lower {self.tt_cutoffs[LOWER]} upper {self.tt_cutoffs[UPPER]}",
+            f"beta cutoffs {self.beta_cutoffs}, first move {self.first_move_cutoff_rate * 100:.1f}%, "
+            f"by index {self.cutoff_index}",
+            f"re-searches pvs {self.pvs_researches} aspiration {self.aspiration_researches} lmr {self.lmr_researches}",
+            f"pruned null move {self.null_move_cutoffs} reverse futility {self.reverse_futility_prunes} "
+            f"razoring {self.razor_prunes} delta {self.delta_prunes} see {self.see_prunes}",
+            f"draws by repetition / fifty moves {self.repetition_draws} upcoming repetitions "
+            f"{self.upcoming_repetitions} tablebase hits {self.tb_hits}",
+            f"time est. movegen {self.movegen_time:.3f}s eval {self.eval_time:.3f}s "
+            f"make/undo {self.make_undo_time:.3f}s",
+            f"branching factor per iteration {ebf}",
+        ])
@@ -0,0 +1,524 @@
+import argparse
+import itertools
+import mmap
+import os
+import struct
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from board import Board, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, WHITE, BLACK
+from pst import PIECE_VALUE
+from tables import KNIGHT_BB, KING_BB, PAWN_ATTACK_BB, BETWEEN, KNIGHT_TARGETS, KING_TARGETS, ROOK_RAYS, BISHOP_RAYS
+
+#endgame tablebases for 3 and 4 men, built offline by retrograde analysis and memory mapped when probing
+#one file per material signature (KQvK, KRvKB ...), the first side in the name is stored as white and a
+#position with the colors the other way round is probed with the board flipped
+#every position gets one byte, 0 is a draw (or an illegal position) and anything else is the distance to
+#mate in plies + 1 from the side to move's point of view, so odd distances are wins and even ones losses
+#(1 is checkmated right now)
+#the white king is moved into a corner triangle of 10 squares by the 8 board symmetries, with pawns on
+#the board only the left / right mirror is allowed and the king is kept on files a-d (32 squares)
+#en passant is not in the tables, so the engine does not probe while an en passant capture is possible
+#build with: python3 tablebase.py --dir tablebases (all 3 men tables), add --four for the 4 men ones
+
+MAGIC = b"PYTB"
+VERSION = 1
+HEADER = struct.Struct("<4sBB2x8s")
+
+THREE_MEN = ["KQvK", "KRvK", "KPvK"]
+#pawnless 4 men endings that come up in games and are hard to play by search alone
+FOUR_MEN = ["KQvKQ", "KQvKR", "KQvKB", "KQvKN", "KRvKR", "KRvKB", "KRvKN", "KBBvK", "KBNvK"]
+#no side can ever mate, these have no file and probe as a draw
+DRAWN = {"KvK", "KBvK", "KNvK"}
+
+PIECE_CHARS = {QUEEN: "Q", ROOK: "R", BISHOP: "B", KNIGHT: "N", PAWN: "P"}
+CHAR_PIECES = {c: p for p, c in PIECE_CHARS.items()}
+PIECE_ORDER = "QRBNP"
+
+MAX_PLIES = 254
+
+
+def _tf(t: int, sq: int) -> int:
+    #the 8 board symmetries, bit 0 mirrors files, bit 1 mirrors ranks, bit 2 swaps rank and file
+    r, f = sq >> 3, sq & 7
+    if t & 1:
+        f = 7 - f
+    if t & 2:
+        r = 7 - r
+    if t & 4:
+        r, f = f, r
+    return r * 8 + f
+
+
+TRANSFORMS: List[List[int]] = [[_tf(t, sq) for sq in range(64)] for t in range(8)]
+
+#white king squares kept in the tables, squares are 0 = a8 so rank 1 is row 7
+#pawnless: a1 b1 c1 d1 b2 c2 d2 c3 d3 d4, with pawns: files a-d
+_TRIANGLE = [sq for sq in range(64) if (sq & 7) <= 3 and 7 - (sq >> 3) <= (sq & 7)]
+_HALF = [sq for sq in range(64) if (sq & 7) <= 3]
+
+#symmetries that bring a white king on each square into the kept squares, two of them for the squares
+#on the a1-h8 diagonal where the index has to take the smaller of both
+_TRIANGLE_TF = [[t for t in range(8) if TRANSFORMS[t][sq] in _TRIANGLE] for sq in range(64)]
+_HALF_TF = [[0] if (sq & 7) <= 3 else [1] for sq in range(64)]
+
+ROOK_BB = [sum(1 << s for ray in ROOK_RAYS[sq] for s in ray) for sq in range(64)]
+BISHOP_BB = [sum(1 << s for ray in BISHOP_RAYS[sq] for s in ray) for sq in range(64)]
+SLIDER_RAYS = {ROOK: ROOK_RAYS, BISHOP: BISHOP_RAYS, QUEEN: [ROOK_RAYS[sq] + BISHOP_RAYS[sq] for sq in range(64)]}
+STEP_TARGETS = {KING: KING_TARGETS, KNIGHT: KNIGHT_TARGETS}
+
+
+def _side_string(pieces: List[int]) -> str:
+    return "K" + "".join(sorted((PIECE_CHARS[abs(p)] for p in pieces), key=PIECE_ORDER.index))
+
+
+def signature(kinds: List[int]) -> Tuple[str, bool]:
+    #material signature of a piece list (kings included) and whether the colors have to be swapped
+    #to match it, the side with more material is always white in a table
+    white = _side_string([k for k in kinds if k > 0 and k != KING])
+    black = _side_string([k for k in kinds if k < 0 and k != -KING])
+    value = lambda side: (sum(PIECE_VALUE[CHAR_PIECES[c]] for c in side[1:]), side)
+    if value(black) > value(white):
+        return f"{black}v{white}", True
+    return f"{white}v{black}", False
+
+
+def _attacked(target: int, sqs: List[int], kinds: List[int], color: int) -> bool:
+    #is target attacked by the pieces of color, captured pieces have square -1
+    occ = 0
+    for s in sqs:
+        if s >= 0:
+            occ |= 1 << s
+    bit = 1 << target
+    for s, k in zip(sqs, kinds):
+        if s < 0 or (k > 0) != (color > 0):
+            continue
+        p = k if k > 0 else -k
+        if p == KING:
+            if KING_BB[s] & bit:
+                return True
+        elif p == KNIGHT:
+            if KNIGHT_BB[s] & bit:
+                return True
+        elif p == PAWN:
+            if PAWN_ATTACK_BB[color][s] & bit:
+                return True
+        else:
+            if (p != BISHOP and ROOK_BB[s] & bit) or (p != ROOK and BISHOP_BB[s] & bit):
+                if not BETWEEN[s][target] & occ:
+                    return True
+    return False
+
+
+def _in_check(sqs: List[int], kinds: List[int], color: int) -> bool:
+    #kings are always the first two pieces, white then black
+    return _attacked(sqs[0] if color == WHITE else sqs[1], sqs, kinds, -color)
+
+
+class Table:
+    #one material signature, data is a bytearray while building and an mmap once loaded from disk
+    def __init__(self, sig: str, data=None):
+        self.sig = sig
+        white, black = sig.split("v")
+        self.kinds = [KING, -KING] + [CHAR_PIECES[c] for c in white[1:]] + [-CHAR_PIECES[c] for c in black[1:]]
+        self.men = len(self.kinds)
+        self.pawns = "P" in sig
+        kept = _HALF if self.pawns else _TRIANGLE
+        self.king_tf = _HALF_TF if self.pawns else _TRIANGLE_TF
+        self.king_index = [-1] * 64
+        for i, sq in enumerate(kept):
+            self.king_index[sq] = i
+        self.kept = kept
+        self.size = len(kept) * 64 ** (self.men - 1) #positions for one side to move
+        self.data = data
+        self._file = None
+
+    def index(self, sqs: List[int], stm: int) -> int:
+        #sqs in the order of self.kinds, stm WHITE or BLACK
+        best = -1
+        king_index = self.king_index
+        for t in self.king_tf[sqs[0]]:
+            tf = TRANSFORMS[t]
+            idx = king_index[tf[sqs[0]]]
+            for s in sqs[1:]:
+                idx = idx * 64 + tf[s]
+            if best < 0 or idx < best:
+                best = idx
+        return best if stm == WHITE else best + self.size
+
+    def decode(self, idx: int) -> Tuple[List[int], int]:
+        stm = WHITE
+        if idx >= self.size:
+            idx -= self.size
+            stm = BLACK
+        sqs = []
+        for _ in range(self.men - 1):
+            idx, s = divmod(idx, 64)
+            sqs.append(s)
+        sqs.append(self.kept[idx])
+        sqs.reverse()
+        return sqs, stm
+
+    @classmethod
+    def load(cls, path: str) -> "Table":
+        fh = open(path, "rb")
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, men, sig = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != VERSION:
+            mm.close()
+            fh.close()
+            raise ValueError(f"{path} is not a tablebase file")
+        table = cls(sig.rstrip(b"\0").decode())
+        if men != table.men or len(mm) != HEADER.size + 2 * table.size:
+            mm.close()
+            fh.close()
+            raise ValueError(f"{path} has the wrong size for {table.sig}")
+        table.data = memoryview(mm)[HEADER.size:]
+        table._file = (fh, mm)
+        return table
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as fh:
+            fh.write(HEADER.pack(MAGIC, VERSION, self.men, self.sig.encode()))
+            fh.write(self.data)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self.data.release()
+            fh, mm = self._file
+            mm.close()
+            fh.close()
+            self._file = None
+        self.data = None
+
+
+class Tablebases:
+    #every table found in a directory, probe returns (wdl, plies) for the side to move or None
+    def __init__(self, directory: Optional[str] = None):
+        self.tables: Dict[str, Table] = {}
+        self.max_men = 2
+        if directory:
+            for name in sorted(os.listdir(directory)):
+                if name.endswith(".tb"):
+                    self.add(Table.load(os.path.join(directory, name)))
+
+    def add(self, table: Table) -> None:
+        self.tables[table.sig] = table
+        self.max_men = max(self.max_men, table.men)
+
+    def close(self) -> None:
+        for table in self.tables.values():
+            table.close()
+        self.tables = {}
+        self.max_men = 2
+
+    def lookup(self, kinds: List[int], sqs: List[int], stm: int) -> Optional[int]:
+        #raw byte for any piece list, None when there is no table for the material
+        sig, flip = signature(kinds)
+        if sig in DRAWN:
+            return 0
+        table = self.tables.get(sig)
+        if table is None:
+            return None
+        if flip:
+            kinds = [-k for k in kinds]
+            sqs = [s ^ 56 for s in sqs]
+            stm = -stm
+        #put the pieces in the table's order, equal pieces can go in any order
+        ordered = []
+        used = [False] * len(kinds)
+        for k in table.kinds:
+            for i, kind in enumerate(kinds):
+                if not used[i] and kind == k:
+                    used[i] = True
+                    ordered.append(sqs[i])
+                    break
+        return table.data[table.index(ordered, stm)]
+
+    def probe(self, board: Board) -> Optional[Tuple[int, int]]:
+        #(1 win / 0 draw / -1 loss, plies to mate) for the side to move, None if not in the tables
+        if board.castling_rights or board.occupied.bit_count() > self.max_men:
+            return None
+        stm = board.side_to_move
+        ep = board.ep_square
+        if ep != -1 and PAWN_ATTACK_BB[-stm][ep] & board.piece_bb[PAWN] & board.color_bb[stm]:
+            return None
+        kinds = []
+        sqs = []
+        occ = board.occupied
+        squares = board.squares
+        while occ:
+            low = occ & -occ
+            sq = low.bit_length() - 1
+            kinds.append(squares[sq])
+            sqs.append(sq)
+            occ ^= low
+        value = self.lookup(kinds, sqs, stm)
+        if value is None:
+            return None
+        return decode_value(value)
+
+
+def decode_value(value: int) -> Tuple[int, int]:
+    if value == 0:
+        return 0, 0
+    plies = value - 1
+    return (1 if plies & 1 else -1), plies
+
+
+#building
+
+
+def _moves(sqs: List[int], kinds: List[int], stm: int):
+    #pseudo legal moves of stm as (piece index, to square, captured piece index or -1, promotion piece or 0)
+    #no castling and no en passant
+    occ = 0
+    for s in sqs:
+        occ |= 1 << s
+    for i, (s, k) in enumerate(zip(sqs, kinds)):
+        if (k > 0) != (stm > 0):
+            continue
+        p = k if k > 0 else -k
+        if p == PAWN:
+            step = -8 if stm == WHITE else 8
+            to = s + step
+            last = to < 8 or to >= 56
+            if not occ >> to & 1:
+                if last:
+                    for promo in (QUEEN, ROOK, BISHOP, KNIGHT):
+                        yield i, to, -1, promo
+                else:
+                    yield i, to, -1, 0
+                    start = (s >> 3) == (6 if stm == WHITE else 1)
+                    if start and not occ >> (to + step) & 1:
+                        yield i, to + step, -1, 0
+            bb = PAWN_ATTACK_BB[stm][s] & occ
+            while bb:
+                low = bb & -bb
+                to = low.bit_length() - 1
+                bb ^= low
+                j = sqs.index(to)
+                if (kinds[j] > 0) != (stm > 0):
+                    for promo in ((QUEEN, ROOK, BISHOP, KNIGHT) if last else (0,)):
+                        yield i, to, j, promo
+        elif p in STEP_TARGETS:
+            for to in STEP_TARGETS[p][s]:
+                if occ >> to & 1:
+                    j = sqs.index(to)
+                    if (kinds[j] > 0) != (stm > 0):
+                        yield i, to, j, 0
+                else:
+                    yield i, to, -1, 0
+        else:
+            for ray in SLIDER_RAYS[p][s]:
+                for to in ray:
+                    if occ >> to & 1:
+                        j = sqs.index(to)
+                        if (kinds[j] > 0) != (stm > 0):
+                            yield i, to, j, 0
+                        break
+                    yield i, to, -1, 0
+
+
+def _unmoves(sqs: List[int], kinds: List[int], mover: int):
+    #squares the pieces of mover could have come from with a quiet move, as (piece index, from square)
+    occ = 0
+    for s in sqs:
+        occ |= 1 << s
+    for i, (s, k) in enumerate(zip(sqs, kinds)):
+        if (k > 0) != (mover > 0):
+            continue
+        p = k if k > 0 else -k
+        if p == PAWN:
+            back = 8 if mover == WHITE else -8
+            frm = s + back
+            if 8 <= frm < 56 and not occ >> frm & 1:
+                yield i, frm
+                if (s >> 3) == (4 if mover == WHITE else 3) and not occ >> (frm + back) & 1:
+                    yield i, frm + back
+        elif p in STEP_TARGETS:
+            for frm in STEP_TARGETS[p][s]:
+                if not occ >> frm & 1:
+                    yield i, frm
+        else:
+            for ray in SLIDER_RAYS[p][s]:
+                for frm in ray:
+                    if occ >> frm & 1:
+                        break
+                    yield i, frm
+
+
+def _valid(table: Table, sqs: List[int], stm: int) -> bool:
+    if len(set(sqs)) != len(sqs):
+        return False
+    for s, k in zip(sqs, table.kinds):
+        if (k == PAWN or k == -PAWN) and (s < 8 or s >= 56):
+            return False
+    return not _in_check(sqs, table.kinds, -stm)
+
+
+def generate(sig: str, tablebases: Tablebases, log=None) -> Table:
+    #retrograde analysis, every table the captures and promotions lead into has to be in tablebases already
+    #first every position counts its distinct quiet successors and looks up the captures and promotions,
+    #then positions are settled one distance at a time: a loss at n makes every predecessor a win at n + 1,
+    #and a win at n takes one successor off each predecessor, a predecessor left with none is lost
+    table = Table(sig)
+    kinds = table.kinds
+    total = 2 * table.size
+    value = bytearray(total)
+    count = bytearray(total)
+    worst = bytearray(total) #longest win the opponent gets from a capture or promotion
+    buckets: List[List[int]] = [[] for _ in range(MAX_PLIES + 2)]
+    start = time.perf_counter()
+
+    for stm in (WHITE, BLACK):
+        for king in table.kept:
+            for rest in itertools.product(range(64), repeat=table.men - 1):
+                sqs = [king, *rest]
+                if not _valid(table, sqs, stm):
+                    continue
+                idx = table.index(sqs, stm)
+                if table.decode(idx)[0] != sqs:
+                    continue #the other copy of a position on the diagonal, only the smaller index is used
+                quiet = set()
+                legal = False
+                drawn = False
+                win = MAX_PLIES + 1
+                lose = 0
+                for i, to, cap, promo in _moves(sqs, kinds, stm):
+                    child = sqs[:]
+                    child[i] = to
+                    if cap >= 0:
+                        child[cap] = -1
+                    if _in_check(child, kinds, stm):
+                        continue
+                    legal = True
+                    if cap < 0 and not promo:
+                        quiet.add(table.index(child, -stm))
+                        continue
+                    child_kinds = kinds[:]
+                    if promo:
+                        child_kinds[i] = promo if stm == WHITE else -promo
+                    left = [j for j in range(len(child)) if child[j] >= 0]
+                    raw = tablebases.lookup([child_kinds[j] for j in left], [child[j] for j in left], -stm)
+                    if raw is None:
+                        raise ValueError(f"{sig} needs the table for {signature([child_kinds[j] for j in left])[0]}")
+                    wdl, plies = decode_value(raw)
+                    if wdl < 0:
+                        win = min(win, plies + 1)
+                    elif wdl > 0:
+                        lose = max(lose, plies)
+                    else:
+                        drawn = True
+                if not legal:
+                    if _in_check(sqs, kinds, stm):
+                        buckets[0].append(idx)
+                    continue
+                #a draw or win by capture or promotion means the position can never be lost, the extra
+                #count keeps it from reaching 0
+                if win <= MAX_PLIES:
+                    buckets[win].append(idx)
+                count[idx] = len(quiet) + (1 if drawn or win <= MAX_PLIES else 0)
+                worst[idx] = lose
+                if count[idx] == 0:
+                    buckets[lose + 1].append(idx)
+    if log:
+        log(f"{sig}: counted {total} positions in {time.perf_counter() - start:.1f}s")
+
+    for plies in range(MAX_PLIES + 1):
+        for idx in buckets[plies]:
+            if value[idx]:
+                continue
+            value[idx] = plies + 1
+            sqs, stm = table.decode(idx)
+            mover = -stm
+            preds = set()
+            for i, frm in _unmoves(sqs, kinds, mover):
+                prev = sqs[:]
+                prev[i] = frm
+                if not _in_check(prev, kinds, stm):
+                    preds.add(table.index(prev, mover))
+            for p in preds:
+                if value[p]:
+                    continue
+                if plies & 1 == 0:
+                    buckets[plies + 1].append(p)
+                else:
+                    count[p] -= 1
+                    if count[p] == 0:
+                        buckets[max(plies + 1, worst[p] + 1)].append(p)
+        buckets[plies] = []
+    if any(buckets[MAX_PLIES + 1:]):
+        raise ValueError(f"{sig} has mates longer than {MAX_PLIES} plies")
+
+    table.data = value
+    if log:
+        wins = sum(1 for v in value if v & 1 == 0 and v)
+        losses = sum(1 for v in value if v & 1)
+        longest = max(value) - 1
+        log(f"{sig}: {wins} wins {losses} losses, longest mate {longest} plies, "
+            f"{time.perf_counter() - start:.1f}s")
+    return table
+
+
+def dependencies(sig: str) -> List[str]:
+    #tables the captures and promotions of sig lead into
+    table = Table(sig)
+    out = []
+    for i, k in enumerate(table.kinds):
+        if abs(k) == KING:
+            continue
+        rest = table.kinds[:i] + table.kinds[i + 1:]
+        children = [rest]
+        if abs(k) == PAWN:
+            sign = 1 if k > 0 else -1
+            children += [table.kinds[:i] + [sign * p] + table.kinds[i + 1:] for p in (QUEEN, ROOK, BISHOP, KNIGHT)]
+            #pawn takes something and promotes
+            for j, other in enumerate(table.kinds):
+                if (other > 0) != (k > 0) and abs(other) != KING:
+                    promoted = [sign * p if n == i else kind for n, kind in enumerate(table.kinds)]
+                    for p in (QUEEN, ROOK, BISHOP, KNIGHT):
+                        promoted[i] = sign * p
+                        children.append([kind for n, kind in enumerate(promoted) if n != j])
+        for child in children:
+            child_sig = signature(child)[0]
+            if child_sig not in DRAWN and child_sig not in out:
+                out.append(child_sig)
+    return out
+
+
+def build(sigs: List[str], directory: str) -> None:
+    #builds every missing table in sigs and anything they depend on, smallest first
+    os.makedirs(directory, exist_ok=True)
+    tablebases = Tablebases(directory)
+    try:
+        def need(sig: str) -> None:
+            if sig in tablebases.tables or sig in DRAWN:
+                return
+            for dep in dependencies(sig):
+                need(dep)
+            table = generate(sig, tablebases, log=print)
+            path = os.path.join(directory, f"{sig}.tb")
+            table.save(path)
+            tablebases.add(Table.load(path))
+
+        for sig in sigs:
+            need(signature(Table(sig).kinds)[0])
+    finally:
+        tablebases.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="build endgame tablebases by retrograde analysis")
+    parser.add_argument("sigs", nargs="*", help="material signatures like KQvK or KRvKB, default all 3 men tables")
+    parser.add_argument("--dir", default="tablebases", help="where the .tb files go")
+    parser.add_argument("--four", action="store_true", help="also build the 4 men tables (slow)")
+    args = parser.parse_args()
+    sigs = args.sigs or THREE_MEN + (FOUR_MEN if args.four else [])
+    build(sigs, args.dir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+from typing import List, Tuple
+
+from board import WHITE, BLACK
+
+#lookup tables built once at import so move generation never has to check for board edges
+#squares run 0-63 from a8 to h1 so rank 0 is the 8th rank and file 0 is the a file
+
+def _rank_file(sq: int) -> Tuple[int, int]:
+    return sq >> 3, sq & 7
+
+def _targets(sq: int, steps) -> Tuple[int, ...]:
+    #steps are (rank, file) jumps, anything landing off the board is dropped
+    r, f = _rank_file(sq)
+    out = []
+    for dr, df in steps:
+        nr, nf = r + dr, f + df
+        if 0 <= nr < 8 and 0 <= nf < 8:
+            out.append(nr * 8 + nf)
+    return tuple(out)
+
+def _ray(sq: int, dr: int, df: int) -> Tuple[int, ...]:
+    #every square from sq (not including it) in one direction until the edge
+    r, f = _rank_file(sq)
+    out = []
+    r, f = r + dr, f + df
+    while 0 <= r < 8 and 0 <= f < 8:
+        out.append(r * 8 + f)
+        r, f = r + dr, f + df
+    return tuple(out)
+
+KNIGHT_STEPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_STEPS = ((-1, 0), (1, 0), (0, 1), (0, -1), (-1, -1), (1, -1), (1, 1), (-1, 1))
+
+#same order as movegen N S E W and NW SW SE NE
+ROOK_STEPS = ((-1, 0), (1, 0), (0, 1), (0, -1))
+BISHOP_STEPS = ((-1, -1), (1, -1), (1, 1), (-1, 1))
+
+KNIGHT_TARGETS: List[Tuple[int, ...]] = [_targets(sq, KNIGHT_STEPS) for sq in range(64)]
+KING_TARGETS: List[Tuple[int, ...]] = [_targets(sq, KING_STEPS) for sq in range(64)]
+
+#PAWN_ATTACKS[color][sq] is the squares a pawn of that color on sq attacks
+#indexed by the color itself like Board.color_bb so [-1] is black
+PAWN_ATTACKS: List[List[Tuple[int, ...]]] = [[], [], []]
+PAWN_ATTACKS[WHITE] = [_targets(sq, ((-1, -1), (-1, 1))) for sq in range(64)]
+PAWN_ATTACKS[BLACK] = [_targets(sq, ((1, -1), (1, 1))) for sq in range(64)]
+
+#rays per square, one tuple per direction that already stops at the board edge
+#empty rays are dropped so the loops in movegen never touch a direction with no squares
+ROOK_RAYS: List[Tuple[Tuple[int, ...], ...]] = [
+    tuple(ray for ray in (_ray(sq, dr, df) for dr, df in ROOK_STEPS) if ray) for sq in range(64)
+]
+BISHOP_RAYS: List[Tuple[Tuple[int, ...], ...]] = [
+    tuple(ray for ray in (_ray(sq, dr, df) for dr, df in BISHOP_STEPS) if ray) for sq in range(64)
+]
+QUEEN_RAYS: List[Tuple[Tuple[int, ...], ...]] = [BISHOP_RAYS[sq] + ROOK_RAYS[sq] for sq in range(64)]
+
+#bitboard versions of the tables above for set operations
+def _bb(squares) -> int:
+    bb = 0
+    for sq in squares:
+        bb |= 1 << sq
+    return bb
+
+KNIGHT_BB: List[int] = [_bb(t) for t in KNIGHT_TARGETS]
+KING_BB: List[int] = [_bb(t) for t in KING_TARGETS]
+PAWN_ATTACK_BB: List[List[int]] = [[], [_bb(t) for t in PAWN_ATTACKS[WHITE]], [_bb(t) for t in PAWN_ATTACKS[BLACK]]]
+
+#BETWEEN[a][b] is the squares strictly between two aligned squares, 0 if they do not share a line
+#LINE[a][b] is the whole edge to edge line through both squares, 0 if they are not aligned
+BETWEEN: List[List[int]] = [[0] * 64 for _ in range(64)]
+LINE: List[List[int]] = [[0] * 64 for _ in range(64)]
+
+def _fill_lines() -> None:
+    for a in range(64):
+        for steps in (ROOK_STEPS, BISHOP_STEPS):
+            for dr, df in steps:
+                forward = _ray(a, dr, df)
+                full = _bb(forward) | _bb(_ray(a, -dr, -df)) | (1 << a)
+                for i, b in enumerate(forward):
+                    BETWEEN[a][b] = _bb(forward[:i])
+                    LINE[a][b] = full
+
+_fill_lines()
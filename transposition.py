@@ -1,9 +1,23 @@
 from dataclasses import dataclass
-from typing import Optional, Dict
-from board import Move
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+from board import Move, decode_move
 
 EXACT, LOWER, UPPER = 0, 1, 2
 
+DEFAULT_MB = 16
+WAYS = 4 #entries per bucket
+
+#every entry is two 64-bit words in one flat buffer, the zobrist key xor the data word and then the data word
+#storing key ^ data means a half written entry from another process never matches a key, so a table
+#shared between search processes needs no locks, it just misses on a torn entry
+#data bits: 0-15 move, 16-39 score (offset so it stays positive), 40-47 depth, 48-49 flag, 50-55 generation
+ENTRY_WORDS = 2
+ENTRY_BYTES = ENTRY_WORDS * 8
+SCORE_OFFSET = 1 << 23
+SCORE_MAX = SCORE_OFFSET - 1
+GEN_MASK = 63
+
 @dataclass
 class TTEntry:
     key: int
@@ -12,23 +26,173 @@ class TTEntry:
     flag: int
     best_move: Optional[Move]
 
+def _pack(move_code: int, score: int, depth: int, flag: int, gen: int) -> int:
+    if score > SCORE_MAX:
+        score = SCORE_MAX
+    elif score < -SCORE_MAX:
+        score = -SCORE_MAX
+    return (
+        move_code
+        | ((score + SCORE_OFFSET) << 16)
+        | (min(depth, 255) << 40)
+        | (flag << 48)
+        | (gen << 50)
+    )
+
 class TranspositionTable:
     #helps avoid evaulation of the same position as you can get the same position with difrent move orders
-    #uses dictionary as hash table
+    #fixed size table in megabytes backed by a preallocated buffer so memory never grows during play
+    #positions hash into buckets of WAYS entries, a full bucket drops the shallowest / oldest entry
+    #shared=True puts the buffer in shared memory so helper processes can attach() to the same table
     #skips search if exact found
-    def __init__(self):
-        self._table: Dict[int, TTEntry] = {}
+    def __init__(self, size_mb: int = DEFAULT_MB, shared: bool = False):
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+        self.shared = shared
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._owner = True
+        self.resize(size_mb)
+
+    @classmethod
+    def attach(cls, name: str, size_mb: int) -> "TranspositionTable":
+        #opens a shared table created by another process, the creator stays responsible for freeing it
+        tt = cls.__new__(cls)
+        tt.generation = 0
+        tt.probes = 0
+        tt.hits = 0
+        tt.shared = True
+        tt._owner = False
+        tt.size_mb = size_mb
+        tt._buckets = cls._bucket_count(size_mb)
+        tt._shm = shared_memory.SharedMemory(name=name)
+        tt._data = tt._shm.buf[:tt._buckets * WAYS * ENTRY_BYTES].cast("Q")
+        tt._used = 0
+        return tt
+
+    @property
+    def name(self) -> Optional[str]:
+        return self._shm.name if self._shm is not None else None
+
+    @staticmethod
+    def _bucket_count(size_mb: int) -> int:
+        return max(1, (size_mb * 1024 * 1024) // (ENTRY_BYTES * WAYS))
+
+    def resize(self, size_mb: int) -> None:
+        #reallocates the table and drops everything in it
+        self.close()
+        self.size_mb = size_mb
+        self._buckets = self._bucket_count(size_mb)
+        nbytes = self._buckets * WAYS * ENTRY_BYTES
+        if self.shared:
+            self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self._shm.buf[:nbytes] = bytes(nbytes)
+            self._data = self._shm.buf[:nbytes].cast("Q")
+        else:
+            self._data = memoryview(bytearray(nbytes)).cast("Q")
+        self._used = 0
+
+    def close(self) -> None:
+        #releases the buffer, the process that created a shared table also unlinks it
+        data = getattr(self, "_data", None)
+        if data is not None:
+            data.release()
+            self._data = None
+        if self._shm is not None:
+            self._shm.close()
+            if self._owner:
+                self._shm.unlink()
+            self._shm = None
+
+    def clear(self) -> None:
+        self._data[:] = memoryview(bytes(len(self._data) * 8)).cast("Q")
+        self._used = 0
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+
+    def new_search(self) -> None:
+        #called once per Engine.search so entries from older searches age out first
+        self.generation = (self.generation + 1) & GEN_MASK
+
+    def capacity(self) -> int:
+        return self._buckets * WAYS
+
+    def probe(self, key: int, count: bool = True) -> Optional[Tuple[int, int, int, int]]:
+        #returns (depth, score, flag, move_code) without building an entry object
+        #count=False leaves the probes / hits counters alone, for lookups that are not part of the search
+        if count:
+            self.probes += 1
+        data = self._data
+        base = (key % self._buckets) * WAYS * ENTRY_WORDS
+        for i in range(base, base + WAYS * ENTRY_WORDS, ENTRY_WORDS):
+            word = data[i + 1]
+            if word and data[i] ^ word == key:
+                if count:
+                    self.hits += 1
+                return (
+                    (word >> 40) & 0xFF,
+                    ((word >> 16) & 0xFFFFFF) - SCORE_OFFSET,
+                    (word >> 48) & 3,
+                    word & 0xFFFF,
+                )
+        return None
 
     def get(self, key: int) -> Optional[TTEntry]:
-        return self._table.get(key)
-    
-    def store(self, key: int, depth: int, score: int, flag: int, best_move: Optional[Move]):
-        #replace only if deeper or empty
-        #deeper searchs are usualy more accurate
-        prev = self._table.get(key)
-         
-        if prev is None or depth >= prev.depth:
-            self._table[key] = TTEntry(key, depth, score, flag, best_move)
+        found = self.probe(key)
+        if found is None:
+            return None
+        depth, score, flag, move_code = found
+        return TTEntry(key, depth, score, flag, decode_move(move_code))
+
+    def store(self, key: int, depth: int, score: int, flag: int, move_code: int):
+        #move_code is the best move as a move code, 0 (NO_MOVE) when there is none
+        #same position: replace if at least nearly as deep or exact, deeper searchs are usualy more accurate
+        #new position: take an empty slot or the entry with the lowest depth once older generations are penalised
+        data = self._data
+        gen = self.generation
+        base = (key % self._buckets) * WAYS * ENTRY_WORDS
+
+        victim = -1
+        victim_value = 1 << 30
+        for i in range(base, base + WAYS * ENTRY_WORDS, ENTRY_WORDS):
+            word = data[i + 1]
+            if word == 0:
+                if victim_value > -1:
+                    victim, victim_value = i, -1
+                continue
+            if data[i] ^ word == key:
+                old_depth = (word >> 40) & 0xFF
+                if flag != EXACT and depth + 2 < old_depth and ((word >> 50) & GEN_MASK) == gen:
+                    return
+                if move_code == 0:
+                    move_code = word & 0xFFFF #keep the old best move rather than losing it
+                word = _pack(move_code, score, depth, flag, gen)
+                data[i] = key ^ word
+                data[i + 1] = word
+                return
+            age = (gen - ((word >> 50) & GEN_MASK)) & GEN_MASK
+            value = ((word >> 40) & 0xFF) - 8 * age
+            if value < victim_value:
+                victim, victim_value = i, value
+
+        if data[victim + 1] == 0:
+            self._used += 1
+        word = _pack(move_code, score, depth, flag, gen)
+        data[victim] = key ^ word
+        data[victim + 1] = word
+
+    def hashfull(self) -> int:
+        #permille of a sample of entries written during the current search, same as the uci hashfull field
+        data = self._data
+        sample = min(1000, self.capacity())
+        full = 0
+        for n in range(sample):
+            word = data[n * ENTRY_WORDS + 1]
+            if word and ((word >> 50) & GEN_MASK) == self.generation:
+                full += 1
+        return full * 1000 // sample
 
     def size(self) -> int:
-        return len(self._table)
\ No newline at end of file
+        #number of entries this process has filled
+        return self._used
@@ -0,0 +1,226 @@
+import sys
+import threading
+from typing import List, Optional, TextIO
+
+from board import Board, START_FEN, move_to_uci
+from engine import Engine, SearchInfo, MATE_SCORE, MATE_BOUND
+from movegen import generate_legal_moves
+
+#headless front end speaking the uci protocol on stdin / stdout
+#does not import pygame so it runs on servers and inside tournament managers (cutechess, arena, ...)
+#run with: python3 uci.py
+
+ENGINE_NAME = "Chess-ai"
+ENGINE_AUTHOR = "eageroden"
+
+#uci check options for the SearchOptions switches, uci name -> field
+SEARCH_OPTIONS = {
+    "NullMove": "null_move",
+    "LMR": "lmr",
+    "ReverseFutility": "reverse_futility",
+    "Razoring": "razoring",
+    "UpcomingRepetition": "upcoming_repetition",
+}
+
+
+def parse_move(board: Board, text: str) -> int:
+    #finds the legal move code matching a uci string like e2e4 or a7a8n
+    for move in generate_legal_moves(board, underpromotions=True):
+        if move_to_uci(move) == text:
+            return move
+    raise ValueError(f"illegal move {text!r}")
+
+
+def format_score(score: int) -> str:
+    #mate scores are MATE_SCORE minus the plies to mate, uci wants full moves
+    if abs(score) >= MATE_BOUND:
+        moves = (MATE_SCORE - abs(score) + 1) // 2
+        return f"mate {moves if score > 0 else -moves}"
+    return f"cp {score}"
+
+
+class UCI:
+    def __init__(self, out: TextIO = sys.stdout):
+        self.out = out
+        self.engine = Engine()
+        self.engine.on_iteration = self._print_info
+        self.board = Board.start_position()
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def send(self, line: str) -> None:
+        with self._lock:
+            self.out.write(line + "\n")
+            self.out.flush()
+
+    def loop(self, inp: TextIO = sys.stdin) -> None:
+        for line in inp:
+            if not self.handle(line):
+                break
+        self._wait()
+        self.engine.close()
+
+    def handle(self, line: str) -> bool:
+        #runs one command, returns False on quit
+        parts = line.split()
+        if not parts:
+            return True
+        cmd, args = parts[0], parts[1:]
+
+        if cmd == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send(f"option name Hash type spin default {self.engine.tt.size_mb} min 1 max 4096")
+            self.send(f"option name Threads type spin default {self.engine.threads} min 1 max 64")
+            self.send("option name BookFile type string default <empty>")
+            self.send("option name TablebasePath type string default <empty>")
+            self.send(f"option name BookWeighted type check default {'true' if self.engine.book_weighted else 'false'}")
+            for uci_name, field in SEARCH_OPTIONS.items():
+                default = "true" if getattr(self.engine.options, field) else "false"
+                self.send(f"option name {uci_name} type check default {default}")
+            self.send("uciok")
+        elif cmd == "isready":
+            self.send("readyok")
+        elif cmd == "ucinewgame":
+            self._wait()
+            self.engine.new_game()
+            self.board = Board.start_position()
+        elif cmd == "setoption":
+            self._wait()
+            self._setoption(args)
+        elif cmd == "position":
+            self._wait()
+            self._position(args)
+        elif cmd == "go":
+            self._wait()
+            self._go(args)
+        elif cmd == "stop":
+            self._stop.set()
+            self._wait()
+        elif cmd == "quit":
+            self._stop.set()
+            return False
+        elif cmd == "d":
+            #not part of uci, handy for checking what position the engine thinks it has
+            self.send(f"key {self.board.zobrist_hash:016x}")
+        return True
+
+    def _setoption(self, args: List[str]) -> None:
+        #setoption name <name> [value <value>]
+        if "name" not in args:
+            return
+        if "value" in args:
+            name = " ".join(args[args.index("name") + 1:args.index("value")])
+            value = " ".join(args[args.index("value") + 1:])
+        else:
+            name = " ".join(args[args.index("name") + 1:])
+            value = ""
+        name = name.lower()
+        switches = {uci_name.lower(): field for uci_name, field in SEARCH_OPTIONS.items()}
+        try:
+            if name == "hash":
+                self.engine.set_hash(max(1, int(value)))
+            elif name == "threads":
+                self.engine.set_threads(max(1, int(value)))
+            elif name == "bookfile":
+                self.engine.set_book(None if value in ("", "<empty>") else value)
+            elif name == "tablebasepath":
+                self.engine.set_tablebases(None if value in ("", "<empty>") else value)
+            elif name == "bookweighted":
+                if value.lower() not in ("true", "false"):
+                    raise ValueError(value)
+                self.engine.book_weighted = value.lower() == "true"
+            elif name in switches:
+                if value.lower() not in ("true", "false"):
+                    raise ValueError(value)
+                setattr(self.engine.options, switches[name], value.lower() == "true")
+            else:
+                self.send(f"info string unknown option {name}")
+        except ValueError:
+            self.send(f"info string bad value {value!r} for {name}")
+        except OSError as exc:
+            self.send(f"info string cant open {value}: {exc}")
+
+    def _position(self, args: List[str]) -> None:
+        #position startpos [moves ...] or position fen <fen> [moves ...]
+        if not args:
+            return
+        moves_at = args.index("moves") if "moves" in args else len(args)
+        try:
+            if args[0] == "startpos":
+                board = Board.from_fen(START_FEN)
+            elif args[0] == "fen":
+                board = Board.from_fen(" ".join(args[1:moves_at]))
+            else:
+                return
+            for text in args[moves_at + 1:]:
+                board.make_move(parse_move(board, text))
+        except ValueError as exc:
+            self.send(f"info string {exc}")
+            return
+        self.board = board
+
+    def _go(self, args: List[str]) -> None:
+        limits = {}
+        names = {
+            "depth": "depth", "movetime": "movetime", "nodes": "nodes",
+            "wtime": "wtime", "btime": "btime", "winc": "winc", "binc": "binc",
+            "movestogo": "movestogo",
+        }
+        infinite = False
+        i = 0
+        while i < len(args):
+            key = args[i]
+            if key == "infinite":
+                infinite = True
+            elif key in names and i + 1 < len(args):
+                try:
+                    limits[names[key]] = int(args[i + 1])
+                except ValueError:
+                    pass
+                i += 1
+            i += 1
+
+        self._stop.clear()
+        if infinite:
+            limits = {}
+        self._worker = threading.Thread(target=self._search, args=(self.board, limits), daemon=True)
+        self._worker.start()
+
+    def _search(self, board: Board, limits: dict) -> None:
+        #runs on the worker thread so stop and isready are answered while it thinks
+        #with no limits (go infinite or bare go) the stop event is the only thing that ends the search
+        move = self.engine.search(board, stop_event=self._stop, **limits)
+        if move is None:
+            self.send("bestmove 0000")
+            return
+        pv = self.engine.pv
+        if len(pv) > 1 and pv[0] == move:
+            self.send(f"bestmove {move_to_uci(move)} ponder {move_to_uci(pv[1])}")
+        else:
+            self.send(f"bestmove {move_to_uci(move)}")
+
+    def _print_info(self, info: SearchInfo) -> None:
+        nps = info.nodes * 1000 // max(1, info.time_ms)
+        pv = " ".join(move_to_uci(m) for m in info.pv)
+        self.send(
+            f"info depth {info.depth} score {format_score(info.score)} nodes {info.nodes} "
+            f"nps {nps} time {info.time_ms} hashfull {info.hashfull} pv {pv}"
+        )
+
+    def _wait(self) -> None:
+        #a search that is still running gets stopped before the position or options change
+        if self._worker is not None:
+            if self._worker.is_alive():
+                self._stop.set()
+            self._worker.join()
+            self._worker = None
+
+
+def main() -> None:
+    UCI().loop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 import pygame
 from typing import Optional, Tuple
 from movegen import generate_legal_moves, is_in_check
-from board import Move, WHITE, BLACK, EMPTY
+from board import WHITE, BLACK, EMPTY, decode_move
 
 TILE = 80
 MARGIN_TOP = 0
@@ -48,13 +48,19 @@ def mouse_to_sq(mx: int, my: int) -> Optional[int]:
 def get_game_result(board):
     moves = generate_legal_moves(board)
 
+    #"checkmate" or the reason for a draw, shown in the popup
     if moves:
+        #threefold repetition and the fifty move rule
+        if board.is_repetition(2):
+            return "repetition"
+        if board.is_fifty_moves():
+            return "fifty moves"
         return None
     
     if is_in_check(board, board.side_to_move):
         return "checkmate" 
     else:
-        return "draw" #stalemate
+        return "stalemate"
     
 def draw_popup(screen, text, width, height):
     #checkmate and draw screen popup
@@ -188,7 +194,7 @@ class ChessUI:
         self.drag_piece = piece
 
         #cache leagal moves once then filter by from-square for highlighting
-        self.legal_moves_cache = generate_legal_moves(self.board)
+        self.legal_moves_cache = [decode_move(m) for m in generate_legal_moves(self.board)]
         self.highlight_moves = [m for m in self.legal_moves_cache if m.from_sq == sq]
         before = self.board.squares.copy()
 
@@ -291,6 +297,6 @@ class ChessUI:
                 winner = "Black" if self.board.side_to_move == WHITE else "White"
                 draw_popup(self.screen, f"Checkmate! {winner} wins", WIDTH, HEIGHT)
             else:
-                draw_popup(self.screen, f"Draw (stalemate)", WIDTH, HEIGHT)
+                draw_popup(self.screen, f"Draw ({self.game_result})", WIDTH, HEIGHT)
 
         pygame.display.flip()
\ No newline at end of file